@@ -0,0 +1,316 @@
+from Project import app
+from Project.models import User, UserCounter
+from Project import queries
+from Project import permissions
+from Project import push
+from Project import views
+from Project.cache import MISSING
+from Project.conditional import make_etag
+from Project.pool import async_engine_options
+from Project.compression import compressed
+from flask_login.utils import decode_cookie
+from itsdangerous import BadSignature
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_etags
+from werkzeug.routing import Map, Rule
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qsl, quote
+import asyncio
+import json
+import os
+
+# Async variant of the hot calendar read endpoints, served by an ASGI server:
+#   uvicorn Project.asgi:application
+# Requests to any other path, or with another method, are handed to the Flask app,
+# so a single ASGI process can serve the whole site.
+# The push stream is served here on the event loop rather than on a thread of the Flask app,
+# so the pages open it unless PUSH_ENABLED=0.
+app.config['PUSH_ENABLED'] = os.environ.get('PUSH_ENABLED', '1') == '1'
+
+def async_database_url():
+    if os.environ.get('ASYNC_DATABASE_URL'):
+        return os.environ['ASYNC_DATABASE_URL']
+    return make_url(app.config['SQLALCHEMY_DATABASE_URI']).set(drivername='postgresql+asyncpg')
+
+engine = create_async_engine(async_database_url(), **async_engine_options())
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+url_map = Map([
+    Rule('/data/<int:group_id>', endpoint='return_data', methods=['GET']),
+    Rule('/data/<int:group_id>/updates', endpoint='return_update_data', methods=['GET']),
+    Rule('/get_notifications', endpoint='get_notifications', methods=['GET']),
+    Rule('/get_pending_invites_count', endpoint='get_pending_invites_count', methods=['GET']),
+    Rule('/get_unread_notifications_count', endpoint='get_unread_notifications_count', methods=['GET']),
+    Rule('/counts', endpoint='get_counts', methods=['GET']),
+    Rule('/stream', endpoint='stream', methods=['GET']),
+])
+
+class JSONResponse:
+    def __init__(self, body=None, status=200, headers=None, encoded=None):
+        if encoded is None and body is not None:
+            encoded = app.json.encode(body)
+        self.body = encoded or b''
+        self.status = status
+        self.headers = dict(headers or {})
+        if encoded is not None:
+            self.headers['Content-Type'] = 'application/json'
+
+    def compress(self, accept_encoding):
+        if self.status != 200 or 'Content-Type' not in self.headers:
+            return
+        self.headers['Vary'] = f"{self.headers['Vary']}, Accept-Encoding" if 'Vary' in self.headers else 'Accept-Encoding'
+        result = compressed(self.body, self.headers['Content-Type'], accept_encoding)
+        if result is not None:
+            self.body, self.headers['Content-Encoding'] = result
+
+    async def send(self, send):
+        self.headers['Content-Length'] = str(len(self.body))
+        await send({
+            'type': 'http.response.start',
+            'status': self.status,
+            'headers': [(name.lower().encode(), value.encode()) for name, value in self.headers.items()]
+        })
+        await send({'type': 'http.response.body', 'body': self.body})
+
+# Server-Sent Events stream of the changes pushed to a user, same messages as /stream in the Flask app
+class EventStream:
+    def __init__(self, user_id, receive):
+        self.user_id = user_id
+        self.receive = receive
+
+    def compress(self, accept_encoding):
+        pass
+
+    async def disconnected(self):
+        while (await self.receive())['type'] != 'http.disconnect':
+            pass
+
+    async def send(self, send):
+        subscription = push.broker.subscribe_async(self.user_id)
+        disconnected = asyncio.ensure_future(self.disconnected())
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream; charset=utf-8'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no')
+                ]
+            })
+            await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+            while True:
+                message = asyncio.ensure_future(subscription.get())
+                done, _ = await asyncio.wait({message, disconnected}, timeout=app.config['PUSH_KEEPALIVE'],
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    message.cancel()
+                    return
+                if message in done:
+                    chunk = f'data: {json.dumps(message.result())}\n\n'
+                else:
+                    # Keeps proxies from closing an idle connection
+                    message.cancel()
+                    chunk = ': keepalive\n\n'
+                await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+        finally:
+            disconnected.cancel()
+            push.broker.unsubscribe(self.user_id, subscription)
+
+class Request:
+    def __init__(self, scope, receive):
+        self.path = scope['path']
+        self.receive = receive
+        self.args = MultiDict(parse_qsl(scope['query_string'].decode()))
+        self.headers = {name.decode().lower(): value.decode() for name, value in scope['headers']}
+        self.cookies = SimpleCookie()
+        try:
+            self.cookies.load(self.headers.get('cookie', ''))
+        except Exception:
+            pass
+
+    # Id of the user logged in by the Flask app, read from its signed session or remember cookie
+    def user_id(self):
+        session_cookie = self.cookies.get(app.config['SESSION_COOKIE_NAME'])
+        if session_cookie is not None:
+            serializer = app.session_interface.get_signing_serializer(app)
+            try:
+                session = serializer.loads(
+                    session_cookie.value,
+                    max_age=int(app.permanent_session_lifetime.total_seconds())
+                )
+            except BadSignature:
+                session = {}
+            if '_user_id' in session:
+                return int(session['_user_id'])
+
+        remember_cookie = self.cookies.get(app.config.get('REMEMBER_COOKIE_NAME', 'remember_token'))
+        if remember_cookie is not None:
+            with app.app_context():
+                user_id = decode_cookie(remember_cookie.value)
+            if user_id is not None:
+                return int(user_id)
+        return None
+
+    # Same validation as conditional_response() in the Flask app.
+    # Returns the headers of the full response, or the 304 response when the client is up to date.
+    def conditional(self, validator, headers):
+        etag = make_etag(validator)
+        headers = dict(headers)
+        headers['ETag'] = f'W/"{etag}"'
+        headers['Cache-Control'] = 'private, no-cache'
+        headers.setdefault('Vary', 'Cookie')
+        if parse_etags(self.headers.get('if-none-match')).contains_weak(etag):
+            return None, JSONResponse(status=304, headers=headers)
+        return headers, None
+
+# Membership of the user in the group, through the membership cache of the Flask app (Project/permissions.py)
+async def membership(session, user_id, group_id):
+    memberships = permissions.membership_cache.get(user_id)
+    if memberships is MISSING:
+        memberships = permissions.memberships_from_rows(
+            (await session.execute(permissions.memberships_statement(user_id))).all()
+        )
+        permissions.membership_cache.set(user_id, memberships)
+    return memberships.get(group_id)
+
+# Run a view of Project.views on the session
+async def run_view(request, session, user, view):
+    headers = {}
+    result = None
+    while True:
+        try:
+            operation = view.send(result)
+        except StopIteration as stop:
+            body, status = stop.value
+            if isinstance(body, bytes):
+                return JSONResponse(status=status, headers=headers, encoded=body)
+            return JSONResponse(body, status, headers)
+        kind = operation[0]
+        result = None
+        if kind == 'conditional':
+            headers, not_modified = request.conditional(operation[1], operation[2])
+            if not_modified is not None:
+                view.close()
+                return not_modified
+        elif kind == 'execute':
+            result = await session.execute(operation[1])
+        elif kind == 'get':
+            result = await session.get(operation[1], operation[2])
+        elif kind == 'membership':
+            result = await membership(session, user.user_id, operation[1])
+        elif kind == 'save':
+            try:
+                session.add(operation[1])
+                await session.commit()
+                result = True
+            except Exception:
+                await session.rollback()
+                result = False
+
+async def return_data(request, session, user, group_id):
+    return await run_view(request, session, user, views.calendar_data(request.args, request.headers.get('accept'), user, group_id))
+
+async def return_update_data(request, session, user, group_id):
+    return await run_view(request, session, user, views.calendar_updates(request.args, request.headers.get('accept'), user, group_id))
+
+async def get_notifications(request, session, user):
+    try:
+        limit, before = queries.parse_feed_page(request.args)
+    except ValueError:
+        return JSONResponse({'error': 'Invalid page'}, 400)
+    notifications = (await session.execute(queries.notifications(user.user_id, limit, before))).all()
+
+    return JSONResponse({
+        'notifications': [{
+            'id': notification.id,
+            'name': notification.name,
+            'invite_time': notification.invite_time,
+            'type': notification.type
+        } for notification in notifications],
+        'next': queries.feed_cursor(notifications, limit)
+    })
+
+# Counters of the user, who has no invites before getting a counter row (see Project/counters.py)
+async def counters(session, user):
+    counter = await session.get(UserCounter, user.user_id)
+    if counter is None:
+        return 0, 0
+    return counter.pending_invites, counter.unread_notifications
+
+async def get_pending_invites_count(request, session, user):
+    pending_invites, _ = await counters(session, user)
+    return JSONResponse(pending_invites)
+
+async def get_unread_notifications_count(request, session, user):
+    _, unread_notifications = await counters(session, user)
+    return JSONResponse(unread_notifications)
+
+async def stream(request, session, user):
+    if not app.config['PUSH_ENABLED']:
+        return JSONResponse(status=204)
+    return EventStream(user.user_id, request.receive)
+
+async def get_counts(request, session, user):
+    pending_invites, unread_notifications = await counters(session, user)
+    return JSONResponse({
+        'pending_invites': pending_invites,
+        'unread_notifications': unread_notifications
+    })
+
+endpoints = {
+    'return_data': return_data,
+    'return_update_data': return_update_data,
+    'get_notifications': get_notifications,
+    'get_pending_invites_count': get_pending_invites_count,
+    'get_unread_notifications_count': get_unread_notifications_count,
+    'get_counts': get_counts,
+    'stream': stream,
+}
+
+def flask_application():
+    from uvicorn.middleware.wsgi import WSGIMiddleware
+    return WSGIMiddleware(app)
+
+fallback = None
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    global fallback
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    endpoint = None
+    if scope['type'] == 'http':
+        try:
+            endpoint, arguments = url_map.bind('localhost').match(scope['path'], method=scope['method'])
+        except HTTPException:
+            pass
+    if endpoint is None:
+        if fallback is None:
+            fallback = flask_application()
+        return await fallback(scope, receive, send)
+
+    request = Request(scope, receive)
+    user_id = request.user_id()
+    async with Session() as session:
+        user = await session.get(User, user_id) if user_id is not None else None
+        if user is None:
+            # Same answer as login_required in the Flask app
+            response = JSONResponse(status=302, headers={'Location': f"/signin?next={quote(request.path)}"})
+        else:
+            response = await endpoints[endpoint](request, session, user, **arguments)
+    response.compress(request.headers.get('accept-encoding'))
+    await response.send(send)
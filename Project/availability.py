@@ -0,0 +1,179 @@
+from Project.models import Event, Member, Participate
+from Project.queries import filter_window
+from Project import recurrence
+from sqlalchemy import select, union_all, func, and_, or_, exists
+from sqlalchemy.orm import aliased
+from datetime import timedelta
+import bisect
+import heapq
+
+# Free/busy of the accepted members of a group. A member is busy during the events they accepted
+# and the events of their individual calendar. The events of all the members are fetched in a single
+# statement sorted by start time, and merged into busy intervals by one sweep over them.
+
+# Window of a request without an end, and the longest window that can be requested
+DEFAULT_WINDOW = timedelta(days=7)
+MAX_WINDOW = timedelta(days=92)
+
+# Shortest free slot returned, without a 'duration' parameter
+DEFAULT_DURATION = timedelta(minutes=30)
+
+# Columns of the busy events, named after the event rows of Project.queries for recurrence.occurrences()
+BUSY_COLUMNS = (
+    Event.event_id,
+    Event.event_name,
+    Event.description,
+    Event.start_time.label('series_start'),
+    Event.end_time.label('series_end'),
+    Event.recurrence,
+    Event.recurrence_tz
+)
+
+def accepted_members(group_id):
+    return select(Member.user_id).where(Member.group_id == group_id, Member.status == 'Accepted')
+
+# Events keeping the accepted members of the group busy during the window, sorted by start time.
+# An event accepted by several members comes once per member.
+def busy_statement(group_id, start, end):
+    members = accepted_members(group_id)
+    accepted = filter_window(
+        select(*BUSY_COLUMNS)
+        .join(Event.participations)
+        .where(Participate.user_id.in_(members), Participate.status == 'Accepted'),
+        start, end
+    )
+    individual = filter_window(
+        select(*BUSY_COLUMNS).where(Event.creator.in_(members), Event.group_id == 1),
+        start, end
+    )
+    busy = union_all(accepted, individual).subquery()
+    return select(busy).order_by(busy.c.series_start)
+
+# Busy (start, end) intervals of the event rows, in start order, with the series expanded in the window.
+# exceptions are the EventException rows of the series among them.
+def busy_intervals(rows, exceptions, start, end):
+    by_event = {}
+    for exception in exceptions:
+        by_event.setdefault(exception.event_id, []).append(exception)
+
+    single = []
+    occurrences = []
+    expanded = set()
+    for row in rows:
+        if row.recurrence is None:
+            single.append((row.series_start, row.series_end))
+        elif row.event_id not in expanded:
+            expanded.add(row.event_id)
+            occurrences += [
+                (occurrence_start, occurrence_end)
+                for _, occurrence_start, occurrence_end, _, _
+                in recurrence.occurrences(row, by_event.get(row.event_id, ()), start, end)
+            ]
+    occurrences.sort()
+    # The rows are already sorted by the database
+    return heapq.merge(single, occurrences)
+
+# Merge overlapping and touching intervals sorted by start time, clipped to the window
+def merge_intervals(intervals, start, end):
+    merged = []
+    for interval_start, interval_end in intervals:
+        interval_start = max(interval_start, start)
+        interval_end = min(interval_end, end)
+        if interval_end <= interval_start:
+            continue
+        if merged and interval_start <= merged[-1][1]:
+            if interval_end > merged[-1][1]:
+                merged[-1][1] = interval_end
+        else:
+            merged.append([interval_start, interval_end])
+    return merged
+
+# Gaps of at least the given duration between the merged busy intervals of the window
+def free_slots(busy, start, end, duration):
+    free = []
+    cursor = start
+    for busy_start, busy_end in busy:
+        if busy_start - cursor >= duration:
+            free.append([cursor, busy_start])
+        cursor = busy_end
+    if end - cursor >= duration:
+        free.append([cursor, end])
+    return free
+
+# Conflicts of an event with the calendars of its participants, the events they accepted and their
+# individual events. The single events overlapping it are found through the GiST index of their time
+# range (ix_event_time_range), the series starting before its end are expanded to test their occurrences.
+
+# Time range of the events, the expression of ix_event_time_range
+def event_range():
+    return func.tstzrange(Event.start_time, Event.end_time)
+
+# Events of the users' calendars that can overlap the (start, end) window, in a single statement.
+# visible tells whether the viewer can see the event, the others are only sent as busy times.
+def conflicts_statement(user_ids, start, end, viewer_id, event_id=None):
+    viewer = aliased(Participate)
+    visible = or_(
+        Event.creator == viewer_id,
+        exists().where(viewer.event_id == Event.event_id, viewer.user_id == viewer_id)
+    ).label('visible')
+    windows = (
+        and_(Event.recurrence.is_(None), event_range().op('&&')(func.tstzrange(start, end))),
+        and_(
+            Event.recurrence.isnot(None),
+            Event.start_time < end,
+            or_(Event.recurrence_end.is_(None), Event.recurrence_end > start)
+        )
+    )
+    statements = []
+    for window in windows:
+        statements += [
+            select(Participate.user_id, *BUSY_COLUMNS, visible)
+            .join(Event.participations)
+            .where(Participate.user_id.in_(user_ids), Participate.status == 'Accepted', window),
+            select(Event.creator.label('user_id'), *BUSY_COLUMNS, visible)
+            .where(Event.creator.in_(user_ids), Event.group_id == 1, window)
+        ]
+    if event_id is not None:
+        # The event being edited does not conflict with itself
+        statements = [statement.where(Event.event_id != event_id) for statement in statements]
+    return union_all(*statements)
+
+# Whether any of the sorted, non overlapping intervals overlaps (start, end)
+def overlaps(intervals, starts, start, end):
+    index = bisect.bisect_left(starts, end)
+    return index > 0 and intervals[index - 1][1] > start
+
+# Conflicting events of each user, as {user_id: [(event_id, title, start, end) or (None, None, start, end)]},
+# for the event rows of conflicts_statement() and the sorted (start, end) intervals of the event.
+# A series conflicts through its first overlapping occurrence.
+def find_conflicts(rows, exceptions, intervals):
+    if not intervals:
+        return {}
+    by_event = {}
+    for exception in exceptions:
+        by_event.setdefault(exception.event_id, []).append(exception)
+    starts = [start for start, _ in intervals]
+    span_start = intervals[0][0]
+    span_end = max(end for _, end in intervals)
+
+    conflicts = {}
+    expanded = {}
+    for row in rows:
+        if row.recurrence is None:
+            candidates = [(row.series_start, row.series_end)]
+        else:
+            candidates = expanded.get(row.event_id)
+            if candidates is None:
+                candidates = expanded[row.event_id] = [
+                    (occurrence_start, occurrence_end)
+                    for _, occurrence_start, occurrence_end, _, _
+                    in recurrence.occurrences(row, by_event.get(row.event_id, ()), span_start, span_end)
+                ]
+        for start, end in candidates:
+            if overlaps(intervals, starts, start, end):
+                conflict = (row.event_id, row.event_name, start, end) if row.visible else (None, None, start, end)
+                conflicts.setdefault(row.user_id, []).append(conflict)
+                break
+    for user_conflicts in conflicts.values():
+        user_conflicts.sort(key=lambda conflict: conflict[2])
+    return conflicts
@@ -0,0 +1,92 @@
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+
+# Returned by LRUCache.get when the key is not cached
+MISSING = object()
+
+# Thread-safe LRU cache whose entries expire after ttl seconds
+class LRUCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key, default=MISSING):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+# Cache with the interface of LRUCache kept in Redis, shared by the processes of the application.
+# Values are stored as the bytes returned by dumps(value) and read back with loads(bytes), so that
+# nothing read from Redis is ever unpickled. Entries expire after ttl seconds and Redis evicts them
+# under its own memory policy. An unreachable Redis behaves as an empty cache.
+class RedisCache:
+    def __init__(self, url, ttl, prefix, dumps, loads):
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self.errors = redis.RedisError
+        self.ttl = ttl
+        self.prefix = prefix
+        self.dumps = dumps
+        self.loads = loads
+
+    def key(self, key):
+        return self.prefix + hashlib.sha1(repr(key).encode()).hexdigest()
+
+    def get(self, key, default=MISSING):
+        try:
+            value = self.redis.get(self.key(key))
+        except self.errors:
+            return default
+        return default if value is None else self.loads(value)
+
+    def set(self, key, value):
+        try:
+            self.redis.set(self.key(key), self.dumps(value), ex=self.ttl)
+        except self.errors:
+            pass
+
+    def delete(self, *keys):
+        if keys:
+            try:
+                self.redis.delete(*(self.key(key) for key in keys))
+            except self.errors:
+                pass
+
+    def clear(self):
+        try:
+            for key in self.redis.scan_iter(match=self.prefix + '*'):
+                self.redis.delete(key)
+        except self.errors:
+            pass
@@ -0,0 +1,50 @@
+from Project import app
+from flask import request
+from werkzeug.http import parse_accept_header
+from Project.instrumentation import timed
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript', 'text/javascript'}
+
+# Preferred encoding the client accepts, brotli over gzip
+def choose_encoding(accept_encoding):
+    accepted = parse_accept_header(accept_encoding)
+    for encoding in ('br', 'gzip') if brotli is not None else ('gzip',):
+        if accepted[encoding] > 0:
+            return encoding
+    return None
+
+def compress(body, encoding):
+    with timed('compress'):
+        if encoding == 'br':
+            return brotli.compress(body, quality=app.config['COMPRESS_BROTLI_QUALITY'])
+        return gzip.compress(body, compresslevel=app.config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+# Body and headers of a response compressed for the client, or None when it is better sent as is
+def compressed(body, mimetype, accept_encoding):
+    if mimetype not in COMPRESSIBLE_MIMETYPES or len(body) < app.config['COMPRESS_MIN_SIZE']:
+        return None
+    encoding = choose_encoding(accept_encoding or '')
+    if encoding is None:
+        return None
+    return compress(body, encoding), encoding
+
+@app.after_request
+def compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    # Whatever the outcome, the response depends on the Accept-Encoding of the request
+    response.vary.add('Accept-Encoding')
+    result = compressed(response.get_data(), response.mimetype, request.headers.get('Accept-Encoding'))
+    if result is None:
+        return response
+    body, encoding = result
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    return response
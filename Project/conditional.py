@@ -0,0 +1,36 @@
+from Project import app
+from flask import request, make_response
+from sqlalchemy import func, literal_column
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+import hashlib
+
+# SQL expression condensing the version columns of a set of rows into one value,
+# so that a response can be validated without loading the rows it is built from
+def version_digest(*columns, order_by):
+    return func.md5(func.string_agg(
+        func.concat_ws(':', *columns),
+        aggregate_order_by(literal_column("','"), order_by)
+    ))
+
+def make_etag(validator):
+    return hashlib.sha1(repr(validator).encode()).hexdigest()
+
+# Answer 304 Not Modified when the client already has the response identified by the validator,
+# otherwise build the response and tag it with the validator
+def conditional_response(validator, build, headers=None):
+    etag = make_etag(validator)
+
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = make_response(build())
+        if response.status_code != 200:
+            return response
+
+    # The validator is computed from the data rather than the body, so the tag is weak
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Cookie')
+    for name, value in (headers or {}).items():
+        response.headers[name] = value
+    return response
@@ -0,0 +1,53 @@
+from Project import db
+from Project.models import Member, Participate, UserCounter
+from Project.push import notify
+from sqlalchemy import select, func, union_all
+
+# Pending invites and unread notifications of the given users, counted from the invites themselves,
+# which the counters are kept equal to
+def counts_statement(user_ids):
+    invites = union_all(
+        select(Member.user_id, Member.status, Member.read_status).where(Member.user_id.in_(user_ids)),
+        select(Participate.user_id, Participate.status, Participate.read_status).where(Participate.user_id.in_(user_ids))
+    ).subquery()
+    return (
+        select(
+            invites.c.user_id,
+            func.count().filter(invites.c.status == 'Pending').label('pending_invites'),
+            func.count().filter(invites.c.read_status == 'Unread').label('unread_notifications')
+        )
+        .group_by(invites.c.user_id)
+    )
+
+# The counters are maintained by the database: triggers on member and participate (migration 0008) add
+# the pending and unread invites that each statement inserts, updates or deletes to the counters of
+# their users, in the same transaction. A user without a counter row has none.
+
+# Send the counters of the given users to their streams, once the current transaction commits
+def notify_counters(user_ids):
+    user_ids = sorted({user_id for user_id in user_ids if user_id is not None})
+    if not user_ids:
+        return
+    db.session.flush()
+
+    # The rows changed by this transaction stay locked until it commits, so they are sent in commit order
+    counters = {
+        counter.user_id: counter for counter in db.session.execute(
+            select(UserCounter.user_id, UserCounter.pending_invites, UserCounter.unread_notifications)
+            .where(UserCounter.user_id.in_(user_ids))
+        )
+    }
+    for user_id in user_ids:
+        counter = counters.get(user_id)
+        notify(user_id, {
+            'type': 'counts',
+            'pending_invites': counter.pending_invites if counter else 0,
+            'unread_notifications': counter.unread_notifications if counter else 0
+        })
+
+# Counter row of the user
+def get_counters(user_id):
+    counter = db.session.get(UserCounter, user_id)
+    if counter is None:
+        return UserCounter(user_id=user_id, pending_invites=0, unread_notifications=0)
+    return counter
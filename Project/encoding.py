@@ -0,0 +1,75 @@
+from flask.json.provider import JSONProvider, DefaultJSONProvider
+from datetime import date, datetime, timezone
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Aware datetimes are encoded in ISO 8601 with their offset, naive ones are taken as UTC
+def encode_default(obj):
+    if isinstance(obj, datetime):
+        if obj.tzinfo is None:
+            obj = obj.replace(tzinfo=timezone.utc)
+        return obj.isoformat()
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return DefaultJSONProvider.default(obj)
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+    def encode_default_orjson(obj):
+        if isinstance(obj, (set, frozenset)):
+            return list(obj)
+        return DefaultJSONProvider.default(obj)
+
+    # Encode a value to JSON bytes
+    def dumps(obj):
+        return orjson.dumps(obj, default=encode_default_orjson, option=ORJSON_OPTIONS)
+
+    loads = orjson.loads
+
+    class OrjsonProvider(JSONProvider):
+        mimetype = 'application/json'
+
+        def encode(self, obj):
+            return dumps(obj)
+
+        def dumps(self, obj, **kwargs):
+            return self.encode(obj).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(self.encode(obj), mimetype=self.mimetype)
+
+    JSONProviderBase = OrjsonProvider
+else:
+    def dumps(obj):
+        return json.dumps(obj, default=encode_default, ensure_ascii=False, separators=(',', ':')).encode()
+
+    loads = json.loads
+
+    # Flask's provider, with ISO 8601 datetimes instead of HTTP dates
+    class StdlibProvider(DefaultJSONProvider):
+        default = staticmethod(encode_default)
+
+        def encode(self, obj):
+            return super().dumps(obj).encode()
+
+        def dumps(self, obj, **kwargs):
+            if kwargs:
+                return super().dumps(obj, **kwargs)
+            return self.encode(obj).decode()
+
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(self.encode(obj), mimetype=self.mimetype)
+
+    JSONProviderBase = StdlibProvider
@@ -0,0 +1,218 @@
+from Project import app
+from flask import g, request, has_app_context
+from Project.encoding import JSONProviderBase
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from collections import Counter
+from contextlib import contextmanager
+import cProfile
+import os
+import random
+import threading
+import time
+
+# Upper bounds of the request duration histogram, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# What happened during one request, kept in flask.g
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_statement = None
+        self.statements = Counter()
+        self.timings = Counter()
+        self.profiler = None
+
+    # SELECT statements executed again and again within the request, typically from a per-row loop
+    def repeated_statements(self, threshold):
+        return [
+            (statement, count) for statement, count in self.statements.items()
+            if count >= threshold and statement.lstrip().upper().startswith('SELECT')
+        ]
+
+# Process-wide totals by endpoint, exposed in the Prometheus text format on /metrics
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.requests = Counter()
+
+    def record(self, endpoint, method, status, stats, duration, size, n_plus_one):
+        with self.lock:
+            self.requests[(endpoint, method, status)] += 1
+            totals = self.endpoints.setdefault(endpoint, {
+                'duration': 0.0,
+                'count': 0,
+                'buckets': [0] * len(DURATION_BUCKETS),
+                'sql_count': 0,
+                'sql_time': 0.0,
+                'serialize_time': 0.0,
+                'response_bytes': 0,
+                'n_plus_one': 0
+            })
+            totals['duration'] += duration
+            totals['count'] += 1
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    totals['buckets'][i] += 1
+            totals['sql_count'] += stats.sql_count
+            totals['sql_time'] += stats.sql_time
+            totals['serialize_time'] += stats.timings['serialize']
+            totals['response_bytes'] += size
+            totals['n_plus_one'] += n_plus_one
+
+    def render(self):
+        with self.lock:
+            requests = dict(self.requests)
+            endpoints = {endpoint: dict(totals, buckets=list(totals['buckets'])) for endpoint, totals in self.endpoints.items()}
+
+        lines = [
+            '# HELP calendar_requests_total Requests handled, by endpoint, method and status.',
+            '# TYPE calendar_requests_total counter'
+        ]
+        for (endpoint, method, status), count in sorted(requests.items()):
+            lines.append(f'calendar_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+
+        lines += [
+            '# HELP calendar_request_duration_seconds Time spent handling requests, by endpoint.',
+            '# TYPE calendar_request_duration_seconds histogram'
+        ]
+        for endpoint, totals in sorted(endpoints.items()):
+            for bound, count in zip(DURATION_BUCKETS, totals['buckets']):
+                lines.append(f'calendar_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}')
+            lines.append(f'calendar_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {totals["count"]}')
+            lines.append(f'calendar_request_duration_seconds_sum{{endpoint="{endpoint}"}} {totals["duration"]:.6f}')
+            lines.append(f'calendar_request_duration_seconds_count{{endpoint="{endpoint}"}} {totals["count"]}')
+
+        for name, key, kind, help_text in (
+            ('calendar_sql_statements_total', 'sql_count', 'counter', 'SQL statements executed, by endpoint.'),
+            ('calendar_sql_duration_seconds_total', 'sql_time', 'counter', 'Time spent executing SQL, by endpoint.'),
+            ('calendar_serialize_duration_seconds_total', 'serialize_time', 'counter', 'Time spent serializing responses, by endpoint.'),
+            ('calendar_response_bytes_total', 'response_bytes', 'counter', 'Size of the response bodies, by endpoint.'),
+            ('calendar_n_plus_one_total', 'n_plus_one', 'counter', 'Requests that repeated a SELECT statement, by endpoint.'),
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for endpoint, totals in sorted(endpoints.items()):
+                value = totals[key]
+                lines.append(f'{name}{{endpoint="{endpoint}"}} {value:.6f}' if isinstance(value, float) else f'{name}{{endpoint="{endpoint}"}} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+def current_stats():
+    if has_app_context():
+        return g.get('request_stats')
+    return None
+
+# Add the time spent in the block to a named timing of the current request
+@contextmanager
+def timed(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = current_stats()
+        if stats is not None:
+            stats.timings[name] += time.perf_counter() - started
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_statement(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('statement_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def end_statement(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['statement_started'].pop()
+    stats = current_stats()
+    if stats is None:
+        return
+    stats.sql_count += 1
+    stats.sql_time += elapsed
+    stats.statements[statement] += 1
+    if elapsed > stats.slowest_time:
+        stats.slowest_time = elapsed
+        stats.slowest_statement = statement
+
+@event.listens_for(Engine, 'handle_error')
+def discard_statement(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('statement_started'):
+        connection.info['statement_started'].pop()
+
+# JSON provider timing the encoding of the responses as serialization
+class InstrumentedJSONProvider(JSONProviderBase):
+    def encode(self, obj):
+        with timed('serialize'):
+            return super().encode(obj)
+
+app.json_provider_class = InstrumentedJSONProvider
+app.json = InstrumentedJSONProvider(app)
+
+@app.before_request
+def start_request():
+    stats = RequestStats()
+    g.request_stats = stats
+    threshold = app.config['PROFILE_THRESHOLD_MS']
+    if threshold and random.random() < app.config['PROFILE_SAMPLE_RATE']:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another request of this process is being profiled
+            return
+        stats.profiler = profiler
+
+@app.after_request
+def finish_request(response):
+    stats = g.pop('request_stats', None)
+    if stats is None:
+        return response
+    duration = time.perf_counter() - stats.started
+    endpoint = request.endpoint or 'unmatched'
+
+    if stats.profiler is not None:
+        stats.profiler.disable()
+        # Only the profiles of slow requests are kept
+        if duration * 1000 >= app.config['PROFILE_THRESHOLD_MS']:
+            os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+            path = os.path.join(app.config['PROFILE_DIR'], f'{endpoint}-{time.time():.0f}-{duration * 1000:.0f}ms.prof')
+            stats.profiler.dump_stats(path)
+            app.logger.info(
+                'Profiled slow request %s %s (%.0f ms, slowest statement %.0f ms: %s): %s',
+                request.method, request.path, duration * 1000, stats.slowest_time * 1000,
+                ' '.join((stats.slowest_statement or '').split())[:200], path
+            )
+
+    repeated = stats.repeated_statements(app.config['N_PLUS_ONE_THRESHOLD'])
+    for statement, count in repeated:
+        app.logger.warning(
+            'Possible N+1 query in %s: statement executed %d times in one request: %s',
+            endpoint, count, ' '.join(statement.split())[:200]
+        )
+
+    size = 0 if response.is_streamed else response.calculate_content_length() or 0
+    metrics.record(endpoint, request.method, response.status_code, stats, duration, size, 1 if repeated else 0)
+
+    if app.config['SERVER_TIMING']:
+        timings = [
+            f'db;dur={stats.sql_time * 1000:.2f};desc="{stats.sql_count} queries"',
+            f'db-slowest;dur={stats.slowest_time * 1000:.2f}',
+            f'serialize;dur={stats.timings["serialize"] * 1000:.2f}',
+            f'compress;dur={stats.timings["compress"] * 1000:.2f}',
+            f'total;dur={duration * 1000:.2f}'
+        ]
+        if repeated:
+            timings.append(f'n-plus-one;desc="{max(count for _, count in repeated)} repeats"')
+        response.headers['Server-Timing'] = ', '.join(timings)
+    return response
+
+# Stop the profiler of a request that failed before after_request
+@app.teardown_request
+def stop_profiler(exception):
+    stats = g.pop('request_stats', None)
+    if stats is not None and stats.profiler is not None:
+        stats.profiler.disable()
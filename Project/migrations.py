@@ -0,0 +1,185 @@
+from Project import db
+from sqlalchemy import text
+
+# Schema changes for databases created before the current models.
+# db.create_all() creates missing tables along with their indexes, but never alters
+# a table that already exists, so every change to an existing table is listed here.
+# Migrations run in order, once per database, and are written to be harmless on a
+# database that create_all() has just built from the current models.
+MIGRATIONS = [
+    ('0001_event_window_index', [
+        'CREATE INDEX IF NOT EXISTS ix_event_group_window ON event (group_id, start_time, end_time)',
+    ]),
+    ('0002_sync_cursors', [
+        'ALTER TABLE "user" ADD COLUMN IF NOT EXISTS sync_cursor BIGINT NOT NULL DEFAULT 0',
+        'ALTER TABLE "group" ADD COLUMN IF NOT EXISTS sync_cursor BIGINT NOT NULL DEFAULT 0',
+    ]),
+    ('0003_hot_filter_indexes', [
+        # Keep one membership of duplicated (user, group) pairs before making them unique: the accepted one
+        # with the highest permission, so that no member loses access or rights, then the oldest one
+        '''DELETE FROM member WHERE member_id IN (
+             SELECT member_id FROM (
+               SELECT member_id, row_number() OVER (
+                 PARTITION BY user_id, group_id
+                 ORDER BY CASE status WHEN 'Accepted' THEN 0 WHEN 'Pending' THEN 1 ELSE 2 END,
+                          CASE permission WHEN 'Admin' THEN 0 WHEN 'Editor' THEN 1 ELSE 2 END,
+                          member_id
+               ) AS rank
+               FROM member
+             ) ranked
+             WHERE rank > 1
+           )''',
+        '''DO $$ BEGIN
+             IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'uq_user_group') THEN
+               ALTER TABLE member ADD CONSTRAINT uq_user_group UNIQUE (user_id, group_id);
+             END IF;
+           END $$''',
+        'CREATE INDEX IF NOT EXISTS ix_member_user_status ON member (user_id, status)',
+        'CREATE INDEX IF NOT EXISTS ix_member_group_permission_status ON member (group_id, permission, status)',
+        "CREATE INDEX IF NOT EXISTS ix_member_pending ON member (user_id, invite_time) WHERE status = 'Pending'",
+        "CREATE INDEX IF NOT EXISTS ix_member_unread ON member (user_id, invite_time) WHERE read_status = 'Unread'",
+        'CREATE INDEX IF NOT EXISTS ix_participate_user_status ON participate (user_id, status)',
+        'CREATE INDEX IF NOT EXISTS ix_participate_user_read_status ON participate (user_id, read_status)',
+        'CREATE INDEX IF NOT EXISTS ix_participate_event_status ON participate (event_id, status)',
+        "CREATE INDEX IF NOT EXISTS ix_participate_pending ON participate (user_id, invite_time) WHERE status = 'Pending'",
+        "CREATE INDEX IF NOT EXISTS ix_participate_unread ON participate (user_id, invite_time) WHERE read_status = 'Unread'",
+        'CREATE INDEX IF NOT EXISTS ix_event_creator ON event (creator, group_id)',
+        'ANALYZE member',
+        'ANALYZE participate',
+        'ANALYZE event',
+    ]),
+    # The event_exception table is created by create_all()
+    ('0004_recurring_events', [
+        'ALTER TABLE event ADD COLUMN IF NOT EXISTS recurrence VARCHAR(500)',
+        'ALTER TABLE event ADD COLUMN IF NOT EXISTS recurrence_tz VARCHAR(64)',
+        'ALTER TABLE event ADD COLUMN IF NOT EXISTS recurrence_end TIMESTAMP WITH TIME ZONE',
+        'CREATE INDEX IF NOT EXISTS ix_event_series ON event (group_id, start_time) WHERE recurrence IS NOT NULL',
+    ]),
+    # tstzrange() rejects the events ending before they start, which 0007 forbids. The end of those stored
+    # earlier is moved to their start by rewriting the table: the index build would still read the old
+    # versions of the rows left by an UPDATE in the same transaction, and fail on them.
+    ('0005_event_time_range_index', [
+        '''DO $$ BEGIN
+             IF EXISTS (SELECT 1 FROM event WHERE end_time < start_time) THEN
+               ALTER TABLE event ALTER COLUMN end_time TYPE TIMESTAMP WITH TIME ZONE USING greatest(start_time, end_time);
+             END IF;
+           END $$''',
+        'CREATE INDEX IF NOT EXISTS ix_event_time_range ON event USING gist (tstzrange(start_time, end_time))',
+        'ANALYZE event',
+    ]),
+    # Deleting a group deletes its memberships and events, and deleting an event its participations
+    # and exceptions, each through the index on the foreign key
+    ('0006_cascading_deletes', [
+        '''ALTER TABLE event DROP CONSTRAINT IF EXISTS event_group_id_fkey,
+           ADD CONSTRAINT event_group_id_fkey FOREIGN KEY (group_id) REFERENCES "group" (group_id) ON DELETE CASCADE''',
+        '''ALTER TABLE member DROP CONSTRAINT IF EXISTS member_group_id_fkey,
+           ADD CONSTRAINT member_group_id_fkey FOREIGN KEY (group_id) REFERENCES "group" (group_id) ON DELETE CASCADE''',
+        '''ALTER TABLE participate DROP CONSTRAINT IF EXISTS participate_event_id_fkey,
+           ADD CONSTRAINT participate_event_id_fkey FOREIGN KEY (event_id) REFERENCES event (event_id) ON DELETE CASCADE''',
+        '''ALTER TABLE event_exception DROP CONSTRAINT IF EXISTS event_exception_event_id_fkey,
+           ADD CONSTRAINT event_exception_event_id_fkey FOREIGN KEY (event_id) REFERENCES event (event_id) ON DELETE CASCADE''',
+    ]),
+    # Events ending before they start end when they start instead, and can no longer be created
+    ('0007_event_time_order', [
+        'UPDATE event SET end_time = start_time WHERE end_time < start_time',
+        '''DO $$ BEGIN
+             IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'ck_event_end_after_start') THEN
+               ALTER TABLE event ADD CONSTRAINT ck_event_end_after_start CHECK (end_time >= start_time);
+             END IF;
+           END $$''',
+    ]),
+    # The counters of the users move with the pending and unread invites, in the statement that changes
+    # them (see Project/counters.py). The triggers lock the tables, so the counters are recounted once
+    # without missing a concurrent change.
+    ('0008_counter_triggers', [
+        '''CREATE OR REPLACE FUNCTION count_invites() RETURNS trigger AS $$
+           BEGIN
+             IF TG_OP = 'INSERT' THEN
+               INSERT INTO user_counter (user_id, pending_invites, unread_notifications)
+               SELECT user_id, count(*) FILTER (WHERE status = 'Pending'), count(*) FILTER (WHERE read_status = 'Unread')
+               FROM new_invites WHERE user_id IS NOT NULL GROUP BY user_id
+               HAVING count(*) FILTER (WHERE status = 'Pending' OR read_status = 'Unread') > 0
+               ORDER BY user_id
+               ON CONFLICT (user_id) DO UPDATE SET
+                 pending_invites = user_counter.pending_invites + EXCLUDED.pending_invites,
+                 unread_notifications = user_counter.unread_notifications + EXCLUDED.unread_notifications;
+             ELSIF TG_OP = 'DELETE' THEN
+               UPDATE user_counter SET
+                 pending_invites = user_counter.pending_invites - deleted.pending_invites,
+                 unread_notifications = user_counter.unread_notifications - deleted.unread_notifications
+               FROM (
+                 SELECT user_id, count(*) FILTER (WHERE status = 'Pending') AS pending_invites,
+                        count(*) FILTER (WHERE read_status = 'Unread') AS unread_notifications
+                 FROM old_invites GROUP BY user_id
+               ) deleted
+               WHERE user_counter.user_id = deleted.user_id
+                 AND (deleted.pending_invites > 0 OR deleted.unread_notifications > 0);
+             ELSE
+               INSERT INTO user_counter (user_id, pending_invites, unread_notifications)
+               SELECT user_id, sum(pending_invites), sum(unread_notifications) FROM (
+                 SELECT user_id, (status = 'Pending')::int AS pending_invites, (read_status = 'Unread')::int AS unread_notifications
+                 FROM new_invites
+                 UNION ALL
+                 SELECT user_id, -(status = 'Pending')::int, -(read_status = 'Unread')::int
+                 FROM old_invites
+               ) changes
+               WHERE user_id IS NOT NULL GROUP BY user_id
+               HAVING sum(pending_invites) <> 0 OR sum(unread_notifications) <> 0
+               ORDER BY user_id
+               ON CONFLICT (user_id) DO UPDATE SET
+                 pending_invites = user_counter.pending_invites + EXCLUDED.pending_invites,
+                 unread_notifications = user_counter.unread_notifications + EXCLUDED.unread_notifications;
+             END IF;
+             RETURN NULL;
+           END $$ LANGUAGE plpgsql''',
+        'DROP TRIGGER IF EXISTS member_insert_counters ON member',
+        'DROP TRIGGER IF EXISTS member_update_counters ON member',
+        'DROP TRIGGER IF EXISTS member_delete_counters ON member',
+        '''CREATE TRIGGER member_insert_counters AFTER INSERT ON member
+           REFERENCING NEW TABLE AS new_invites FOR EACH STATEMENT EXECUTE FUNCTION count_invites()''',
+        '''CREATE TRIGGER member_update_counters AFTER UPDATE ON member
+           REFERENCING OLD TABLE AS old_invites NEW TABLE AS new_invites FOR EACH STATEMENT EXECUTE FUNCTION count_invites()''',
+        '''CREATE TRIGGER member_delete_counters AFTER DELETE ON member
+           REFERENCING OLD TABLE AS old_invites FOR EACH STATEMENT EXECUTE FUNCTION count_invites()''',
+        'DROP TRIGGER IF EXISTS participate_insert_counters ON participate',
+        'DROP TRIGGER IF EXISTS participate_update_counters ON participate',
+        'DROP TRIGGER IF EXISTS participate_delete_counters ON participate',
+        '''CREATE TRIGGER participate_insert_counters AFTER INSERT ON participate
+           REFERENCING NEW TABLE AS new_invites FOR EACH STATEMENT EXECUTE FUNCTION count_invites()''',
+        '''CREATE TRIGGER participate_update_counters AFTER UPDATE ON participate
+           REFERENCING OLD TABLE AS old_invites NEW TABLE AS new_invites FOR EACH STATEMENT EXECUTE FUNCTION count_invites()''',
+        '''CREATE TRIGGER participate_delete_counters AFTER DELETE ON participate
+           REFERENCING OLD TABLE AS old_invites FOR EACH STATEMENT EXECUTE FUNCTION count_invites()''',
+        'DELETE FROM user_counter',
+        '''INSERT INTO user_counter (user_id, pending_invites, unread_notifications)
+           SELECT user_id, count(*) FILTER (WHERE status = 'Pending'), count(*) FILTER (WHERE read_status = 'Unread')
+           FROM (
+             SELECT user_id, status, read_status FROM member
+             UNION ALL
+             SELECT user_id, status, read_status FROM participate
+           ) invites
+           WHERE user_id IS NOT NULL GROUP BY user_id''',
+    ]),
+]
+
+# Apply the migrations that have not been applied to the database yet
+def run_migrations():
+    applied_now = []
+    with db.engine.begin() as connection:
+        # Only one process migrates at a time
+        connection.execute(text("SELECT pg_advisory_xact_lock(hashtext('schema_migration'))"))
+        connection.execute(text(
+            'CREATE TABLE IF NOT EXISTS schema_migration ('
+            'name VARCHAR(200) PRIMARY KEY, '
+            'applied_time TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now())'
+        ))
+        applied = {name for (name,) in connection.execute(text('SELECT name FROM schema_migration'))}
+
+        for name, statements in MIGRATIONS:
+            if name in applied:
+                continue
+            for statement in statements:
+                connection.execute(text(statement))
+            connection.execute(text('INSERT INTO schema_migration (name) VALUES (:name)'), {'name': name})
+            applied_now.append(name)
+    return applied_now
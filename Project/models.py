@@ -10,15 +10,14 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'signin'
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
+# The user loader is registered by Project.permissions
 
 class User(db.Model, UserMixin):
     user_id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     email = db.Column(db.String(500), nullable=False, unique=True)
     password = db.Column(db.String(1000), nullable=False)
+    sync_cursor = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
     
     participations = db.relationship('Participate', backref='user', lazy=True)
     memberships = db.relationship('Member', backref='user', lazy=True)
@@ -36,22 +35,57 @@ class Event(db.Model):
     version_number = db.Column(db.Integer, nullable=False, default=1)
     cache_number = db.Column(db.Integer, nullable=False)
     creator = db.Column(db.Integer, db.ForeignKey('user.user_id'))
-    group_id = db.Column(db.Integer, db.ForeignKey('group.group_id'))
+    group_id = db.Column(db.Integer, db.ForeignKey('group.group_id', ondelete='CASCADE'))
+    # A recurring event is stored once per series: start_time and end_time are the times the rule
+    # starts from (see Project/recurrence.py), evaluated on the wall clock of recurrence_tz, and
+    # recurrence_end is the end of the last occurrence, NULL when the series never ends
+    recurrence = db.Column(db.String(500))
+    recurrence_tz = db.Column(db.String(64))
+    recurrence_end = db.Column(db.DateTime(timezone=True))
     
-    participations = db.relationship('Participate', backref='event', lazy=True)
+    # The participations are deleted with the event by the database (ON DELETE CASCADE)
+    participations = db.relationship('Participate', backref='event', lazy=True, cascade='all, delete', passive_deletes=True)
+
+    __table_args__ = (
+        db.Index('ix_event_group_window', 'group_id', 'start_time', 'end_time'),
+        db.Index('ix_event_creator', 'creator', 'group_id'),
+        db.Index('ix_event_series', 'group_id', 'start_time', postgresql_where=db.text('recurrence IS NOT NULL')),
+        db.CheckConstraint('end_time >= start_time', name='ck_event_end_after_start'),
+    )
 
     __mapper_args__ = {
         'version_id_col': version_number
     }
 
+# Time range of the events, to find the events overlapping a window (see Project/availability.py)
+db.Index('ix_event_time_range', db.func.tstzrange(Event.start_time, Event.end_time), postgresql_using='gist')
+
+# Cancelled and overridden occurrences of a recurring event, by the start they have by the rule.
+# The fields that are set replace those of the series for that occurrence.
+class EventException(db.Model):
+    exception_id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('event.event_id', ondelete='CASCADE'), nullable=False)
+    original_start = db.Column(db.DateTime(timezone=True), nullable=False)
+    cancelled = db.Column(db.Boolean, nullable=False, default=False)
+    start_time = db.Column(db.DateTime(timezone=True))
+    end_time = db.Column(db.DateTime(timezone=True))
+    event_name = db.Column(db.String(200))
+    description = db.Column(db.String(1000))
+
+    __table_args__ = (
+        db.UniqueConstraint('event_id', 'original_start', name='uq_event_occurrence'),
+    )
+
 class Group(db.Model):
     group_id = db.Column(db.Integer, primary_key=True)
     group_name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.String(1000))
     version_number = db.Column(db.Integer, nullable=False, default=1)
+    sync_cursor = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
     
-    members = db.relationship('Member', backref='group', lazy=True)
-    events = db.relationship('Event', backref='host_group', lazy=True)
+    # The memberships and events are deleted with the group by the database (ON DELETE CASCADE)
+    members = db.relationship('Member', backref='group', lazy=True, cascade='all, delete', passive_deletes=True)
+    events = db.relationship('Event', backref='host_group', lazy=True, cascade='all, delete', passive_deletes=True)
 
     __mapper_args__ = {
         'version_id_col': version_number
@@ -60,7 +94,7 @@ class Group(db.Model):
 class Participate(db.Model):
     participate_id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'))
-    event_id = db.Column(db.Integer, db.ForeignKey('event.event_id'))
+    event_id = db.Column(db.Integer, db.ForeignKey('event.event_id', ondelete='CASCADE'))
     invite_time = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
     read_status = db.Column(db.String(50), default='Unread', nullable=False)
     status = db.Column(db.String(50), default='Pending', nullable=False)
@@ -69,19 +103,55 @@ class Participate(db.Model):
         db.UniqueConstraint('user_id', 'event_id', name='uq_user_event'),
         db.CheckConstraint("status IN ('Accepted', 'Declined', 'Pending')"),
         db.CheckConstraint("read_status IN ('Read', 'Unread')"),
+        db.Index('ix_participate_user_status', 'user_id', 'status'),
+        db.Index('ix_participate_user_read_status', 'user_id', 'read_status'),
+        db.Index('ix_participate_event_status', 'event_id', 'status'),
+        db.Index('ix_participate_pending', 'user_id', 'invite_time', postgresql_where=db.text("status = 'Pending'")),
+        db.Index('ix_participate_unread', 'user_id', 'invite_time', postgresql_where=db.text("read_status = 'Unread'")),
     )
 
 class Member(db.Model):
     member_id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'))
-    group_id = db.Column(db.Integer, db.ForeignKey('group.group_id'))
+    group_id = db.Column(db.Integer, db.ForeignKey('group.group_id', ondelete='CASCADE'))
     invite_time = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
     read_status = db.Column(db.String(50), default='Unread', nullable=False)
     permission = db.Column(db.String(50), nullable=False)
     status = db.Column(db.String(50), default='Pending', nullable=False)
     
     __table_args__ = (
+        db.UniqueConstraint('user_id', 'group_id', name='uq_user_group'),
         db.CheckConstraint("permission IN ('Admin', 'Editor', 'Viewer')"),
         db.CheckConstraint("read_status IN ('Read', 'Unread')"),
         db.CheckConstraint("status IN ('Accepted', 'Declined', 'Pending')"),
-    )
\ No newline at end of file
+        db.Index('ix_member_user_status', 'user_id', 'status'),
+        db.Index('ix_member_group_permission_status', 'group_id', 'permission', 'status'),
+        db.Index('ix_member_pending', 'user_id', 'invite_time', postgresql_where=db.text("status = 'Pending'")),
+        db.Index('ix_member_unread', 'user_id', 'invite_time', postgresql_where=db.text("read_status = 'Unread'")),
+    )
+
+# Append-only log of event changes, read by clients syncing their cached calendars.
+# A row belongs either to the feed of a group (group_id) or to the individual
+# calendar feed of a user (user_id); cursor is the value of that feed's sync_cursor.
+# No foreign keys, so that entries outlive the events and groups they describe.
+class EventChange(db.Model):
+    change_id = db.Column(db.BigInteger, primary_key=True)
+    group_id = db.Column(db.Integer)
+    user_id = db.Column(db.Integer)
+    cursor = db.Column(db.BigInteger, nullable=False)
+    event_id = db.Column(db.Integer, nullable=False)
+    operation = db.Column(db.String(50), nullable=False)
+    change_time = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_event_change_group_cursor', 'group_id', 'cursor'),
+        db.Index('ix_event_change_user_cursor', 'user_id', 'cursor'),
+        db.CheckConstraint("operation IN ('Updated', 'Deleted')"),
+    )
+
+# Pending invites and unread notifications of a user, kept up to date by triggers
+# on the member and participate tables (see Project/counters.py)
+class UserCounter(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), primary_key=True)
+    pending_invites = db.Column(db.Integer, nullable=False, default=0)
+    unread_notifications = db.Column(db.Integer, nullable=False, default=0)
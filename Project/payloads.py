@@ -0,0 +1,28 @@
+from Project import app
+from Project.cache import LRUCache, RedisCache
+from Project.serializers import dump_shared, load_shared
+
+# Serialized events of group calendars, shared by the members of the group.
+# The events of a group calendar only differ between its members by is_pending_for_current_user
+# and event_edit_permission, so the payload is cached without them (Project.serializers.share_events)
+# and completed for each member at response time.
+#
+# Entries are keyed by the group's sync cursor and the version digest of its events: the mutation
+# routes advance the cursor through Project.sync.record_event_changes, every change to an event
+# or its participants increments its cache_number, and the digest covers the names and emails of
+# the participants (a profile change does not touch their events), so a changed calendar is never
+# served from an older entry. Those are left to expire.
+
+def create_payload_cache():
+    if app.config['PAYLOAD_CACHE_URL']:
+        return RedisCache(
+            app.config['PAYLOAD_CACHE_URL'], app.config['PAYLOAD_CACHE_TTL'], 'calendar:payload:',
+            dump_shared, load_shared
+        )
+    return LRUCache(app.config['PAYLOAD_CACHE_SIZE'], app.config['PAYLOAD_CACHE_TTL'])
+
+# Module level so that tests can swap in an LRUCache as a stand-in for Redis
+payload_cache = create_payload_cache()
+
+def group_payload_key(group_id, cursor, digest, start, end, tz, compact):
+    return ('group_events', group_id, cursor, digest, start, end, tz, compact)
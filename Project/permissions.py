@@ -0,0 +1,77 @@
+from Project import app, db
+from Project.cache import LRUCache, MISSING
+from Project.models import User, Member, login_manager
+from flask import g
+from flask_login import current_user
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from collections import namedtuple
+
+# Memberships of the current user, as {group_id: Membership}, loaded once per request along with the
+# user by load_user() and kept in flask.g, so that the permission checks of a request do not query.
+#
+# Between requests the memberships of a user are cached for PERMISSION_CACHE_TTL seconds. Membership
+# changes drop the entries of their users once committed, but entries of other processes are only
+# dropped by the TTL, so it is kept short. The routes changing events check the memberships read in
+# their request (fresh=True), so that they never act on a revoked permission.
+
+Membership = namedtuple('Membership', ['permission', 'status'])
+
+membership_cache = LRUCache(app.config['PERMISSION_CACHE_SIZE'], app.config['PERMISSION_CACHE_TTL'])
+
+def memberships_statement(user_id):
+    return select(Member.group_id, Member.permission, Member.status).where(Member.user_id == user_id)
+
+# Memberships of the rows of memberships_statement(), as {group_id: Membership}
+def memberships_from_rows(rows):
+    return {group_id: Membership(permission, status) for group_id, permission, status in rows}
+
+def remember(user_id, memberships, fresh):
+    if fresh:
+        membership_cache.set(user_id, memberships)
+    g.memberships = memberships
+    g.memberships_fresh = fresh
+
+@login_manager.user_loader
+def load_user(user_id):
+    user_id = int(user_id)
+    memberships = membership_cache.get(user_id)
+    if memberships is not MISSING:
+        remember(user_id, memberships, fresh=False)
+        return db.session.get(User, user_id)
+
+    # The user and their memberships in one round trip
+    rows = db.session.execute(
+        select(User, Member.group_id, Member.permission, Member.status)
+        .outerjoin(Member, Member.user_id == User.user_id)
+        .where(User.user_id == user_id)
+    ).all()
+    if not rows:
+        return None
+    remember(user_id, {
+        row.group_id: Membership(row.permission, row.status)
+        for row in rows if row.group_id is not None
+    }, fresh=True)
+    return rows[0].User
+
+# Memberships of the current user, read from the database in this request when fresh
+def user_memberships(fresh=False):
+    if g.get('memberships') is None or (fresh and not g.memberships_fresh):
+        user_id = current_user.user_id
+        remember(user_id, memberships_from_rows(db.session.execute(memberships_statement(user_id))), fresh=True)
+    return g.memberships
+
+# Membership of the current user in the group, or None
+def membership(group_id, fresh=False):
+    return user_memberships(fresh).get(group_id)
+
+# Forget the memberships of users whose memberships are changed by the current transaction
+def invalidate_memberships(user_ids):
+    g.pop('memberships', None)
+    db.session.info.setdefault('membership_changes', set()).update(user_ids)
+
+# Memberships reloaded before the end of the transaction are dropped too, whether it commits or not
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def drop_memberships(session):
+    membership_cache.delete(*session.info.pop('membership_changes', ()))
@@ -0,0 +1,69 @@
+from sqlalchemy import text
+from sqlalchemy.pool import NullPool
+import os
+
+def env_flag(environ, name, default):
+    return environ.get(name, '1' if default else '0').lower() in ('1', 'true', 'yes')
+
+# Engine options for Flask-SQLAlchemy, read from the environment.
+# DB_POOL=null opens a connection per checkout and closes it on release, for serverless
+# instances that sit behind an external pooler such as PgBouncer. It is the default on Vercel,
+# where every cold instance would otherwise keep its own idle connections open.
+def engine_options(environ=os.environ):
+    mode = environ.get('DB_POOL', 'null' if environ.get('VERCEL') else 'queue')
+    options = {
+        'pool_pre_ping': env_flag(environ, 'DB_POOL_PRE_PING', True),
+        'connect_args': {
+            'connect_timeout': int(environ.get('DB_CONNECT_TIMEOUT', 10)),
+            'application_name': environ.get('DB_APPLICATION_NAME', 'calendar')
+        }
+    }
+    if mode == 'null':
+        options['poolclass'] = NullPool
+    elif mode == 'queue':
+        # Workers x (pool size + overflow) must stay below the max_connections of the server
+        options['pool_size'] = int(environ.get('DB_POOL_SIZE', 5))
+        options['max_overflow'] = int(environ.get('DB_MAX_OVERFLOW', 10))
+        options['pool_timeout'] = float(environ.get('DB_POOL_TIMEOUT', 30))
+        options['pool_recycle'] = int(environ.get('DB_POOL_RECYCLE', 1800))
+    else:
+        raise ValueError(f"DB_POOL must be 'queue' or 'null', not {mode!r}")
+    return options
+
+# Open one connection at startup, so that a bad configuration shows up before the first request
+# and the first request does not pay for the connection
+def warm_up(engine):
+    with engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+    # Connections must not be shared with processes forked afterwards, such as preloaded gunicorn workers
+    os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
+# Gauges of the connection pool, in the Prometheus text format
+def pool_metrics(engine):
+    pool = engine.pool
+    gauges = [('calendar_db_pool_info', 1, f'{{pool="{type(pool).__name__}"}}')]
+    if hasattr(pool, 'checkedout'):
+        gauges += [
+            ('calendar_db_pool_size', pool.size(), ''),
+            ('calendar_db_pool_checked_in', pool.checkedin(), ''),
+            ('calendar_db_pool_checked_out', pool.checkedout(), ''),
+            ('calendar_db_pool_overflow', pool.overflow(), '')
+        ]
+    lines = []
+    for name, value, labels in gauges:
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name}{labels} {value}')
+    return '\n'.join(lines) + '\n'
+
+# The same options for the asyncio engine of the async read API, with the arguments of asyncpg
+def async_engine_options(environ=os.environ):
+    options = engine_options(environ)
+    connect_args = options.pop('connect_args')
+    options['connect_args'] = {
+        'timeout': connect_args['connect_timeout'],
+        'server_settings': {'application_name': connect_args['application_name']}
+    }
+    if options.get('poolclass') is NullPool:
+        # Prepared statements do not survive the connection switches of a transaction-mode pooler
+        options['connect_args']['statement_cache_size'] = 0
+    return options
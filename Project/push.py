@@ -0,0 +1,144 @@
+from Project import app, db
+from Project.models import Member
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+import asyncio
+import json
+import queue
+import threading
+import time
+
+# Fans messages out to the streams of the users connected to this process
+class LocalBroker:
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.subscribers = {}
+
+    def subscribe(self, user_id):
+        return self.add(user_id, queue.Queue(maxsize=self.queue_size))
+
+    # Subscription of a stream served on the running event loop
+    def subscribe_async(self, user_id):
+        return self.add(user_id, AsyncSubscription(asyncio.get_running_loop(), self.queue_size))
+
+    def add(self, user_id, subscription):
+        with self.lock:
+            self.subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self.lock:
+            subscriptions = self.subscribers.get(user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.subscribers[user_id]
+
+    def publish(self, user_id, message):
+        with self.lock:
+            subscriptions = list(self.subscribers.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.put_nowait(message)
+            except queue.Full:
+                # A stalled client catches up through /updates on its next fetch
+                pass
+
+# Queue of an asyncio stream, fed from the threads that commit the changes
+class AsyncSubscription:
+    def __init__(self, loop, queue_size):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+    def put_nowait(self, message):
+        self.loop.call_soon_threadsafe(self.deliver, message)
+
+    def deliver(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass
+
+    async def get(self):
+        return await self.queue.get()
+
+# Seconds to wait before reconnecting to Redis after the subscription was lost
+RECONNECT_DELAY = 1
+
+# Relays messages through Redis pub/sub so that users connected to other processes receive them too
+class RedisBroker:
+    def __init__(self, url, local):
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self.errors = redis.RedisError
+        self.local = local
+        threading.Thread(target=self.listen, daemon=True).start()
+
+    def subscribe(self, user_id):
+        return self.local.subscribe(user_id)
+
+    def subscribe_async(self, user_id):
+        return self.local.subscribe_async(user_id)
+
+    def unsubscribe(self, user_id, subscription):
+        self.local.unsubscribe(user_id, subscription)
+
+    def publish(self, user_id, message):
+        self.redis.publish(f'calendar:user:{user_id}', json.dumps(message))
+
+    # Relay the messages of the other processes, resubscribing whenever the connection is lost.
+    # Messages published meanwhile are missed, the clients catch up through /updates.
+    def listen(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe('calendar:user:*')
+                for item in pubsub.listen():
+                    try:
+                        user_id = int(item['channel'].decode().rsplit(':', 1)[1])
+                        message = json.loads(item['data'])
+                    except ValueError:
+                        app.logger.warning('Ignoring a malformed push message on %s', item['channel'])
+                        continue
+                    self.local.publish(user_id, message)
+            except self.errors:
+                app.logger.warning('Lost the push broker subscription, reconnecting', exc_info=True)
+                time.sleep(RECONNECT_DELAY)
+
+def create_broker():
+    local = LocalBroker()
+    if app.config['PUSH_BROKER_URL']:
+        return RedisBroker(app.config['PUSH_BROKER_URL'], local)
+    return local
+
+# Module level so that tests can swap in a LocalBroker as a stand-in for Redis
+broker = create_broker()
+
+# Queue a message for the user, it is published once the current transaction commits
+def notify(user_id, message):
+    db.session.info.setdefault('push_messages', []).append((user_id, message))
+
+# Queue messages for each accepted member of the group
+def notify_group(group_id, messages):
+    members = db.session.execute(
+        select(Member.user_id).where(Member.group_id == group_id, Member.status == 'Accepted')
+    ).scalars()
+    for user_id in members:
+        for message in messages:
+            notify(user_id, message)
+
+# The transaction is already committed, so a broker failure is only logged:
+# the clients that miss the messages catch up through /updates
+@event.listens_for(Session, 'after_commit')
+def publish_messages(session):
+    messages = session.info.pop('push_messages', ())
+    try:
+        for user_id, message in messages:
+            broker.publish(user_id, message)
+    except Exception:
+        app.logger.exception('Unable to publish %d push messages', len(messages))
+
+@event.listens_for(Session, 'after_rollback')
+def discard_messages(session):
+    session.info.pop('push_messages', None)
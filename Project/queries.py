@@ -0,0 +1,221 @@
+from Project.models import User, Event, Group, Member, Participate, EventChange
+from sqlalchemy import select, union_all, func, case, and_, or_, true, null, literal, String, DateTime
+from datetime import datetime, timezone, timedelta
+from zoneinfo import ZoneInfo
+
+# Statements of the calendar read endpoints, shared by the Flask views and the async read API
+
+# Parse the optional 'start' and 'end' query parameters of the visible calendar window
+def parse_window(args):
+    window = []
+    for name in ('start', 'end'):
+        value = args.get(name)
+        if value:
+            value = datetime.fromisoformat(value)
+            if value.tzinfo is None:
+                # Treat naive timestamps as UTC
+                value = value.replace(tzinfo=timezone.utc)
+        else:
+            value = None
+        window.append(value)
+    return window
+
+# Parse the optional 'tz' query parameter, the IANA timezone the event times are sent in.
+# Without it they are sent in the timezone of the database session.
+def parse_timezone(args):
+    name = args.get('tz')
+    if not name:
+        return None
+    try:
+        ZoneInfo(name)
+    except (KeyError, ValueError):
+        raise ValueError(f'Unknown timezone {name}')
+    return name
+
+# Convert the timestamps of the rest of the transaction to the given timezone
+def use_timezone(tz):
+    return select(func.set_config('TimeZone', tz, True))
+
+# ISO 8601 text of a timestamptz column, with its UTC offset, in the timezone set by use_timezone().
+# The rows come back as ready to send strings, the fraction of a second only when there is one.
+def local_iso(column):
+    return func.to_char(column, case(
+        (func.date_trunc('second', column) == column, 'YYYY-MM-DD"T"HH24:MI:SSTZH:TZM'),
+        else_='YYYY-MM-DD"T"HH24:MI:SS.USTZH:TZM'
+    ), type_=String)
+
+# Columns of the events sent to the calendar
+EVENT_COLUMNS = (
+    Event.event_id,
+    Event.event_name,
+    Event.description,
+    local_iso(Event.start_time).label('start'),
+    local_iso(Event.end_time).label('end'),
+    Event.version_number,
+    Event.cache_number,
+    Event.recurrence,
+    # Only the series are expanded from their times
+    Event.recurrence_tz,
+    case((Event.recurrence.isnot(None), Event.start_time)).label('series_start'),
+    case((Event.recurrence.isnot(None), Event.end_time)).label('series_end')
+)
+
+# Restrict an event query to the events overlapping the window
+def filter_window(query, start, end):
+    if start is not None:
+        # A series lasts until the end of its last occurrence
+        query = query.filter(or_(
+            Event.end_time > start,
+            and_(
+                Event.recurrence.isnot(None),
+                or_(Event.recurrence_end.is_(None), Event.recurrence_end > start)
+            )
+        ))
+    if end is not None:
+        query = query.filter(Event.start_time < end)
+    return query
+
+# Events created by the user in their individual calendar
+def individual_events(user_id, start=None, end=None):
+    return filter_window(
+        select(*EVENT_COLUMNS).where(Event.creator == user_id, Event.group_id == 1),
+        start, end
+    )
+
+# Group events in which the user participates
+def participating_events(user_id, start=None, end=None):
+    return filter_window(
+        select(*EVENT_COLUMNS)
+        .join(Event.participations)
+        .where(
+            Participate.user_id == user_id,
+            Participate.status != 'Declined'
+        ),
+        start, end
+    )
+
+def group_events(group_id, start=None, end=None):
+    return filter_window(select(*EVENT_COLUMNS).where(Event.group_id == group_id), start, end)
+
+# Id and cache_number of the events of the statements, to compute the version digest of a response
+def event_versions(*statements):
+    versions = [statement.with_only_columns(Event.event_id, Event.cache_number) for statement in statements]
+    if len(versions) == 1:
+        return versions[0].subquery()
+    return union_all(*versions).subquery()
+
+# Participants of the versioned events with the user data encoded along with them, which changes
+# without their cache_number (a renamed user)
+def participant_versions(versions):
+    return (
+        select(Participate.participate_id, Participate.user_id, Participate.status, User.name, User.email)
+        .join(User, User.user_id == Participate.user_id)
+        .where(Participate.event_id.in_(select(versions.c.event_id)))
+        .subquery()
+    )
+
+# Ids of the events changed in a feed after the given cursor
+def changed_events(since, group_id=None, user_id=None):
+    query = select(EventChange.event_id).distinct().where(EventChange.cursor > since)
+    if group_id is not None:
+        return query.where(EventChange.group_id == group_id)
+    return query.where(EventChange.user_id == user_id)
+
+# Keyset pagination of the notification and invite feeds, newest first. A page ends at the
+# (invite_time, type, id) key of its last row, which the client sends back as the 'before' cursor
+# of the next page, so every page is an index range scan however deep it is.
+
+FEED_PAGE_SIZE = 20
+MAX_FEED_PAGE_SIZE = 100
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Parse the optional 'limit' and 'before' query parameters of a feed, raises ValueError when invalid
+def parse_feed_page(args):
+    limit = args.get('limit', FEED_PAGE_SIZE, type=int)
+    if not 1 <= limit <= MAX_FEED_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {MAX_FEED_PAGE_SIZE}')
+    before = args.get('before')
+    if not before:
+        return limit, None
+    micros, kind, row_id = before.split('-')
+    if kind not in ('event', 'group'):
+        raise ValueError(f'Invalid cursor {before}')
+    return limit, (EPOCH + timedelta(microseconds=int(micros)), kind, int(row_id))
+
+# Cursor of the page following the given rows, None after the last page
+def feed_cursor(rows, limit):
+    if len(rows) < limit:
+        return None
+    last = rows[-1]
+    return f'{(last.invite_time - EPOCH) // timedelta(microseconds=1)}-{last.type}-{last.id}'
+
+# Rows of one type of the feed coming after the cursor
+def after_cursor(time_column, id_column, kind, before):
+    if before is None:
+        return true()
+    invite_time, before_kind, before_id = before
+    if kind == before_kind:
+        return or_(time_column < invite_time, and_(time_column == invite_time, id_column < before_id))
+    if kind < before_kind:
+        return time_column <= invite_time
+    return time_column < invite_time
+
+# One page of the feed made of the given statements. Each one is limited on its own index
+# before the UNION ALL, and the page is merged by the database.
+def feed_page(statements, limit):
+    feed = union_all(*[statement.limit(limit) for statement in statements]).subquery()
+    return select(feed).order_by(feed.c.invite_time.desc(), feed.c.type.desc(), feed.c.id.desc()).limit(limit)
+
+# Unread group and event invites of the user
+def notifications(user_id, limit=FEED_PAGE_SIZE, before=None):
+    return feed_page([
+        select(literal('group').label('type'), Group.group_id.label('id'), Group.group_name.label('name'), Member.invite_time)
+        .join(Member.group)
+        .where(
+            Member.read_status == 'Unread',
+            Member.user_id == user_id,
+            after_cursor(Member.invite_time, Group.group_id, 'group', before)
+        )
+        .order_by(Member.invite_time.desc(), Group.group_id.desc()),
+        select(literal('event').label('type'), Event.event_id.label('id'), Event.event_name.label('name'), Participate.invite_time)
+        .join(Participate.event)
+        .where(
+            Participate.read_status == 'Unread',
+            Participate.user_id == user_id,
+            after_cursor(Participate.invite_time, Event.event_id, 'event', before)
+        )
+        .order_by(Participate.invite_time.desc(), Event.event_id.desc())
+    ], limit)
+
+# Pending group and event invites of the user
+def invites(user_id, limit=FEED_PAGE_SIZE, before=None):
+    no_time = null().cast(DateTime(timezone=True))
+    return feed_page([
+        select(
+            literal('group').label('type'), Member.member_id.label('id'), Group.group_name.label('name'),
+            Group.description, no_time.label('start_time'), no_time.label('end_time'),
+            null().cast(String).label('creator'), null().cast(String).label('group'), Member.invite_time
+        )
+        .join(Member.group)
+        .where(
+            Member.status == 'Pending',
+            Member.user_id == user_id,
+            after_cursor(Member.invite_time, Member.member_id, 'group', before)
+        )
+        .order_by(Member.invite_time.desc(), Member.member_id.desc()),
+        select(
+            literal('event').label('type'), Participate.participate_id.label('id'), Event.event_name.label('name'),
+            Event.description, Event.start_time, Event.end_time,
+            User.name.label('creator'), Group.group_name.label('group'), Participate.invite_time
+        )
+        .join(Participate.event)
+        .join(Event.event_creator)
+        .join(Event.host_group)
+        .where(
+            Participate.status == 'Pending',
+            Participate.user_id == user_id,
+            after_cursor(Participate.invite_time, Participate.participate_id, 'event', before)
+        )
+        .order_by(Participate.invite_time.desc(), Participate.participate_id.desc())
+    ], limit)
@@ -0,0 +1,303 @@
+from Project import app
+from Project.cache import LRUCache, MISSING
+from Project.models import EventException
+from sqlalchemy import select
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+import calendar
+
+# Recurring events are stored once per series and only expanded into occurrences
+# for the date window of a request. The rules are a subset of the RRULE of RFC 5545:
+#   FREQ=DAILY|WEEKLY|MONTHLY|YEARLY, INTERVAL, COUNT, UNTIL,
+#   BYDAY with plain weekdays (WEEKLY only), BYMONTHDAY (MONTHLY only, negative days count from the end)
+# e.g. FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20261231
+
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+# Occurrences of a series sent in one response at most,
+# and how far a window without an end reaches into the future
+MAX_OCCURRENCES = 1000
+HORIZON = timedelta(days=366)
+
+# Occurrences counted at most to find the end of a series with COUNT or UNTIL
+MAX_SCANNED_OCCURRENCES = 100000
+
+# Expanded occurrences by series version, window and timezone.
+# Changing a series or one of its occurrences increments its cache_number, so entries never go stale.
+expansion_cache = LRUCache(app.config['RECURRENCE_CACHE_SIZE'], app.config['RECURRENCE_CACHE_TTL'])
+
+# Occurrence of a series, with the fields of the event rows of Project.queries
+Occurrence = namedtuple('Occurrence', [
+    'event_id', 'event_name', 'description', 'start', 'end', 'version_number', 'cache_number',
+    'recurrence', 'recurrence_id'
+])
+
+class Rule:
+    def __init__(self, freq, interval=1, count=None, until=None, byday=None, bymonthday=None):
+        self.freq = freq
+        self.interval = interval
+        self.count = count
+        self.until = until
+        self.byday = byday
+        self.bymonthday = bymonthday
+
+def parse_until(value):
+    try:
+        if len(value) == 8:
+            # A date includes the whole day
+            return datetime.strptime(value, '%Y%m%d').replace(hour=23, minute=59, second=59)
+        if value.endswith('Z'):
+            return datetime.strptime(value, '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc)
+        return datetime.strptime(value, '%Y%m%dT%H%M%S')
+    except ValueError:
+        raise ValueError(f'Invalid UNTIL {value}')
+
+def parse_rule(text):
+    parts = {}
+    for part in text.strip().upper().removeprefix('RRULE:').split(';'):
+        name, separator, value = part.partition('=')
+        if not separator or not value or name in parts:
+            raise ValueError(f'Invalid rule part {part}')
+        parts[name] = value
+
+    freq = parts.pop('FREQ', None)
+    if freq not in FREQUENCIES:
+        raise ValueError(f'Unsupported FREQ {freq}')
+    try:
+        interval = int(parts.pop('INTERVAL', 1))
+        count = int(parts['COUNT']) if 'COUNT' in parts else None
+        bymonthday = [int(day) for day in parts['BYMONTHDAY'].split(',')] if 'BYMONTHDAY' in parts else None
+    except ValueError:
+        raise ValueError('INTERVAL, COUNT and BYMONTHDAY must be integers')
+    parts.pop('COUNT', None)
+    parts.pop('BYMONTHDAY', None)
+    if interval < 1 or (count is not None and count < 1):
+        raise ValueError('INTERVAL and COUNT must be positive')
+    until = parse_until(parts.pop('UNTIL')) if 'UNTIL' in parts else None
+    if count is not None and until is not None:
+        raise ValueError('COUNT and UNTIL cannot be combined')
+
+    byday = None
+    if 'BYDAY' in parts:
+        byday = parts.pop('BYDAY').split(',')
+        if freq != 'WEEKLY' or any(day not in WEEKDAYS for day in byday):
+            raise ValueError('BYDAY is only supported with plain weekdays in WEEKLY rules')
+        byday = sorted({WEEKDAYS.index(day) for day in byday})
+    if bymonthday is not None:
+        if freq != 'MONTHLY' or any(day == 0 or not -31 <= day <= 31 for day in bymonthday):
+            raise ValueError('BYMONTHDAY is only supported in MONTHLY rules, with days from -31 to 31')
+
+    if parts:
+        raise ValueError(f"Unsupported rule parts {', '.join(sorted(parts))}")
+    return Rule(freq, interval, count, until, byday, bymonthday)
+
+def add_months(moment, months):
+    month = moment.month - 1 + months
+    return moment.year + month // 12, month % 12 + 1
+
+# Wall clock starts of the occurrences of one period of the rule, the k-th after dtstart's
+def period_starts(rule, dtstart, k):
+    if rule.freq == 'DAILY':
+        return [dtstart + timedelta(days=k * rule.interval)]
+    if rule.freq == 'WEEKLY':
+        week = dtstart - timedelta(days=dtstart.weekday()) + timedelta(weeks=k * rule.interval)
+        return [week + timedelta(days=weekday) for weekday in (rule.byday or [dtstart.weekday()])]
+    if rule.freq == 'MONTHLY':
+        year, month = add_months(dtstart, k * rule.interval)
+        last = calendar.monthrange(year, month)[1]
+        days = sorted({day if day > 0 else last + day + 1 for day in (rule.bymonthday or [dtstart.day])})
+        return [dtstart.replace(year=year, month=month, day=day) for day in days if 1 <= day <= last]
+    year = dtstart.year + k * rule.interval
+    if dtstart.month == 2 and dtstart.day == 29 and not calendar.isleap(year):
+        return []
+    return [dtstart.replace(year=year)]
+
+# Index of the first period that can have occurrences starting after the given wall clock time
+def first_period(rule, dtstart, after):
+    if after is None or after <= dtstart or rule.count is not None:
+        # Occurrences are counted from the start of the series
+        return 0
+    if rule.freq == 'DAILY':
+        periods = (after - dtstart).days // rule.interval
+    elif rule.freq == 'WEEKLY':
+        periods = (after - dtstart).days // (7 * rule.interval)
+    elif rule.freq == 'MONTHLY':
+        periods = ((after.year - dtstart.year) * 12 + after.month - dtstart.month) // rule.interval
+    else:
+        periods = (after.year - dtstart.year) // rule.interval
+    return max(0, periods - 1)
+
+# Consecutive periods without any occurrence after which a rule is taken to have no more,
+# e.g. FREQ=MONTHLY;INTERVAL=12;BYMONTHDAY=30 from a February. Valid rules skip a few at most.
+MAX_EMPTY_PERIODS = 8
+
+# Wall clock starts of the occurrences of the rule, in order, until the first one after before.
+# dtstart, after, before and until are naive times on the wall clock of the series timezone.
+def wall_starts(rule, dtstart, until=None, after=None, before=None):
+    count = 0
+    empty = 0
+    k = first_period(rule, dtstart, after)
+    while empty <= MAX_EMPTY_PERIODS:
+        starts = [start for start in period_starts(rule, dtstart, k) if start >= dtstart]
+        k += 1
+        empty = 0 if starts else empty + 1
+        for start in starts:
+            if (until is not None and start > until) or (before is not None and start >= before):
+                return
+            count += 1
+            yield start
+            if rule.count is not None and count >= rule.count:
+                return
+
+def local(moment, tz):
+    return moment.astimezone(tz).replace(tzinfo=None)
+
+def series_until(rule, tz):
+    if rule.until is not None and rule.until.tzinfo is not None:
+        return local(rule.until, tz)
+    return rule.until
+
+# recurrence, recurrence_tz and recurrence_end of an event, for a rule given by a client.
+# Raises ValueError when the rule or the timezone is invalid.
+def series_columns(text, tz, start_time, end_time):
+    if not text:
+        return {'recurrence': None, 'recurrence_tz': None, 'recurrence_end': None}
+    tz = tz or 'UTC'
+    try:
+        zone = ZoneInfo(tz)
+    except (KeyError, ValueError):
+        raise ValueError(f'Unknown timezone {tz}')
+    rule = parse_rule(text)
+    if start_time.tzinfo is None:
+        start_time = start_time.replace(tzinfo=timezone.utc)
+        end_time = end_time.replace(tzinfo=timezone.utc)
+
+    starts = wall_starts(rule, local(start_time, zone), series_until(rule, zone))
+    last = next(starts, None)
+    if last is None:
+        raise ValueError('The rule has no occurrence')
+    recurrence_end = None
+    if rule.count is not None or rule.until is not None:
+        for scanned, last in enumerate(starts):
+            if scanned >= MAX_SCANNED_OCCURRENCES:
+                # Far enough, filtered as a series without end
+                break
+        else:
+            recurrence_end = last.replace(tzinfo=zone).astimezone(timezone.utc) + (end_time - start_time)
+    return {'recurrence': text.strip().upper(), 'recurrence_tz': tz, 'recurrence_end': recurrence_end}
+
+# Series given by a client, with the fields of the event rows expanded by occurrences()
+Series = namedtuple('Series', ['event_name', 'description', 'series_start', 'series_end', 'recurrence', 'recurrence_tz'])
+
+# (start, end) of the occurrences of a rule given by a client during the HORIZON after its start,
+# or of the single event without a rule. Raises ValueError when the rule or the timezone is invalid.
+def rule_intervals(text, tz, start_time, end_time):
+    if start_time.tzinfo is None:
+        start_time = start_time.replace(tzinfo=timezone.utc)
+        end_time = end_time.replace(tzinfo=timezone.utc)
+    if not text:
+        return [(start_time, end_time)]
+    series = Series(None, None, start_time, end_time, series_columns(text, tz, start_time, end_time)['recurrence'], tz)
+    return [
+        (occurrence_start, occurrence_end)
+        for _, occurrence_start, occurrence_end, _, _ in occurrences(series, (), start_time, start_time + HORIZON)
+    ]
+
+# Cancelled and overridden occurrences of the given series
+def exceptions_statement(event_ids):
+    return select(EventException).where(EventException.event_id.in_(event_ids))
+
+# Occurrences of a series overlapping the window, as (original start, start, end, title, description)
+def occurrences(series, exceptions, start, end):
+    zone = ZoneInfo(series.recurrence_tz or 'UTC')
+    rule = parse_rule(series.recurrence)
+    duration = series.series_end - series.series_start
+    if start is None:
+        start = series.series_start
+    if end is None:
+        end = max(start, datetime.now(timezone.utc)) + HORIZON
+
+    overrides = {exception.original_start: exception for exception in exceptions}
+    found = []
+    for wall in wall_starts(
+        rule, local(series.series_start, zone), series_until(rule, zone),
+        after=local(start - duration, zone), before=local(end, zone) + timedelta(days=1)
+    ):
+        original = wall.replace(tzinfo=zone).astimezone(timezone.utc)
+        if original >= end:
+            break
+        exception = overrides.pop(original, None)
+        if original + duration <= start and exception is None:
+            continue
+        found.append((original, exception))
+        if len(found) >= MAX_OCCURRENCES:
+            break
+    # Occurrences moved into the window from outside of it
+    found += [(original, exception) for original, exception in overrides.items()]
+
+    result = []
+    for original, exception in found:
+        occurrence = (original, original, original + duration, series.event_name, series.description)
+        if exception is not None:
+            if exception.cancelled:
+                continue
+            occurrence = (
+                original,
+                exception.start_time or original,
+                exception.end_time or original + duration,
+                exception.event_name or series.event_name,
+                exception.description if exception.description is not None else series.description
+            )
+        if occurrence[2] > start and occurrence[1] < end:
+            result.append(occurrence)
+    result.sort(key=lambda occurrence: occurrence[1])
+    return result[:MAX_OCCURRENCES]
+
+def cache_key(row, start, end, tz):
+    return (row.event_id, row.cache_number, start, end, tz)
+
+# Cached occurrences of the series among the event rows, and the ids of the series to expand
+def cached_occurrences(rows, start, end, tz):
+    cached = {}
+    missing = []
+    for row in rows:
+        if row.recurrence is None:
+            continue
+        occurrences = expansion_cache.get(cache_key(row, start, end, tz))
+        if occurrences is MISSING:
+            missing.append(row.event_id)
+        else:
+            cached[row.event_id] = occurrences
+    return cached, missing
+
+# Replace the series among the event rows by their occurrences in the window, with their times
+# in the given timezone. exceptions are the EventException rows of the series missing from cached.
+def expand(rows, start, end, tz, cached, exceptions):
+    if not any(row.recurrence is not None for row in rows):
+        return rows
+    by_event = {}
+    for exception in exceptions:
+        by_event.setdefault(exception.event_id, []).append(exception)
+    zone = ZoneInfo(tz or 'UTC')
+
+    expanded = []
+    for row in rows:
+        if row.recurrence is None:
+            expanded.append(row)
+            continue
+        series = cached.get(row.event_id)
+        if series is None:
+            series = [
+                Occurrence(
+                    row.event_id, event_name, description,
+                    occurrence_start.astimezone(zone).isoformat(), occurrence_end.astimezone(zone).isoformat(),
+                    row.version_number, row.cache_number, row.recurrence, original.isoformat()
+                )
+                for original, occurrence_start, occurrence_end, event_name, description
+                in occurrences(row, by_event.get(row.event_id, ()), start, end)
+            ]
+            expansion_cache.set(cache_key(row, start, end, tz), series)
+        expanded.extend(series)
+    return expanded
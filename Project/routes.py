@@ -2,47 +2,33 @@ from flask import flash,redirect,url_for
 from werkzeug.security import generate_password_hash,check_password_hash
 from flask_login import login_user,login_required,current_user,logout_user
 from Project.forms import SignInForm,SignUpForm,GroupForm
-from Project.models import User,Event,Group,Participate,Member
-from flask import request, render_template, jsonify
-from sqlalchemy import func, update, exists
+from Project.sync import record_event_changes
+from Project import queries
+from Project import recurrence
+from Project import availability
+from Project import permissions
+from Project import views
+from Project.conditional import conditional_response,version_digest
+from Project.counters import notify_counters,get_counters
+from Project import push
+from Project import instrumentation
+from Project import compression
+from Project.pool import pool_metrics
+from Project.encoding import dumps
+from Project.users import resolve_emails,invalidate_emails
+from Project.models import User,Event,Group,Participate,Member,EventException
+from flask import request, render_template, jsonify, Response
+from sqlalchemy import func, update, delete, exists, select, union, tuple_, case, values, column, cast
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm.exc import StaleDataError
 from sqlalchemy.orm.attributes import flag_modified
 from Project import app,db
 from datetime import datetime, timezone, timedelta
+from zoneinfo import ZoneInfo
+import hmac
 import json
 import os
-
-# Helper function to convert datetime to human-readable format
-def human_readable_delta(dt):
-    now = datetime.now(timezone.utc)  # Use UTC time instead of local
-    if dt.tzinfo is None:
-        # Localize naive datetime to UTC
-        dt = dt.replace(tzinfo=timezone.utc)
-    delta = now - dt
-    seconds = delta.total_seconds()
-        
-    if seconds < 0:
-        return "in the future"
-    
-    intervals = (
-        ('year', 31536000),    # 365 * 24 * 3600
-        ('month', 2592000),    # 30 * 24 * 3600
-        ('week', 604800),      # 7 * 24 * 3600
-        ('day', 86400),       # 24 * 3600
-        ('hour', 3600),
-        ('minute', 60),
-        ('second', 1)
-    )
-
-    for name, count in intervals:
-        value = int(seconds // count)
-        if value >= 1:
-            if value == 1:
-                return f"{value} {name} ago"
-            else:
-                return f"{value} {name}s ago"
-    
-    return "Just Now"
+import queue
 
 @app.route('/')
 def base():
@@ -85,6 +71,7 @@ def signup():
             try:
                 db.session.add(newUser)
                 db.session.commit()
+                invalidate_emails(newUser.email)
                 login_user(newUser, remember=False)
                 flash("User Added Successfully",'success')
             except:
@@ -116,10 +103,12 @@ def user_profile():
         user = User.query.filter_by(user_id=current_user.user_id).first()
         if user:
             try:
+                old_email = user.email
                 user.name = form['name'].strip()
                 user.email = form['email'].strip()
                 user.password = generate_password_hash(str(form['password']))
                 db.session.commit()
+                invalidate_emails(old_email, user.email)
                 return jsonify(success=True), 200
             except:
                 return jsonify({'error':'Unable to update profile settings'}), 500
@@ -141,28 +130,39 @@ def create_group():
             db.session.add(newGroup)
             db.session.flush()
 
-            db.session.add(Member(
-                user_id = current_user.user_id,
-                group_id = newGroup.group_id,
-                read_status = 'Read',
-                permission = 'Admin',
-                status = 'Accepted'
-            ))
-            
+            members = [{
+                'user_id': current_user.user_id,
+                'group_id': newGroup.group_id,
+                'read_status': 'Read',
+                'permission': 'Admin',
+                'status': 'Accepted'
+            }]
+            user_ids, _ = resolve_emails(group['members'])
             for i in range(len(group['members'])):
                 email = group['members'][i].strip().lower()
                 if email == current_user.email:
                     continue
-                user = User.query.filter_by(email=email).first()
-                if user is None:
+                user_id = user_ids.get(email)
+                if user_id is None:
                     invalid_emails.append(email)
                     continue
-                newMember = Member(
-                    user_id = user.user_id,
-                    group_id = newGroup.group_id,
-                    permission = group['permissions'][i]
-                )
-                db.session.add(newMember)
+                members.append({
+                    'user_id': user_id,
+                    'group_id': newGroup.group_id,
+                    'read_status': 'Unread',
+                    'permission': group['permissions'][i],
+                    'status': 'Pending'
+                })
+
+            # All the memberships in one statement, an email listed twice keeps its first permission
+            invited_users = db.session.execute(
+                insert(Member)
+                .values(members)
+                .on_conflict_do_nothing(constraint='uq_user_group')
+                .returning(Member.user_id)
+            ).scalars().all()
+            permissions.invalidate_memberships(invited_users)
+            notify_counters([user_id for user_id in invited_users if user_id != current_user.user_id])
             db.session.commit()
         except:
             db.session.rollback()
@@ -174,84 +174,44 @@ def create_group():
 @app.route('/get_pending_invites_count', methods=['GET'])
 @login_required
 def get_pending_invites_count():
-    group_invite_count = (
-        db.session.query(func.count(Member.member_id))
-        .join(Member.group)
-        .filter(
-            Member.user_id == current_user.user_id,
-            Member.status == 'Pending'
-        )
-        .scalar()
-    )
-
-    event_invite_count = (
-        db.session.query(func.count(Participate.participate_id))
-        .join(Participate.event)
-        .filter(
-            Participate.user_id == current_user.user_id,
-            Participate.status == 'Pending'
-        )
-        .scalar()
-    )
-
-    return jsonify(group_invite_count + event_invite_count) 
+    return jsonify(get_counters(current_user.user_id).pending_invites)
 
 # Group and Event Invites
 @app.route('/check_invites',methods=['GET','POST'])
 @login_required
 def check_invites():
     if request.method == 'GET':
-        group_invites = (
-            db.session.query(Member.member_id, Group.group_name, Group.description)
-            .join(Member.group)
-            .filter(
-                Member.user_id == current_user.user_id,
-                Member.status == 'Pending'
-            )
-            .order_by(Member.invite_time.desc())
-            .all()
-        )
-
-        group_invites_list = [{
-            'id': invite.member_id,
-            'type': 'group',
-            'name': invite.group_name,
-            'description': invite.description
-        } for invite in group_invites]
-
-        event_invites = (
-            db.session.query(
-                Participate.participate_id,
-                Event.event_name,
-                Event.description,
-                Event.start_time,
-                Event.end_time,
-                User.name,
-                Group.group_name
-            )
-            .join(Participate.event)
-            .join(Event.event_creator)
-            .join(Event.host_group)
-            .filter(
-                Participate.user_id == current_user.user_id,
-                Participate.status == 'Pending'
-            )
-            .order_by(Participate.invite_time.desc())
-            .all()
-        )
-
-        event_invites_list = [{
-            'id': invite.participate_id,
-            'type': 'event',
-            'name': invite.event_name,
-            'description': invite.description,
-            'start_time': invite.start_time,
-            'end_time': invite.end_time,
-            'creator': invite.name,
-            'group': invite.group_name
-        } for invite in event_invites]
+        # One page of the invites, newest first, merged by the database
+        try:
+            limit, before = queries.parse_feed_page(request.args)
+        except ValueError:
+            return jsonify({'error': 'Invalid page'}), 400
+        invites = db.session.execute(queries.invites(current_user.user_id, limit, before)).all()
+
+        invites_list = []
+        for invite in invites:
+            if invite.type == 'group':
+                invites_list.append({
+                    'id': invite.id,
+                    'type': 'group',
+                    'name': invite.name,
+                    'description': invite.description,
+                    'invite_time': invite.invite_time
+                })
+            else:
+                invites_list.append({
+                    'id': invite.id,
+                    'type': 'event',
+                    'name': invite.name,
+                    'description': invite.description,
+                    'start_time': invite.start_time,
+                    'end_time': invite.end_time,
+                    'creator': invite.creator,
+                    'group': invite.group,
+                    'invite_time': invite.invite_time
+                })
 
-        return jsonify(group_invites_list + event_invites_list)
+        return jsonify({'invites': invites_list, 'next': queries.feed_cursor(invites, limit)})
 
     else:
         response = request.get_json()
@@ -263,6 +223,7 @@ def check_invites():
                 else:
                     invite.status = response['status']
                     invite.read_status = 'Read'
+                permissions.invalidate_memberships([invite.user_id])
                 group_id = 0
             else:
                 invite = Participate.query.filter_by(participate_id=response['invite_id']).first()
@@ -274,6 +235,8 @@ def check_invites():
                     .where(Event.event_id == invite.event_id)
                     .values(cache_number = Event.cache_number + 1)
                 )
+                record_event_changes([invite.event_id])
+            notify_counters([current_user.user_id])
             db.session.commit()
         except:
             db.session.rollback()
@@ -284,29 +247,17 @@ def check_invites():
 @app.route('/get_unread_notifications_count', methods=['GET'])
 @login_required
 def get_unread_notifications_count():
-    # For groups
-    unread_groups = (
-        db.session.query(func.count(Member.member_id))
-        .join(Member.group)
-        .filter(
-            Member.user_id == current_user.user_id,
-            Member.read_status == 'Unread'
-        )
-        .scalar()
-    )
+    return jsonify(get_counters(current_user.user_id).unread_notifications)
 
-    # For events
-    unread_events = (
-        db.session.query(func.count(Participate.participate_id))
-        .join(Participate.event)
-        .filter(
-            Participate.user_id == current_user.user_id,
-            Participate.read_status == 'Unread'
-        )
-        .scalar()
-    )
-
-    return jsonify(unread_groups + unread_events)
+# To get both the number of pending invites and unread notifications for the user
+@app.route('/counts', methods=['GET'])
+@login_required
+def get_counts():
+    counter = get_counters(current_user.user_id)
+    return jsonify({
+        'pending_invites': counter.pending_invites,
+        'unread_notifications': counter.unread_notifications
+    })
 
 # To get the notifications for the user
 @app.route('/get_notifications', methods=['GET', 'POST'])
@@ -314,53 +265,23 @@ def get_unread_notifications_count():
 # Get the unread events and groups for the current user
 def get_notifications():
     if (request.method == 'GET'):
-        # For groups
-        events1 = (
-            db.session.query(Group.group_id, Group.group_name, Member.invite_time)
-            .join(Member.group)
-            .filter(
-                Member.read_status == 'Unread',
-                Member.user_id == current_user.user_id
-            )
-            .order_by(Member.invite_time.desc())
-            .all()
-        )
-
-        # For events
-        events2 = (
-            db.session.query(Participate.event_id, Event.event_name, Participate.invite_time)
-            .join(Participate.event)
-            .filter(
-                Participate.read_status == 'Unread',
-                Participate.user_id == current_user.user_id
-            )
-            .order_by(Participate.invite_time.desc())
-            .all()
-        )
-
-        # Combine the two lists of events and sort them by invite_time in descending order
-        events = sorted(events1 + events2, key=lambda x: x.invite_time, reverse=True)
-
-        # Create a list of dictionaries to store the event details
-        # Take care of event and group names
-        events_list = []
-        for event in events:
-            if hasattr(event, 'group_name'):
-                events_list.append({
-                    'id': event.group_id,
-                    'name': event.group_name,
-                    'passed_time': human_readable_delta(event.invite_time),
-                    'type': 'group'
-                })
-            else:
-                events_list.append({
-                    'id': event.event_id,
-                    'name': event.event_name,
-                    'passed_time': human_readable_delta(event.invite_time),
-                    'type': 'event'
-                })
+        # One page of the group and event notifications, newest first, merged by the database.
+        # The invite times are sent as they are, the client shows how long ago they were.
+        try:
+            limit, before = queries.parse_feed_page(request.args)
+        except ValueError:
+            return jsonify({'error': 'Invalid page'}), 400
+        notifications = db.session.execute(queries.notifications(current_user.user_id, limit, before)).all()
 
-        return jsonify(events_list)
+        return jsonify({
+            'notifications': [{
+                'id': notification.id,
+                'name': notification.name,
+                'invite_time': notification.invite_time,
+                'type': notification.type
+            } for notification in notifications],
+            'next': queries.feed_cursor(notifications, limit)
+        })
 
     else:
         response = request.get_json()
@@ -372,6 +293,7 @@ def get_notifications():
             else:
                 notification = Participate.query.filter_by(event_id=response['id'], user_id=current_user.user_id).first()
             notification.read_status = 'Read'
+            notify_counters([current_user.user_id])
             db.session.commit()
             return jsonify(success=True), 200
         except:
@@ -382,637 +304,244 @@ def get_notifications():
 @app.route('/get_groups')
 @login_required
 def get_groups():
-    groups = (
-        db.session.query(Group.group_id, Group.group_name)
+    # Group names only change along with the version number of the group
+    digest = (
+        db.session.query(version_digest(Group.group_id, Group.version_number, order_by=Group.group_id))
         .join(Group.members)
         .filter(
             Member.user_id == current_user.user_id,
             Member.status == 'Accepted'
         )
-        .group_by(Group.group_id, Group.group_name)
-        .all()
+        .scalar()
     )
-    
-    groups_list = [{
-        'group_id': group.group_id,
-        'name': group.group_name
-    } for group in groups]
-    
-    return jsonify(groups_list)
+
+    def build():
+        groups = (
+            db.session.query(Group.group_id, Group.group_name)
+            .join(Group.members)
+            .filter(
+                Member.user_id == current_user.user_id,
+                Member.status == 'Accepted'
+            )
+            .group_by(Group.group_id, Group.group_name)
+            .all()
+        )
+        
+        groups_list = [{
+            'group_id': group.group_id,
+            'name': group.group_name
+        } for group in groups]
+        
+        return jsonify(groups_list)
+
+    return conditional_response((current_user.user_id, digest), build)
 
 # To get the calendar for the group or individual
 @app.route('/calendar', methods=['GET','POST'])
 @login_required
 def get_calendar():
-    groups = (
-        db.session.query(Group.group_id, Group.group_name, Member.permission)
-        .join(Group.members)
-        .filter(
-            Member.user_id == current_user.user_id,
-            Member.status == 'Accepted'
-        )
-        .group_by(Group.group_id, Group.group_name, Member.permission)
-        .all()
-    )
+    memberships = permissions.user_memberships()
+    accepted = [group_id for group_id, mem in memberships.items() if mem.status == 'Accepted']
+    groups = [
+        {'group_id': group_id, 'group_name': group_name, 'permission': memberships[group_id].permission}
+        for group_id, group_name in
+        db.session.query(Group.group_id, Group.group_name).filter(Group.group_id.in_(accepted)).order_by(Group.group_id)
+    ]
 
     return render_template('calendar.html',groups=groups)
 
+# Run a view of Project.views on the session of the request
+def run_view(view):
+    def resume(result=None):
+        while True:
+            try:
+                operation = view.send(result)
+            except StopIteration as stop:
+                body, status = stop.value
+                if isinstance(body, bytes):
+                    return app.response_class(body, status=status, mimetype='application/json')
+                return jsonify(body), status
+            kind = operation[0]
+            if kind == 'conditional':
+                # The rest of the view only runs when the client is not up to date
+                return conditional_response(operation[1], resume, operation[2])
+            elif kind == 'execute':
+                result = db.session.execute(operation[1])
+            elif kind == 'get':
+                result = db.session.get(operation[1], operation[2])
+            elif kind == 'membership':
+                result = permissions.membership(operation[1])
+            elif kind == 'save':
+                try:
+                    db.session.add(operation[1])
+                    db.session.commit()
+                    result = True
+                except:
+                    db.session.rollback()
+                    result = False
+
+    return resume()
+
 # To get the events for the group or individual
 @app.route('/data/<int:group_id>')
 @login_required
 def return_data(group_id):
-    if group_id == 1:
-        # To see whether a Group 1 exits (to validate foreign key)
-        group = Group.query.filter_by(group_id=1).first()
-        
-        if group is None:
-            newGroup = Group(
-                group_name = 'No Group',
-                description = 'No Description'
-            )
-            
-            try:
-                db.session.add(newGroup)
-                db.session.commit()
-            except:
-                db.session.rollback()
-                return jsonify({'error': "Unable to add group 1 to the database"}), 500
-        
-        # Get all the events from the database created by current user
-        events_data = []
-        for event in current_user.created_events:
-            local_start_time = event.start_time.astimezone()
-            local_end_time = event.end_time.astimezone()
-            if event.start_time.tzinfo is None:
-                local_start_time = event.start_time.replace(tzinfo=timezone.utc)
-                local_start_time = local_start_time.astimezone()
-            if event.end_time.tzinfo is None:
-                local_end_time = event.end_time.replace(tzinfo=timezone.utc)
-                local_end_time = local_end_time.astimezone()
-            
-            if event.group_id == 1:
-                events_data.append({
-                'event_id': event.event_id,
-                'title': event.event_name,
-                'description': event.description,
-                'start': local_start_time.isoformat(), 
-                'end': local_end_time.isoformat(),
-                'event_type': 'individual',
-                'is_pending_for_current_user': False,
-                'event_edit_permission': 'Admin',
-                'version': event.version_number,
-                'cache_number': event.cache_number
-            })
-            
-        group_events = (
-            db.session.query(Event)
-            .join(Event.participations)
-            .filter(Participate.user_id == current_user.user_id)
-            .filter(Participate.status != 'Declined')
-            .all()
-        )
-        for event in group_events:
-            users = (
-                db.session.query(User.name, User.email)
-                .join(User.participations)
-                .filter(Participate.event_id == event.event_id)
-                .all()
-            )
-            
-            accepted_users = (
-                db.session.query(User.name, User.email)
-                .join(User.participations)
-                .filter(
-                    Participate.event_id == event.event_id,
-                    Participate.status == 'Accepted'
-                )
-                .all()
-            )
-            
-            pending_users = (
-                db.session.query(User.name, User.email)
-                .join(User.participations)
-                .filter(
-                    Participate.event_id == event.event_id,
-                    Participate.status == 'Pending'
-                )
-                .all()
-            )
-            
-            declined_users = (
-                db.session.query(User.name, User.email)
-                .join(User.participations)
-                .filter(
-                    Participate.event_id == event.event_id,
-                    Participate.status == 'Declined'
-                )
-                .all()
-            )
-            
-            # Get participants for this event
-            participants = [{
-                'name': participant.name,
-                'email': participant.email
-                # Add other participant fields as needed
-            } for participant in users]
-            
-            accepted_participants = [{
-                'name': participant.name,
-                'email': participant.email
-            } for participant in accepted_users]
-            
-            pending_participants = [{
-                'name': participant.name,
-                'email': participant.email
-            } for participant in pending_users]
-            
-            declined_participants = [{
-                'name': participant.name,
-                'email': participant.email
-            } for participant in declined_users]
-            
-            is_pending = any(
-                participant['email'] == current_user.email 
-                for participant in pending_participants
-            )
-
-            local_start_time = event.start_time.astimezone()
-            local_end_time = event.end_time.astimezone()
-            if event.start_time.tzinfo is None:
-                local_start_time = event.start_time.replace(tzinfo=timezone.utc)
-                local_start_time = local_start_time.astimezone()
-            if event.end_time.tzinfo is None:
-                local_end_time = event.end_time.replace(tzinfo=timezone.utc)
-                local_end_time = local_end_time.astimezone()
-
-            events_data.append({
-                'event_id': event.event_id,
-                'title': event.event_name,
-                'description': event.description,
-                'start': local_start_time.isoformat(), 
-                'end': local_end_time.isoformat(),
-                'event_type': 'group',
-                'participants': participants,
-                'accepted_participants': accepted_participants,
-                'pending_participants':pending_participants,
-                'declined_participants':declined_participants,
-                'is_pending_for_current_user': is_pending,
-                'event_edit_permission': 'Viewer',
-                'version': event.version_number,
-                'cache_number': event.cache_number
-            })
-            
-    else:
-        # Get all the events for the group
-        group = Group.query.filter_by(group_id=group_id).first()
-        if not group:
-            return jsonify({'error': 'Group not found'}), 404
-    
-        mem = Member.query.filter_by(user_id=current_user.user_id, group_id=group_id).first()
-        if not mem:
-            return jsonify({'error': 'Access denied'}), 403
-        permission = mem.permission
-
-        events = group.events
-        events_data = []
-        for event in events:
-            users = (
-                db.session.query(User.name, User.email)
-                .join(User.participations)
-                .filter(Participate.event_id == event.event_id)
-                .all()
-            )
-            
-            accepted_users = (
-                db.session.query(User.name, User.email)
-                .join(User.participations)
-                .filter(
-                    Participate.event_id == event.event_id,
-                    Participate.status == 'Accepted'
-                )
-                .all()
-            )
-            
-            pending_users = (
-                db.session.query(User.name, User.email)
-                .join(User.participations)
-                .filter(
-                    Participate.event_id == event.event_id,
-                    Participate.status == 'Pending'
-                )
-                .all()
-            )
-            
-            declined_users = (
-                db.session.query(User.name, User.email)
-                .join(User.participations)
-                .filter(
-                    Participate.event_id == event.event_id,
-                    Participate.status == 'Declined'
-                )
-                .all()
-            )
-            
-            # Get participants for this event
-            participants = [{
-                'name': participant.name,
-                'email': participant.email
-            } for participant in users]
-            
-            accepted_participants = [{
-                'name': participant.name,
-                'email': participant.email
-            } for participant in accepted_users]
-            
-            pending_participants = [{
-                'name': participant.name,
-                'email': participant.email
-            } for participant in pending_users]
-            
-            declined_participants = [{
-                'name': participant.name,
-                'email': participant.email
-            } for participant in declined_users]
-            
-            is_pending = any(
-                participant['email'] == current_user.email 
-                for participant in pending_participants
-            )
+    return run_view(views.calendar_data(request.args, request.headers.get('Accept'), current_user, group_id))
 
-            local_start_time = event.start_time.astimezone()
-            local_end_time = event.end_time.astimezone()
-            if event.start_time.tzinfo is None:
-                local_start_time = event.start_time.replace(tzinfo=timezone.utc)
-                local_start_time = local_start_time.astimezone()
-            if event.end_time.tzinfo is None:
-                local_end_time = event.end_time.replace(tzinfo=timezone.utc)
-                local_end_time = local_end_time.astimezone()
-
-            events_data.append({
-                'event_id': event.event_id,
-                'title': event.event_name,
-                'description': event.description,
-                'start': local_start_time.isoformat(), 
-                'end': local_end_time.isoformat(),
-                'participants': participants,
-                'accepted_participants': accepted_participants,
-                'pending_participants': pending_participants,
-                'declined_participants': declined_participants,
-                'is_pending_for_current_user': is_pending,
-                'event_edit_permission': permission,
-                'version': event.version_number,
-                'cache_number':event.cache_number
-            })
-    return jsonify(events_data)
-
-# To get the updated / new events for the group or individual
-@app.route('/data/<int:group_id>/updates', methods=['POST'])
+# To get the events changed since the given sync cursor for the group or individual
+@app.route('/data/<int:group_id>/updates')
 @login_required
 def return_update_data(group_id):
-    versionMap = request.get_json()
-    
-    cached_events = []
-    for element in versionMap['events']:
-        cached_events.append(element['event_id'])
-    version_map = {item['event_id']: item['cache_number'] for item in versionMap['events']}
-     
-    if group_id == 1:
-        # Get all the events from the database created by current user
-        events_data = []
-        
-        # Get event_id of all the events that are deleted but still available in cache
-        deleted_events = []
-        
-        # Events that are currently have current user as participantion or individual
-        current_user_events = []
-    
-        for event in current_user.created_events:
-            if event.group_id == 1:
-                current_user_events.append(event.event_id)
-        
-        for event in current_user.created_events:
-            local_start_time = event.start_time.astimezone()
-            local_end_time = event.end_time.astimezone()
-            if event.start_time.tzinfo is None:
-                local_start_time = event.start_time.replace(tzinfo=timezone.utc)
-                local_start_time = local_start_time.astimezone()
-            if event.end_time.tzinfo is None:
-                local_end_time = event.end_time.replace(tzinfo=timezone.utc)
-                local_end_time = local_end_time.astimezone()
-            
-            if event.group_id == 1 and (event.event_id not in cached_events or version_map[event.event_id] < event.cache_number):
-                events_data.append({
-                'event_id': event.event_id,
-                'title': event.event_name,
-                'description': event.description,
-                'start': local_start_time.isoformat(), 
-                'end': local_end_time.isoformat(),
-                'event_type': 'individual',
-                'is_pending_for_current_user': False,
-                'event_edit_permission': 'Admin',
-                'version': event.version_number,
-                'cache_number':event.cache_number
-            })
-            
-        group_events = (
-            db.session.query(Event)
-            .join(Participate, Event.event_id == Participate.event_id)
-            .filter(Participate.user_id == current_user.user_id)
-            .all()
-        )
-        
-        for event in group_events:
-            current_user_events.append(event.event_id)
-            
-        for event in group_events:
-            if (event.event_id not in cached_events or version_map[event.event_id] < event.cache_number):
-                users = (
-                    db.session.query()
-                    .select_from(User)
-                    .join(Participate, User.user_id == Participate.user_id)
-                    .filter(Participate.event_id == event.event_id)
-                    .add_columns(User.name,User.email)
-                    .all()
-                )
-                
-                accepted_users = (
-                    db.session.query()
-                    .select_from(User)
-                    .join(Participate, User.user_id == Participate.user_id)
-                    .filter(Participate.event_id == event.event_id, Participate.status == 'Accepted')
-                    .add_columns(User.name,User.email)
-                    .all()
-                )
-                
-                pending_users = (
-                    db.session.query()
-                    .select_from(User)
-                    .join(Participate, User.user_id == Participate.user_id)
-                    .filter(Participate.event_id == event.event_id, Participate.status == 'Pending')
-                    .add_columns(User.name,User.email)
-                    .all()
-                )
-                
-                declined_users = (
-                    db.session.query()
-                    .select_from(User)
-                    .join(Participate, User.user_id == Participate.user_id)
-                    .filter(Participate.event_id == event.event_id, Participate.status == 'Declined')
-                    .add_columns(User.name,User.email)
-                    .all()
-                )
-                
-                # Get participants for this event
-                participants = [{
-                    'name': participant.name,
-                    'email': participant.email
-                    # Add other participant fields as needed
-                } for participant in users]
-                
-                accepted_participants = [{
-                    'name': participant.name,
-                    'email': participant.email
-                } for participant in accepted_users]
-                
-                pending_participants = [{
-                    'name': participant.name,
-                    'email': participant.email
-                } for participant in pending_users]
-                
-                declined_participants = [{
-                    'name': participant.name,
-                    'email': participant.email
-                } for participant in declined_users]
-                
-                is_pending = any(
-                    participant['email'] == current_user.email 
-                    for participant in pending_participants
-                )
+    return run_view(views.calendar_updates(request.args, request.headers.get('Accept'), current_user, group_id))
 
-                local_start_time = event.start_time.astimezone()
-                local_end_time = event.end_time.astimezone()
-                if event.start_time.tzinfo is None:
-                    local_start_time = event.start_time.replace(tzinfo=timezone.utc)
-                    local_start_time = local_start_time.astimezone()
-                if event.end_time.tzinfo is None:
-                    local_end_time = event.end_time.replace(tzinfo=timezone.utc)
-                    local_end_time = local_end_time.astimezone()
-
-                events_data.append({
-                    'event_id': event.event_id,
-                    'title': event.event_name,
-                    'description': event.description,
-                    'start': local_start_time.isoformat(), 
-                    'end': local_end_time.isoformat(),
-                    'event_type': 'group',
-                    'participants': participants,
-                    'accepted_participants': accepted_participants,
-                    'pending_participants':pending_participants,
-                    'declined_participants':declined_participants,
-                    'is_pending_for_current_user': is_pending,
-                    'event_edit_permission': 'Viewer',
-                    'version': event.version_number,
-                    'cache_number':event.cache_number
-                })
-      
-        for cached_event_id in cached_events:
-            if cached_event_id not in current_user_events:
-                deleted_events.append(cached_event_id)
-                      
-    else:
-        # Get all the events for the group
-        group = Group.query.filter_by(group_id=group_id).first()
-        if not group:
+# To get the free slots common to the accepted members of the group
+@app.route('/groups/<int:group_id>/freebusy')
+@login_required
+def get_freebusy(group_id):
+    try:
+        start, end = queries.parse_window(request.args)
+    except ValueError:
+        return jsonify({'error': 'Invalid date range'}), 400
+    try:
+        tz = queries.parse_timezone(request.args)
+    except ValueError:
+        return jsonify({'error': 'Invalid timezone'}), 400
+    # Shortest free slot, in minutes
+    duration = request.args.get('duration', type=int)
+    duration = timedelta(minutes=duration) if duration is not None else availability.DEFAULT_DURATION
+    if start is None:
+        start = datetime.now(timezone.utc)
+    if end is None:
+        end = start + availability.DEFAULT_WINDOW
+    if end <= start or end - start > availability.MAX_WINDOW or duration <= timedelta(0):
+        return jsonify({'error': 'Invalid date range'}), 400
+
+    mem = permissions.membership(group_id) if group_id != 1 else None
+    if not mem:
+        if group_id == 1 or db.session.get(Group, group_id) is None:
             return jsonify({'error': 'Group not found'}), 404
-        
-        mem = Member.query.filter_by(user_id=current_user.user_id, group_id=group_id).first()
-        if not mem:
-            return jsonify({'error': 'Access denied'}), 403
-        permission = mem.permission
-        
-        events = group.events
-    
-        events_data = [] # To store new and updated events
-        deleted_events = [] # To store events that are deleted but still present in the cache
-        
-        for cached_event_id in cached_events:
-            present = 0
-            for event in events:
-                if cached_event_id == event.event_id:
-                    present = 1
-                    break
-            if present == 0:
-                deleted_events.append(cached_event_id)
-                
-        for event in events:
-            if (event.event_id not in cached_events or version_map[event.event_id] < event.cache_number):
-                users = (
-                    db.session.query(User.name, User.email)
-                    .join(User.participations)
-                    .filter(Participate.event_id == event.event_id)
-                    .all()
-                )
-                
-                accepted_users = (
-                    db.session.query(User.name, User.email)
-                    .join(User.participations)
-                    .filter(
-                        Participate.event_id == event.event_id,
-                        Participate.status == 'Accepted'
-                    )
-                    .all()
-                )
-                
-                pending_users = (
-                    db.session.query(User.name, User.email)
-                    .join(User.participations)
-                    .filter(
-                        Participate.event_id == event.event_id,
-                        Participate.status == 'Pending'
-                    )
-                    .all()
-                )
-                
-                declined_users = (
-                    db.session.query(User.name, User.email)
-                    .join(User.participations)
-                    .filter(
-                        Participate.event_id == event.event_id,
-                        Participate.status == 'Declined'
-                    )
-                    .all()
-                )
-                
-                # Get participants for this event
-                participants = [{
-                    'name': participant.name,
-                    'email': participant.email
-                    # Add other participant fields as needed
-                } for participant in users]
-                
-                accepted_participants = [{
-                    'name': participant.name,
-                    'email': participant.email
-                } for participant in accepted_users]
-                
-                pending_participants = [{
-                    'name': participant.name,
-                    'email': participant.email
-                } for participant in pending_users]
-                
-                declined_participants = [{
-                    'name': participant.name,
-                    'email': participant.email
-                } for participant in declined_users]
-                
-                is_pending = any(
-                    participant['email'] == current_user.email 
-                    for participant in pending_participants
-                )
+        return jsonify({'error': 'Access denied'}), 403
 
-                local_start_time = event.start_time.astimezone()
-                local_end_time = event.end_time.astimezone()
-                if event.start_time.tzinfo is None:
-                    local_start_time = event.start_time.replace(tzinfo=timezone.utc)
-                    local_start_time = local_start_time.astimezone()
-                if event.end_time.tzinfo is None:
-                    local_end_time = event.end_time.replace(tzinfo=timezone.utc)
-                    local_end_time = local_end_time.astimezone()
-
-                events_data.append({
-                    'event_id': event.event_id,
-                    'title': event.event_name,
-                    'description': event.description,
-                    'start': local_start_time.isoformat(), 
-                    'end': local_end_time.isoformat(),
-                    'participants': participants,
-                    'accepted_participants': accepted_participants,
-                    'pending_participants': pending_participants,
-                    'declined_participants': declined_participants,
-                    'is_pending_for_current_user': is_pending,
-                    'event_edit_permission': permission,
-                    'version': event.version_number,
-                    'cache_number':event.cache_number
-                })
-    
-    return jsonify({
-        'updated_events': events_data,
-        'deleted_events': deleted_events
-    })
+    rows = db.session.execute(availability.busy_statement(group_id, start, end)).all()
+    series = list({row.event_id for row in rows if row.recurrence is not None})
+    exceptions = db.session.scalars(recurrence.exceptions_statement(series)).all() if series else []
+    busy = availability.merge_intervals(availability.busy_intervals(rows, exceptions, start, end), start, end)
+    free = availability.free_slots(busy, start, end, duration)
+
+    zone = ZoneInfo(tz or 'UTC')
+    def intervals(slots):
+        return [{'start': slot_start.astimezone(zone), 'end': slot_end.astimezone(zone)} for slot_start, slot_end in slots]
+    return app.response_class(dumps({
+        'start': start.astimezone(zone),
+        'end': end.astimezone(zone),
+        'duration': int(duration.total_seconds() // 60),
+        'busy': intervals(busy),
+        'free': intervals(free)
+    }), mimetype='application/json')
 
 # To get the members of the group
 @app.route('/members/<int:group_id>')
 @login_required
 def get_members(group_id):
     if group_id != 1:
-        mem = Member.query.filter_by(user_id=current_user.user_id, group_id=group_id).first()
+        mem = permissions.membership(group_id)
         if not mem:
             return jsonify({'error': 'Access denied'}), 403
     
-    members = (
-        db.session.query(User.name, User.email)
-        .join(User.memberships)
+    # A member changing their name or email changes the list too
+    digest = (
+        db.session.query(version_digest(Member.member_id, User.name, User.email, order_by=Member.member_id))
+        .join(User, User.user_id == Member.user_id)
         .filter(
             Member.group_id == group_id,
             Member.status == 'Accepted'
         )
-        .all()
+        .scalar()
     )
-    
-    members_list = [{
-        'name': member.name,
-        'email': member.email
-    } for member in members]
-    return jsonify(members_list)
+
+    def build():
+        members = (
+            db.session.query(User.name, User.email)
+            .join(User.memberships)
+            .filter(
+                Member.group_id == group_id,
+                Member.status == 'Accepted'
+            )
+            .all()
+        )
+        
+        members_list = [{
+            'name': member.name,
+            'email': member.email
+        } for member in members]
+        return jsonify(members_list)
+
+    return conditional_response((group_id, digest), build)
 
 # To get, delete or update the group info
 @app.route('/group_info/<int:group_id>', methods=['GET','DELETE','PUT'])
 @login_required
 def get_info(group_id):
-    group = Group.query.filter_by(group_id=group_id).first()
+    group = db.session.get(Group, group_id)
     if not group:
         return jsonify({'error': 'Group not found'}), 404
     if group_id != 1:
-        mem = Member.query.filter_by(user_id=current_user.user_id, group_id=group_id).first()
+        # Deleting the group or changing its members needs the permission read in this request
+        mem = permissions.membership(group_id, fresh=request.method != 'GET')
         if not mem:
             return jsonify({'error': 'Access denied'}), 403
         permission = mem.permission
 
     if request.method == 'GET':
-        members = (
-            db.session.query(User.email, Member.permission, Member.status)
-            .join(User.memberships)
+        digest = (
+            db.session.query(version_digest(Member.member_id, Member.permission, Member.status, User.name, User.email, order_by=Member.member_id))
+            .join(User, User.user_id == Member.user_id)
             .filter(Member.group_id == group_id)
-            .all()
+            .scalar()
         )
-        members_list = [{
-            'email': member.email,
-            'role': member.permission,
-            'status': member.status
-        } for member in members]
 
-        return jsonify({
-            'version': group.version_number,
-            'name': group.group_name,
-            'description': group.description,
-            'members': members_list,
-            'authorization': permission == 'Admin',
-            'curr_email': current_user.email
-        })
+        def build():
+            members = (
+                db.session.query(User.email, Member.permission, Member.status)
+                .join(User.memberships)
+                .filter(Member.group_id == group_id)
+                .all()
+            )
+            members_list = [{
+                'email': member.email,
+                'role': member.permission,
+                'status': member.status
+            } for member in members]
+
+            return jsonify({
+                'version': group.version_number,
+                'name': group.group_name,
+                'description': group.description,
+                'members': members_list,
+                'authorization': permission == 'Admin',
+                'curr_email': current_user.email
+            })
+
+        validator = (current_user.user_id, current_user.email, permission, group.version_number, digest)
+        return conditional_response(validator, build)
     
     elif request.method == 'DELETE':
         if permission != 'Admin':
             return jsonify({'error': 'Access denied'}), 403
         try:
-            Participate.query.filter(
-                Participate.event.has(group_id=group_id)
-            ).delete(synchronize_session=False)
+            group_events = [event_id for (event_id,) in db.session.query(Event.event_id).filter_by(group_id=group_id)]
+            record_event_changes(group_events, 'Deleted')
 
-            Event.query.filter_by(group_id=group_id).delete(synchronize_session=False)
-
-            Member.query.filter_by(group_id=group_id).delete(synchronize_session=False)
+            # Members and participants lose their invites of this group
+            affected_users = db.session.scalars(union(
+                select(Member.user_id).where(Member.group_id == group_id),
+                select(Participate.user_id).join(Participate.event).where(Event.group_id == group_id)
+            )).all()
 
+            # Its memberships, events and their participations and exceptions go with it (ON DELETE CASCADE)
             db.session.delete(group)
+            permissions.invalidate_memberships(affected_users)
+            notify_counters(affected_users)
             db.session.commit()
         except:
             db.session.rollback()
@@ -1035,72 +564,66 @@ def get_info(group_id):
             
             # Handle member changes
             current_members = {m.user_id: m for m in Member.query.filter_by(group_id=group_id).all()}
-            users_cache = {}
             invalid_emails = []
+            affected_users = []
+
+            # Resolve the emails of all the member changes at once
+            user_ids, _ = resolve_emails(
+                mem['email'] for mem in
+                group_info['new_members'] + group_info['updated_members'] + group_info['deleted_members']
+            )
             
             # Process new members
             for new_mem in group_info['new_members']:
                 email = new_mem['email'].strip().lower()
-                if email not in users_cache:
-                    users_cache[email] = User.query.filter_by(email=email).first()
-                user = users_cache[email]
-                if user:
+                user_id = user_ids.get(email)
+                if user_id:
                     newMember = Member(
-                        user_id=user.user_id,
+                        user_id=user_id,
                         group_id=group.group_id,
                         permission=new_mem['role']
                     )
                     db.session.add(newMember)
+                    affected_users.append(user_id)
                 else:
                     invalid_emails.append(email)
             
             # Process updated members
+            updated_users = []
             for updated_mem in group_info['updated_members']:
                 email = updated_mem['email'].strip().lower()
-                if email not in users_cache:
-                    users_cache[email] = User.query.filter_by(email=email).first()
-                user = users_cache[email]
-                if user and user.user_id in current_members:
-                    current_members[user.user_id].permission = updated_mem['role']
-                    # increment cache_number for all events in this group in which user participates, 
-                    db.session.execute(
-                        update(Event)
-                        .where(
-                            Event.group_id == group_id,
-                            exists().where(
-                                Participate.event_id == Event.event_id,
-                                Participate.user_id == user.user_id
-                            )
+                user_id = user_ids.get(email)
+                if user_id and user_id in current_members:
+                    current_members[user_id].permission = updated_mem['role']
+                    updated_users.append(user_id)
+            if updated_users:
+                # increment cache_number for all events in this group in which the users participate, at once
+                changed_events = db.session.execute(
+                    update(Event)
+                    .where(
+                        Event.group_id == group_id,
+                        exists().where(
+                            Participate.event_id == Event.event_id,
+                            Participate.user_id.in_(updated_users)
                         )
-                        .values(cache_number=Event.cache_number + 1)
                     )
+                    .values(cache_number=Event.cache_number + 1)
+                    .returning(Event.event_id)
+                ).scalars().all()
+                record_event_changes(changed_events)
             
             # Process deleted members
+            deleted_users = []
             for deleted_mem in group_info['deleted_members']:
                 email = deleted_mem['email'].strip().lower()
-                if email not in users_cache:
-                    users_cache[email] = User.query.filter_by(email=email).first()
-                user = users_cache[email]
-                if user and user.user_id in current_members:
-                    # increment cache_number for all events in this group in which user participates, 
-                    db.session.execute(
-                        update(Event)
-                        .where(
-                            Event.group_id == group_id,
-                            exists().where(
-                                Participate.event_id == Event.event_id,
-                                Participate.user_id == user.user_id
-                            )
-                        )
-                        .values(cache_number=Event.cache_number + 1)
-                    )
-                    Participate.query.filter(
-                        Participate.event.has(group_id=group_id),
-                        Participate.user_id == user.user_id
-                    ).delete(synchronize_session=False)
-
-                    db.session.delete(current_members[user.user_id])
+                user_id = user_ids.get(email)
+                if user_id and user_id in current_members:
+                    deleted_users.append(user_id)
+            remove_members(group_id, deleted_users)
+            permissions.invalidate_memberships(affected_users + updated_users)
+            affected_users += deleted_users
             
+            notify_counters(affected_users)
             db.session.commit()
             return jsonify({'emails': invalid_emails, 'version': group.version_number}), 200
         
@@ -1112,17 +635,112 @@ def get_info(group_id):
             db.session.rollback()
             return jsonify({'error': "Unable to update group info"}), 500
 
+# Remove users from a group along with their participations in its events, in as many statements
+# whatever their number: a DELETE ... USING of the participations, an UPDATE of the events they
+# took part in and a DELETE of the memberships
+def remove_members(group_id, user_ids):
+    if not user_ids:
+        return
+    # Pending changes of the memberships are written before they are deleted
+    db.session.flush()
+    removed = db.session.execute(
+        delete(Participate)
+        .where(
+            Participate.event_id == Event.event_id,
+            Event.group_id == group_id,
+            Participate.user_id.in_(user_ids)
+        )
+        .returning(Participate.event_id, Participate.user_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    removed_events = {}
+    for event_id, user_id in removed:
+        removed_events.setdefault(user_id, set()).add(event_id)
+    changed_events = {event_id for event_id, _ in removed}
+    if changed_events:
+        db.session.execute(
+            update(Event)
+            .where(Event.event_id.in_(changed_events))
+            .values(cache_number=Event.cache_number + 1)
+        )
+        # The removed users see the events deleted from their calendars
+        record_event_changes(changed_events, removed_events=removed_events)
+
+    db.session.execute(
+        delete(Member)
+        .where(Member.group_id == group_id, Member.user_id.in_(user_ids))
+        .execution_options(synchronize_session=False)
+    )
+    permissions.invalidate_memberships(user_ids)
+
 # To get the group permission info
 @app.route('/get_group_permission/<int:group_id>', methods=['GET'])
 @login_required
 def get_group_permission(group_id):
-    mem = Member.query.filter_by(user_id=current_user.user_id, group_id=group_id).first()
+    mem = permissions.membership(group_id)
     if not mem:
         return jsonify({'error': 'Access denied'}), 403
     permission = mem.permission
     return jsonify({'permission':f'${permission}'}), 200
 
+# Users whose calendars are checked for the conflicts of an event of the group. An individual event is
+# only in the calendar of its creator, and the calendars of users outside the group are not the current
+# user's to see, so only the accepted members among the given users are checked.
+def conflict_users(group_id, user_ids):
+    if group_id == 1:
+        return [current_user.user_id]
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return []
+    return db.session.scalars(
+        select(Member.user_id).where(
+            Member.group_id == group_id,
+            Member.status == 'Accepted',
+            Member.user_id.in_(user_ids)
+        )
+    ).all()
+
 # To add an event
+# Conflicting events of the given users with the (start, end) intervals of an event, by email
+def event_conflicts(user_ids, intervals, event_id=None):
+    if not user_ids or not intervals:
+        return {}
+    rows = db.session.execute(availability.conflicts_statement(
+        user_ids, intervals[0][0], max(end for _, end in intervals), current_user.user_id, event_id
+    )).all()
+    series = list({row.event_id for row in rows if row.recurrence is not None})
+    exceptions = db.session.scalars(recurrence.exceptions_statement(series)).all() if series else []
+    conflicts = availability.find_conflicts(rows, exceptions, intervals)
+    if not conflicts:
+        return {}
+    emails = dict(db.session.query(User.user_id, User.email).filter(User.user_id.in_(list(conflicts))))
+    return {
+        emails[user_id]: [
+            {'event_id': conflict_id, 'title': title, 'start': start, 'end': end}
+            if conflict_id is not None else {'start': start, 'end': end}
+            for conflict_id, title, start, end in user_conflicts
+        ]
+        for user_id, user_conflicts in conflicts.items()
+    }
+
+# To get the events of the participants overlapping a new or edited event
+@app.route('/events/conflicts', methods=['POST'])
+@login_required
+def get_conflicts():
+    event = request.get_json()
+    try:
+        group_id = int(event.get('group_id', 1))
+        intervals = recurrence.rule_intervals(event.get('recurrence'), event.get('recurrence_tz'), *event_times(event))
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Invalid event'}), 400
+
+    if group_id != 1 and not permissions.membership(group_id):
+        return jsonify({'error': 'Access denied'}), 403
+    user_ids, _ = resolve_emails([participant['name'] for participant in event.get('participants', [])])
+    users = conflict_users(group_id, user_ids.values())
+    return jsonify({'conflicts': event_conflicts(users, intervals, event.get('event_id'))}), 200
+
 @app.route('/add_event',methods=['POST'])
 @login_required
 def add_event():
@@ -1130,21 +748,32 @@ def add_event():
     
     if int(event['group_id']) != 1:
         # Check if the user has the permission to add the event
-        mem = Member.query.filter_by(user_id=current_user.user_id, group_id=int(event['group_id'])).first()
+        mem = permissions.membership(int(event['group_id']), fresh=True)
         if not mem:
             return jsonify({'error': 'Access denied'}), 403
         permission = mem.permission
         if permission == 'Viewer':
             return jsonify({'error': 'Permission denied'}), 403
      
+    try:
+        start_time, end_time = event_times(event)
+    except ValueError as error:
+        return jsonify({'error': f'Invalid event: {error}'}), 400
+    # A recurring event is a single row, whatever the number of its occurrences
+    try:
+        series = recurrence.series_columns(event.get('recurrence'), event.get('recurrence_tz'), start_time, end_time)
+    except ValueError as error:
+        return jsonify({'error': f'Invalid recurrence: {error}'}), 400
+
     newEvent = Event(
         event_name = event['title'],
         description = event['description'],
-        start_time = datetime.fromisoformat(event['start']),
-        end_time = datetime.fromisoformat(event['end']),
+        start_time = start_time,
+        end_time = end_time,
         cache_number = 0,
         creator = current_user.user_id,
-        group_id = event['group_id']
+        group_id = event['group_id'],
+        **series
     )
     
     participantsEmail = []
@@ -1167,26 +796,48 @@ def add_event():
             db.session.rollback()
             return jsonify({'error': "Unable to add event to the database"}), 500
    
+    user_ids, unknown_emails = resolve_emails(participantsEmail)
+    if unknown_emails:
+        return jsonify({'error': f"Unknown participants: {', '.join(sorted(unknown_emails))}"}), 400
+
+    if event.get('check_conflicts'):
+        # The event is refused when its participants are already booked
+        conflicts = event_conflicts(conflict_users(int(event['group_id']), user_ids.values()), recurrence.rule_intervals(
+            series['recurrence'], series['recurrence_tz'], start_time, end_time
+        ))
+        if conflicts:
+            return jsonify({'error': 'Scheduling conflict', 'conflicts': conflicts}), 409
+
+    # The event and its participants are added in one transaction
     try:
         db.session.add(newEvent)
-        db.session.commit()
-            
+        db.session.flush()
+
+        participants = []
         for participantEmail in participantsEmail:
-            participant = Participate(
-                user_id = User.query.filter_by(email=participantEmail.strip().lower()).first().user_id,
-                event_id = newEvent.event_id
-            )
-            if participantEmail == current_user.email:
-                participant.read_status = 'Read'
-                participant.status = 'Accepted'
-            db.session.add(participant)
-            
-        try:
-            db.session.commit()
-        except:
-            db.session.rollback()
-            return jsonify({'error': "Unable to add participants"}), 500
+            user_id = user_ids[participantEmail.strip().lower()]
+            accepted = user_id == current_user.user_id
+            participants.append({
+                'user_id': user_id,
+                'event_id': newEvent.event_id,
+                'read_status': 'Read' if accepted else 'Unread',
+                'status': 'Accepted' if accepted else 'Pending'
+            })
+
+        participant_users = []
+        if participants:
+            # A participant listed twice is only invited once
+            participant_users = db.session.execute(
+                insert(Participate)
+                .values(participants)
+                .on_conflict_do_nothing(constraint='uq_user_event')
+                .returning(Participate.user_id)
+            ).scalars().all()
+        record_event_changes([newEvent.event_id])
+        notify_counters(participant_users)
+        db.session.commit()
     except:
+        db.session.rollback()
         return jsonify({'error': "Unable to add event to the database"}), 500
     
     return jsonify({'message':'Event added successfully'}), 200
@@ -1200,19 +851,39 @@ def remove_event(event_id):
 
     if event.group_id != 1:
         # Check if the user has the permission to add the event
-        mem = Member.query.filter_by(user_id=current_user.user_id, group_id=event.group_id).first()
+        mem = permissions.membership(event.group_id, fresh=True)
         if not mem:
             return jsonify({'error': 'Access denied'}), 403
         permission = mem.permission
         if permission == 'Viewer':
             return jsonify({'error': 'Permission denied'}), 403
 
+    recurrence_id = request.args.get('recurrence_id')
+    if recurrence_id:
+        # Only this occurrence of the series is cancelled
+        try:
+            original_start = datetime.fromisoformat(recurrence_id)
+        except ValueError:
+            return jsonify({'error': 'Invalid occurrence'}), 400
+        if event.recurrence is None:
+            return jsonify({'error': 'Event is not recurring'}), 400
+        try:
+            override_occurrence(event, original_start, cancelled=True)
+            record_event_changes([event_id])
+            db.session.commit()
+            return jsonify({'message': 'Occurrence deleted successfully'}), 200
+        except:
+            db.session.rollback()
+            return jsonify({'error': "Unable to delete event"}), 500
+
     try:
-        Participate.query.filter(
-            Participate.event_id == event_id
-        ).delete(synchronize_session=False)
+        record_event_changes([event_id], 'Deleted')
+
+        participant_users = [user_id for (user_id,) in db.session.query(Participate.user_id).filter_by(event_id=event_id)]
 
+        # Its participations and exceptions go with it (ON DELETE CASCADE)
         db.session.delete(event)
+        notify_counters(participant_users)
         
         db.session.commit()
         return jsonify({'message': 'Event deleted successfully'}), 200
@@ -1222,6 +893,100 @@ def remove_event(event_id):
         return jsonify({'error': "Unable to delete event"}), 500
 
 
+# Cancel or override one occurrence of a series, by the start it has by the rule
+def override_occurrence(event, original_start, cancelled=False, **fields):
+    values = {'cancelled': cancelled, 'start_time': None, 'end_time': None, 'event_name': None, 'description': None}
+    values.update(fields)
+    db.session.execute(
+        insert(EventException)
+        .values(event_id=event.event_id, original_start=original_start, **values)
+        .on_conflict_do_update(constraint='uq_event_occurrence', set_=values)
+    )
+    db.session.execute(
+        update(Event)
+        .where(Event.event_id == event.event_id)
+        .values(cache_number = Event.cache_number + 1)
+    )
+    # Bump the version of the series as well
+    flag_modified(event, "cache_number")
+
+# Start and end of an event sent by the client. Raises ValueError when they are invalid
+# or when the event ends before it starts.
+def event_times(event):
+    start_time = datetime.fromisoformat(event['start'])
+    end_time = datetime.fromisoformat(event['end'])
+    if end_time < start_time:
+        raise ValueError('Event ends before it starts')
+    return start_time, end_time
+
+# Columns of the event after an edit of the whole series, and whether the occurrences changed,
+# in which case its exceptions no longer apply. Raises ValueError for an invalid recurrence rule.
+def edited_columns(event, new_event):
+    start_time = datetime.fromisoformat(new_event['start'])
+    end_time = datetime.fromisoformat(new_event['end'])
+    rule = new_event.get('recurrence', event.recurrence)
+    series = recurrence.series_columns(rule, new_event.get('recurrence_tz', event.recurrence_tz), start_time, end_time)
+    anchor = start_time if start_time.tzinfo is not None else start_time.replace(tzinfo=timezone.utc)
+    moved = event.recurrence is not None and (series['recurrence'] != event.recurrence or anchor != event.start_time)
+    columns = {
+        'event_name': new_event['title'],
+        'description': new_event['description'],
+        'start_time': start_time,
+        'end_time': end_time,
+        **series
+    }
+    return columns, moved
+
+# Apply an edit of the event modal. With a recurrence_id only that occurrence of the series is changed.
+# Raises ValueError for an invalid occurrence or recurrence rule.
+def edit_event(event, new_event):
+    if new_event.get('recurrence_id'):
+        if event.recurrence is None:
+            raise ValueError('Event is not recurring')
+        override_occurrence(
+            event, datetime.fromisoformat(new_event['recurrence_id']),
+            start_time=datetime.fromisoformat(new_event['start']), end_time=datetime.fromisoformat(new_event['end']),
+            event_name=new_event['title'], description=new_event['description']
+        )
+        return
+
+    columns, moved = edited_columns(event, new_event)
+    if moved:
+        # The occurrences are not the same anymore
+        EventException.query.filter(
+            EventException.event_id == event.event_id
+        ).delete(synchronize_session=False)
+    for name, value in columns.items():
+        setattr(event, name, value)
+    db.session.execute(
+        update(Event)
+        .where(Event.event_id == event.event_id)
+        .values(cache_number = Event.cache_number + 1)
+    )
+
+# Conflicts of an event once edited by update_event, with the calendars of its participants after the edit
+def edited_event_conflicts(event, new_event):
+    start_time = datetime.fromisoformat(new_event['start'])
+    end_time = datetime.fromisoformat(new_event['end'])
+    if new_event.get('recurrence_id'):
+        intervals = recurrence.rule_intervals(None, None, start_time, end_time)
+    else:
+        intervals = recurrence.rule_intervals(
+            new_event.get('recurrence', event.recurrence), new_event.get('recurrence_tz', event.recurrence_tz),
+            start_time, end_time
+        )
+
+    users = set()
+    if event.group_id != 1:
+        users = {
+            user_id for (user_id,) in
+            db.session.query(Participate.user_id).filter(Participate.event_id == event.event_id, Participate.status != 'Declined')
+        }
+        added, _ = resolve_emails(new_event.get('added_participants', []))
+        deleted, _ = resolve_emails(new_event.get('deleted_participants', []))
+        users = (users | set(added.values())) - set(deleted.values())
+    return event_conflicts(conflict_users(event.group_id, users), intervals, event.event_id)
+
 @app.route('/update_event/<int:event_id>', methods=['PUT'])
 @login_required
 def update_event(event_id):
@@ -1233,93 +998,409 @@ def update_event(event_id):
     
     if event.version_number != new_event['version']:
         return jsonify({'error': "Conflicting Update"}), 409
+
+    try:
+        event_times(new_event)
+    except ValueError as error:
+        return jsonify({'error': f'Invalid event: {error}'}), 400
+
+    # Checked before the conflicts, which show the calendars of the participants
+    error = event_permission_error(event.group_id, event.creator, permissions.user_memberships(fresh=True))
+    if error:
+        return jsonify({'error': error[1]}), error[0]
+
+    if new_event.get('check_conflicts'):
+        # The edit is refused when the participants are already booked
+        try:
+            conflicts = edited_event_conflicts(event, new_event)
+        except ValueError as error:
+            return jsonify({'error': f'Invalid recurrence: {error}'}), 400
+        if conflicts:
+            return jsonify({'error': 'Scheduling conflict', 'conflicts': conflicts}), 409
     
     if event.group_id == 1:
         try:
-            event.event_name = new_event['title']
-            event.description = new_event['description']
-            event.start_time = datetime.fromisoformat(new_event['start'])
-            event.end_time = datetime.fromisoformat(new_event['end'])
-            db.session.execute(
-                update(Event)
-                .where(Event.event_id == event_id)
-                .values(cache_number = Event.cache_number + 1)
-            )
+            edit_event(event, new_event)
+            record_event_changes([event_id])
             db.session.commit() 
             return jsonify({'message': 'Event updated successfully'}), 200
         
         except StaleDataError:
             db.session.rollback()
             return jsonify({'error': "Conflicting Update"}), 409
+
+        except ValueError as error:
+            db.session.rollback()
+            return jsonify({'error': f'Invalid recurrence: {error}'}), 400
         
         except:
             db.session.rollback()
             return jsonify({'error' : 'Unable to update event'}), 500
     
-    # Check if the user has the permission to add the event
-    mem = Member.query.filter_by(user_id=current_user.user_id, group_id=event.group_id).first()
-    if not mem:
-        return jsonify({'error': 'Access denied'}), 403
-    permission = mem.permission
-    if permission == 'Viewer':
-        return jsonify({'error': 'Permission denied'}), 403
-    
     try:
-        event.event_name = new_event['title']
-        event.description = new_event['description']
-        event.start_time = datetime.fromisoformat(new_event['start'])
-        event.end_time = datetime.fromisoformat(new_event['end'])
-        db.session.execute(
-            update(Event)
-            .where(Event.event_id == event_id)
-            .values(cache_number = Event.cache_number + 1)
-        )
+        edit_event(event, new_event)
         flag_modified(event, "cache_number")
 
+        # Resolve the emails of all the participant changes at once
+        user_ids, _ = resolve_emails(
+            new_event['added_participants'] + new_event['changed_participants'] + new_event['deleted_participants']
+        )
+
+        affected_users = []
         for email in new_event['added_participants']:
-            user = User.query.filter_by(email=email.strip().lower()).first()
-            if user:
+            user_id = user_ids.get(email.strip().lower())
+            if user_id:
                 participant = Participate(
-                    user_id = user.user_id,
+                    user_id = user_id,
                     event_id = event_id
                 )
-                if user.user_id == current_user.user_id:
+                if user_id == current_user.user_id:
                     participant.status = 'Accepted'
                     participant.read_status = 'Read'
                 db.session.add(participant)
+                affected_users.append(user_id)
         
         for email in new_event['changed_participants']:
-            user = User.query.filter_by(email=email.strip().lower()).first()
-            if user:
-                participant = Participate.query.filter_by(user_id=user.user_id, event_id=event_id).first()
+            user_id = user_ids.get(email.strip().lower())
+            if user_id:
+                participant = Participate.query.filter_by(user_id=user_id, event_id=event_id).first()
                 if participant:
-                    if user.user_id == current_user.user_id:
+                    if user_id == current_user.user_id:
                         participant.status = 'Accepted'
                     else:
                         participant.status = 'Pending'
+                    affected_users.append(user_id)
         
+        removed_users = []
         for email in new_event['deleted_participants']:
-            user = User.query.filter_by(email=email.strip().lower()).first()
-            if user:
-                participant = Participate.query.filter_by(user_id=user.user_id, event_id=event_id).first()
+            user_id = user_ids.get(email.strip().lower())
+            if user_id:
+                participant = Participate.query.filter_by(user_id=user_id, event_id=event_id).first()
                 if participant:
                     db.session.delete(participant)
+                    removed_users.append(user_id)
 
+        record_event_changes([event_id], removed_user_ids=removed_users)
+        notify_counters(affected_users + removed_users)
         db.session.commit() 
         return jsonify({'message': 'Event updated successfully'}), 200
     
     except StaleDataError:
             db.session.rollback()
             return jsonify({'error': "Conflicting Update"}), 409
+
+    except ValueError as error:
+        db.session.rollback()
+        return jsonify({'error': f'Invalid recurrence: {error}'}), 400
     
     except:
         db.session.rollback()
         return jsonify({'error' : 'Unable to update event'}), 500
     
+# Operations of one /events/batch request at most
+MAX_BATCH_SIZE = 500
+
+# Why the current user cannot change an event of the group, as (status, error), or None
+def event_permission_error(group_id, creator, memberships):
+    if group_id == 1:
+        # An individual event is only in the calendar of its creator
+        return None if creator == current_user.user_id else (403, 'Access denied')
+    mem = memberships.get(group_id)
+    if not mem:
+        return 403, 'Access denied'
+    if mem.permission == 'Viewer':
+        return 403, 'Permission denied'
+    return None
+
+# Emails of the participants an operation of a batch refers to
+def operation_emails(operation):
+    if operation.get('op') == 'create':
+        return [participant['name'] for participant in operation.get('participants', [])]
+    if operation.get('op') == 'update' and not operation.get('recurrence_id'):
+        return operation.get('added_participants', []) + operation.get('changed_participants', []) + operation.get('deleted_participants', [])
+    return []
+
+# Create, update and delete events in one request and one transaction.
+# Takes {"operations": [...]}, each with an "op" of "create", "update" or "delete" and the fields of
+# /add_event, /update_event/<event_id> or /remove_event/<event_id> along with the event_id (a delete
+# may carry the version it expects). Every operation is checked first, against the events locked
+# FOR UPDATE, then the valid ones are applied together, with a few statements per kind of change.
+# Answers the result of each operation in order: a status of 200 with the event_id and version,
+# or the status and error the single event routes answer, e.g. 409 for a stale version.
+@app.route('/events/batch', methods=['POST'])
+@login_required
+def batch_events():
+    body = request.get_json(silent=True)
+    operations = body.get('operations') if isinstance(body, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'error': 'Missing operations'}), 400
+    if len(operations) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'At most {MAX_BATCH_SIZE} operations per batch'}), 400
+    if not all(isinstance(operation, dict) for operation in operations):
+        return jsonify({'error': 'Invalid operations'}), 400
+
+    results = [None] * len(operations)
+
+    # The events to change, locked until commit so that their versions cannot change after the check
+    event_ids = {operation.get('event_id') for operation in operations if operation.get('op') in ('update', 'delete')}
+    event_ids = [event_id for event_id in event_ids if isinstance(event_id, int)]
+    events = {}
+    if event_ids:
+        events = {
+            event.event_id: event for event in db.session.scalars(
+                select(Event)
+                .where(Event.event_id.in_(event_ids))
+                .with_for_update()
+                .execution_options(populate_existing=True)
+            )
+        }
+    try:
+        user_ids, unknown_emails = resolve_emails(email for operation in operations for email in operation_emails(operation))
+    except (AttributeError, KeyError, TypeError):
+        return jsonify({'error': 'Invalid operations'}), 400
+    memberships = permissions.user_memberships(fresh=True)
+
+    creates, updates, deletes, cancels = [], [], [], []
+    seen = set()
+    for index, operation in enumerate(operations):
+        op = operation.get('op')
+        try:
+            if op == 'create':
+                group_id = int(operation['group_id'])
+                error = event_permission_error(group_id, current_user.user_id, memberships)
+                if error:
+                    results[index] = {'status': error[0], 'error': error[1]}
+                    continue
+                emails = [participant['name'].strip().lower() for participant in operation.get('participants', [])]
+                unknown = sorted(unknown_emails.intersection(emails))
+                if unknown:
+                    results[index] = {'status': 400, 'error': f"Unknown participants: {', '.join(unknown)}"}
+                    continue
+                start_time, end_time = event_times(operation)
+                try:
+                    series = recurrence.series_columns(operation.get('recurrence'), operation.get('recurrence_tz'), start_time, end_time)
+                except ValueError as error:
+                    results[index] = {'status': 400, 'error': f'Invalid recurrence: {error}'}
+                    continue
+                creates.append((index, {
+                    'event_name': operation['title'],
+                    'description': operation['description'],
+                    'start_time': start_time,
+                    'end_time': end_time,
+                    'cache_number': 0,
+                    'creator': current_user.user_id,
+                    'group_id': group_id,
+                    **series
+                }, [user_ids[email] for email in emails]))
+                continue
+
+            if op not in ('update', 'delete'):
+                results[index] = {'status': 400, 'error': 'Invalid operation'}
+                continue
+            event = events.get(operation.get('event_id'))
+            if not event:
+                results[index] = {'status': 404, 'error': 'Event not found'}
+                continue
+            if event.event_id in seen:
+                results[index] = {'status': 400, 'error': 'Event changed twice in the batch'}
+                continue
+            error = event_permission_error(event.group_id, event.creator, memberships)
+            if error:
+                results[index] = {'status': error[0], 'error': error[1]}
+                continue
+            if op == 'update' and any(field not in operation for field in ('version', 'title', 'description', 'start', 'end')):
+                results[index] = {'status': 400, 'error': 'Invalid operation'}
+                continue
+            if 'version' in operation and event.version_number != operation['version']:
+                results[index] = {'status': 409, 'error': 'Conflicting Update'}
+                continue
+
+            recurrence_id = operation.get('recurrence_id')
+            if recurrence_id:
+                original_start = datetime.fromisoformat(recurrence_id)
+                if event.recurrence is None:
+                    results[index] = {'status': 400, 'error': 'Event is not recurring'}
+                    continue
+            if op == 'update':
+                # Invalid dates make an invalid operation, a ValueError of edited_columns() is then about the rule
+                event_times(operation)
+                edits = None
+                if not recurrence_id:
+                    try:
+                        edits = edited_columns(event, operation)
+                    except ValueError as error:
+                        results[index] = {'status': 400, 'error': f'Invalid recurrence: {error}'}
+                        continue
+                updates.append((index, event, operation, edits))
+            elif recurrence_id:
+                cancels.append((index, event, original_start))
+            else:
+                deletes.append((index, event))
+            seen.add(event.event_id)
+        except ValueError as error:
+            results[index] = {'status': 400, 'error': f'Invalid operation: {error}'}
+        except (KeyError, TypeError, AttributeError):
+            results[index] = {'status': 400, 'error': 'Invalid operation'}
+
+    try:
+        affected_users = set()
+
+        # Deleted events, with their participations and exceptions (ON DELETE CASCADE)
+        deleted_ids = [event.event_id for _, event in deletes]
+        if deleted_ids:
+            record_event_changes(deleted_ids, 'Deleted')
+            affected_users.update(db.session.scalars(
+                select(Participate.user_id).where(Participate.event_id.in_(deleted_ids))
+            ))
+            db.session.execute(
+                delete(Event)
+                .where(Event.event_id.in_(deleted_ids))
+                .execution_options(synchronize_session=False)
+            )
+            for index, event in deletes:
+                db.session.expunge(event)
+                results[index] = {'status': 200, 'event_id': event.event_id}
+
+        # Cancelled occurrences
+        changed_ids = set()
+        for _, event, original_start in cancels:
+            override_occurrence(event, original_start, cancelled=True)
+            changed_ids.add(event.event_id)
+
+        # Created events and their participants, in two statements
+        created_ids = []
+        if creates:
+            if any(columns['group_id'] == 1 for _, columns, _ in creates) and db.session.get(Group, 1) is None:
+                db.session.add(Group(group_name='No Group', description='No Description'))
+                db.session.flush()
+            created_ids = db.session.scalars(
+                insert(Event).returning(Event.event_id, sort_by_parameter_order=True),
+                [columns for _, columns, _ in creates]
+            ).all()
+            participants = [
+                {
+                    'user_id': user_id,
+                    'event_id': event_id,
+                    'read_status': 'Read' if user_id == current_user.user_id else 'Unread',
+                    'status': 'Accepted' if user_id == current_user.user_id else 'Pending'
+                }
+                for (_, _, participant_ids), event_id in zip(creates, created_ids)
+                for user_id in participant_ids
+            ]
+            if participants:
+                # A participant listed twice is only invited once
+                affected_users.update(db.session.scalars(
+                    insert(Participate)
+                    .values(participants)
+                    .on_conflict_do_nothing(constraint='uq_user_event')
+                    .returning(Participate.user_id)
+                ))
+            changed_ids.update(created_ids)
+
+        # Updated series in one UPDATE ... FROM (VALUES ...), their versions were checked under the row locks
+        edited = [(event, edits) for _, event, _, edits in updates if edits is not None]
+        if edited:
+            moved = [event.event_id for event, (_, occurrences_moved) in edited if occurrences_moved]
+            if moved:
+                # The occurrences are not the same anymore
+                db.session.execute(delete(EventException).where(EventException.event_id.in_(moved)))
+            names = list(edited[0][1][0])
+            rows = values(
+                column('event_id', Event.__table__.c.event_id.type),
+                *(column(name, Event.__table__.c[name].type) for name in names),
+                name='edited'
+            ).data([(event.event_id, *(columns[name] for name in names)) for event, (columns, _) in edited])
+            db.session.execute(
+                update(Event)
+                .where(Event.event_id == rows.c.event_id)
+                .values(
+                    version_number=Event.version_number + 1,
+                    cache_number=Event.cache_number + 1,
+                    # NULLs of the VALUES list are untyped
+                    **{name: cast(rows.c[name], Event.__table__.c[name].type) for name in names}
+                )
+                .execution_options(synchronize_session=False)
+            )
+            for event, _ in edited:
+                changed_ids.add(event.event_id)
+
+        # Updated occurrences, and the participants of the updated series
+        added, changed, removed = [], [], []
+        for _, event, operation, edits in updates:
+            if edits is None:
+                edit_event(event, operation)
+                changed_ids.add(event.event_id)
+                continue
+            for email in operation.get('added_participants', []):
+                user_id = user_ids.get(email.strip().lower())
+                if user_id:
+                    added.append({
+                        'user_id': user_id,
+                        'event_id': event.event_id,
+                        'read_status': 'Read' if user_id == current_user.user_id else 'Unread',
+                        'status': 'Accepted' if user_id == current_user.user_id else 'Pending'
+                    })
+            changed += [
+                (user_ids[email.strip().lower()], event.event_id)
+                for email in operation.get('changed_participants', []) if email.strip().lower() in user_ids
+            ]
+            removed += [
+                (user_ids[email.strip().lower()], event.event_id)
+                for email in operation.get('deleted_participants', []) if email.strip().lower() in user_ids
+            ]
+        if added:
+            affected_users.update(db.session.scalars(
+                insert(Participate)
+                .values(added)
+                .on_conflict_do_nothing(constraint='uq_user_event')
+                .returning(Participate.user_id)
+            ))
+        if changed:
+            affected_users.update(db.session.scalars(
+                update(Participate)
+                .where(tuple_(Participate.user_id, Participate.event_id).in_(changed))
+                .values(status=case((Participate.user_id == current_user.user_id, 'Accepted'), else_='Pending'))
+                .returning(Participate.user_id)
+                .execution_options(synchronize_session=False)
+            ))
+        removed_events = {}
+        if removed:
+            for event_id, user_id in db.session.execute(
+                delete(Participate)
+                .where(tuple_(Participate.user_id, Participate.event_id).in_(removed))
+                .returning(Participate.event_id, Participate.user_id)
+                .execution_options(synchronize_session=False)
+            ):
+                removed_events.setdefault(user_id, set()).add(event_id)
+                affected_users.add(user_id)
+
+        record_event_changes(changed_ids, removed_events=removed_events)
+        notify_counters(list(affected_users))
+        # The versions of the occurrence edits are incremented by the flush
+        db.session.flush()
+
+        for (index, _, _), event_id in zip(creates, created_ids):
+            results[index] = {'status': 200, 'event_id': event_id, 'version': 1}
+        for index, event, _, edits in updates:
+            # The series were updated behind the session, from the version checked
+            version = event.version_number + 1 if edits is not None else event.version_number
+            results[index] = {'status': 200, 'event_id': event.event_id, 'version': version}
+        for index, event, _ in cancels:
+            results[index] = {'status': 200, 'event_id': event.event_id, 'version': event.version_number}
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({'error': "Conflicting Update"}), 409
+    except:
+        db.session.rollback()
+        return jsonify({'error': "Unable to apply the batch"}), 500
+
+    return jsonify({'results': results}), 200
+
 @app.route('/exit_group/<int:group_id>', methods=['DELETE'])
 @login_required
 def exit_group(group_id):
-    mem = Member.query.filter_by(user_id=current_user.user_id, group_id=group_id).first()
+    mem = permissions.membership(group_id, fresh=True)
     if mem:
         try:
             if mem.permission == 'Admin':
@@ -1335,13 +1416,49 @@ def exit_group(group_id):
                 if admin_count == 1:
                     return jsonify({'error' : 'Assign an admin before leaving'}), 400
 
-            Participate.query.filter(
-                Participate.event.has(group_id=group_id),
-                Participate.user_id == mem.user_id
-            ).delete(synchronize_session=False)
-            db.session.delete(mem)
+            remove_members(group_id, [current_user.user_id])
+            notify_counters([current_user.user_id])
             db.session.commit()
         except:
             return jsonify({'error' : 'Unable to exit group'}), 500
     
-    return jsonify(success=True), 200
\ No newline at end of file
+    return jsonify(success=True), 200
+
+# Server-Sent Events stream of the changes concerning the current user
+@app.route('/stream')
+@login_required
+def stream():
+    if not app.config['PUSH_ENABLED']:
+        # Tells the EventSource of a stale page to stop reconnecting
+        return '', 204
+
+    user_id = current_user.user_id
+    subscription = push.broker.subscribe(user_id)
+
+    def messages():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    message = subscription.get(timeout=app.config['PUSH_KEEPALIVE'])
+                    yield f'data: {json.dumps(message)}\n\n'
+                except queue.Empty:
+                    # Keeps proxies from closing an idle connection
+                    yield ': keepalive\n\n'
+        finally:
+            push.broker.unsubscribe(user_id, subscription)
+
+    return Response(messages(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+# Request, SQL and serialization totals of this process, in the Prometheus text format
+@app.route('/metrics')
+def metrics():
+    token = app.config['METRICS_TOKEN']
+    if not token:
+        return jsonify({'error': 'Not found'}), 404
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'error': 'Access denied'}), 403
+    return Response(instrumentation.metrics.render() + pool_metrics(db.engine), mimetype='text/plain; version=0.0.4')
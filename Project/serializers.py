@@ -0,0 +1,229 @@
+from Project.models import User, Participate
+from Project.encoding import dumps, loads
+from sqlalchemy import select
+
+# Statement that loads every participant of the given events in a single round trip
+def participants_statement(event_ids):
+    return (
+        select(Participate.event_id, Participate.user_id, Participate.status, User.name, User.email)
+        .join(User, User.user_id == Participate.user_id)
+        .where(Participate.event_id.in_(event_ids))
+        .order_by(Participate.participate_id)
+    )
+
+def new_bucket():
+    return {
+        'participants': [],
+        'Accepted': [],
+        'Pending': [],
+        'Declined': [],
+        'pending_ids': set()
+    }
+
+# Group participant rows by event and by status
+def bucket_participants(rows, encode=False):
+    buckets = {}
+    encoded_users = {}
+    for row in rows:
+        bucket = buckets.get(row.event_id)
+        if bucket is None:
+            bucket = buckets[row.event_id] = new_bucket()
+        if encode:
+            # A user taking part in several events is encoded once
+            participant = encoded_users.get(row.user_id)
+            if participant is None:
+                participant = encoded_users[row.user_id] = PARTICIPANT % (dumps(row.name), dumps(row.email))
+        else:
+            participant = {
+                'name': row.name,
+                'email': row.email
+            }
+        bucket['participants'].append(participant)
+        bucket[row.status].append(participant)
+        if row.status == 'Pending':
+            bucket['pending_ids'].add(row.user_id)
+    return buckets
+
+# Encoders writing the event rows of Project.queries straight to JSON bytes
+# without building a dict per event and participant
+
+PARTICIPANT = b'{"name":%s,"email":%s}'
+
+INDIVIDUAL_EVENT = (
+    b'{"event_id":%d,"title":%s,"description":%s,"start":%s,"end":%s,"event_type":"individual",'
+    b'"is_pending_for_current_user":false,"event_edit_permission":"Admin","version":%d,"cache_number":%d%s}'
+)
+
+# Group events are encoded in two parts around the fields that depend on the user,
+# so that the parts can be shared by the members of the group (see Project.payloads)
+GROUP_EVENT_HEAD = (
+    b'{"event_id":%d,"title":%s,"description":%s,"start":%s,"end":%s,"participants":%s,'
+    b'"accepted_participants":%s,"pending_participants":%s,"declined_participants":%s,'
+    b'"is_pending_for_current_user":'
+)
+
+GROUP_EVENT_TAIL = b',"version":%d,"cache_number":%d%s%s}'
+
+EMPTY_BUCKET = new_bucket()
+EMPTY_IDS = frozenset()
+
+def encode_list(parts):
+    return b'[' + b','.join(parts) + b']'
+
+# Rule and original start of the occurrences of recurring events
+def encode_recurrence(event):
+    if event.recurrence is None:
+        return b''
+    return b',"recurrence":%s,"recurrence_id":%s' % (dumps(event.recurrence), dumps(event.recurrence_id))
+
+def encode_individual_event(event):
+    return INDIVIDUAL_EVENT % (
+        event.event_id,
+        dumps(event.event_name),
+        dumps(event.description),
+        dumps(event.start),
+        dumps(event.end),
+        event.version_number,
+        event.cache_number,
+        encode_recurrence(event)
+    )
+
+# Group events encoded without the fields that depend on the user, as (head, tail, pending user ids)
+# parts, with the participants bucketed by bucket_participants(rows, encode=True)
+def share_group_events(events, buckets, event_type=None):
+    event_type = b',"event_type":%s' % dumps(event_type) if event_type is not None else b''
+    shared = []
+    for event in events:
+        bucket = buckets.get(event.event_id, EMPTY_BUCKET)
+        shared.append((
+            GROUP_EVENT_HEAD % (
+                event.event_id,
+                dumps(event.event_name),
+                dumps(event.description),
+                dumps(event.start),
+                dumps(event.end),
+                encode_list(bucket['participants']),
+                encode_list(bucket['Accepted']),
+                encode_list(bucket['Pending']),
+                encode_list(bucket['Declined'])
+            ),
+            GROUP_EVENT_TAIL % (event.version_number, event.cache_number, event_type, encode_recurrence(event)),
+            bucket['pending_ids']
+        ))
+    return shared
+
+# Complete shared group events with the fields of the user
+def overlay_group_events(shared, user_id, permission):
+    permission = b',"event_edit_permission":' + dumps(permission)
+    return [
+        head + (b'true' if user_id in pending_ids else b'false') + permission + tail
+        for head, tail, pending_ids in shared
+    ]
+
+def encode_group_events(events, buckets, user_id, permission, event_type=None):
+    return overlay_group_events(share_group_events(events, buckets, event_type), user_id, permission)
+
+# Compact format, opted into with ?format=compact or by accepting COMPACT_MIMETYPE.
+# The participants are sent once in a table of [name, email] users, and each group event
+# lists its participants as [user index, status index] pairs in participation order.
+
+COMPACT_MIMETYPE = 'application/vnd.calendar.compact+json'
+
+STATUSES = ('Accepted', 'Pending', 'Declined')
+STATUS_INDEX = {status: index for index, status in enumerate(STATUSES)}
+
+COMPACT_GROUP_EVENT_HEAD = (
+    b'{"event_id":%d,"title":%s,"description":%s,"start":%s,"end":%s,"participants":%s,'
+    b'"is_pending_for_current_user":'
+)
+
+def wants_compact(args, accept):
+    return args.get('format') == 'compact' or COMPACT_MIMETYPE in (accept or '')
+
+# Users table and per-event participant pairs of the participant rows
+def compact_participants(rows):
+    participants = {'users': [], 'events': {}, 'pending_ids': {}}
+    user_index = {}
+    for row in rows:
+        index = user_index.get(row.user_id)
+        if index is None:
+            index = user_index[row.user_id] = len(participants['users'])
+            participants['users'].append(dumps([row.name, row.email]))
+        participants['events'].setdefault(row.event_id, []).append(b'[%d,%d]' % (index, STATUS_INDEX[row.status]))
+        if row.status == 'Pending':
+            participants['pending_ids'].setdefault(row.event_id, set()).add(row.user_id)
+    return participants
+
+def share_compact_group_events(events, participants, event_type=None):
+    event_type = b',"event_type":%s' % dumps(event_type) if event_type is not None else b''
+    return [
+        (
+            COMPACT_GROUP_EVENT_HEAD % (
+                event.event_id,
+                dumps(event.event_name),
+                dumps(event.description),
+                dumps(event.start),
+                dumps(event.end),
+                encode_list(participants['events'].get(event.event_id, ()))
+            ),
+            GROUP_EVENT_TAIL % (event.version_number, event.cache_number, event_type, encode_recurrence(event)),
+            participants['pending_ids'].get(event.event_id, EMPTY_IDS)
+        )
+        for event in events
+    ]
+
+def encode_compact_group_events(events, participants, user_id, permission, event_type=None):
+    return overlay_group_events(share_compact_group_events(events, participants, event_type), user_id, permission)
+
+# Events encoded without the fields that depend on the user, as (individual events, shared group events, users table).
+# The users table of the participants is only sent in the compact format.
+def share_events(individual_events, group_events, participant_rows, event_type=None, compact=False):
+    encoded = [encode_individual_event(event) for event in individual_events]
+    if compact:
+        participants = compact_participants(participant_rows)
+        return encoded, share_compact_group_events(group_events, participants, event_type), participants['users']
+    buckets = bucket_participants(participant_rows, encode=True)
+    return encoded, share_group_events(group_events, buckets, event_type), None
+
+# Shared events as JSON, to keep them outside the process (Project.payloads). The encoded
+# events and fragments are JSON text themselves, they are stored as strings.
+def dump_shared(shared):
+    encoded, group_events, users = shared
+    return dumps([
+        [event.decode() for event in encoded],
+        [[head.decode(), tail.decode(), list(pending_ids)] for head, tail, pending_ids in group_events],
+        [user.decode() for user in users] if users is not None else None
+    ])
+
+def load_shared(data):
+    encoded, group_events, users = loads(data)
+    return (
+        [event.encode() for event in encoded],
+        [(head.encode(), tail.encode(), frozenset(pending_ids)) for head, tail, pending_ids in group_events],
+        [user.encode() for user in users] if users is not None else None
+    )
+
+# JSON body of shared events completed for the user.
+# Returns the encoded list of events and, in the compact format, the participants it refers to.
+def overlay_events(shared, user_id, permission):
+    encoded, group_events, users = shared
+    encoded = encoded + overlay_group_events(group_events, user_id, permission)
+    return encode_list(encoded), {'users': users} if users is not None else None
+
+# JSON body of the given events, with the group events in the regular or compact format.
+# Returns the encoded list of events and, in the compact format, the participants it refers to.
+def encode_events(individual_events, group_events, participant_rows, user_id, permission, event_type=None, compact=False):
+    shared = share_events(individual_events, group_events, participant_rows, event_type, compact)
+    return overlay_events(shared, user_id, permission)
+
+# JSON object of the given (name, encoded value) fields, preceded by the users table in the compact format
+def encode_payload(fields, participants=None):
+    parts = []
+    if participants is not None:
+        parts += [
+            b'"format":"compact"',
+            b'"statuses":' + dumps(STATUSES),
+            b'"users":' + encode_list(participants['users'])
+        ]
+    parts += [dumps(name) + b':' + value for name, value in fields]
+    return b'{' + b','.join(parts) + b'}'
@@ -1,3 +1,6 @@
+// Whether the server pushes the changes through /stream
+const pushEnabled = document.currentScript.dataset.push === '1';
+
 // Global object to track modal resources
 const calendarResources = {
   modalListeners: [],
@@ -5,99 +8,247 @@ const calendarResources = {
 };
 
 // Cache Manager
+// The events of each calendar are kept in IndexedDB, one record per event (or occurrence of a recurring
+// event) keyed by [group_id, eventKey], so that syncing a change only writes the events it touches.
+// The sync cursor, cached date ranges and TTL of each calendar are kept alongside in the calendars store.
 const calendarCache = {
-  // Get cached data
-  get: function (groupId) {
-    const cacheKey = `calendar_events_${groupId}`;
-    const cached = localStorage.getItem(cacheKey);
-    if (!cached) return null;
+  dbName: 'calendar_cache',
+  dbVersion: 1,
+
+  // Open the database once, resolves to null where IndexedDB is unavailable (calendars are then not cached)
+  open: function () {
+    if (!this.dbPromise) {
+      this.dbPromise = new Promise(resolve => {
+        if (!window.indexedDB) {
+          resolve(null);
+          return;
+        }
+        const request = indexedDB.open(this.dbName, this.dbVersion);
+        request.onupgradeneeded = () => {
+          const db = request.result;
+          const events = db.createObjectStore('events', { keyPath: ['group_id', 'key'] });
+          // Events of a calendar by start time, and every occurrence of an event of a calendar
+          events.createIndex('date', ['group_id', 'start']);
+          events.createIndex('event', ['group_id', 'event_id']);
+          db.createObjectStore('calendars', { keyPath: 'group_id' });
+        };
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => resolve(null);
+        request.onblocked = () => resolve(null);
+      });
+      // Calendars used to be cached in localStorage
+      Object.keys(localStorage)
+        .filter(key => key.startsWith('calendar_events_'))
+        .forEach(key => localStorage.removeItem(key));
+    }
+    return this.dbPromise;
+  },
 
-    const { data, timestamp, ttl } = JSON.parse(cached);
+  // Run fn(stores) in a transaction over the given stores, resolves to the value of fn once it completes
+  transaction: function (storeNames, mode, fn) {
+    return this.open().then(db => {
+      if (!db) return null;
+      return new Promise((resolve, reject) => {
+        const transaction = db.transaction(storeNames, mode);
+        const stores = Object.fromEntries(storeNames.map(name => [name, transaction.objectStore(name)]));
+        const result = fn(stores);
+        transaction.oncomplete = () => resolve(typeof result === 'function' ? result() : result);
+        transaction.onerror = () => reject(transaction.error);
+        transaction.onabort = () => reject(transaction.error);
+      });
+    });
+  },
 
-    // Check if cache is expired (default 1 hour TTL)
-    const now = new Date().getTime();
-    if (now > timestamp + (ttl || 3600000)) {
-      localStorage.removeItem(cacheKey);
-      return null;
+  // Delete every record of the index ranges, then call done() within the same transaction.
+  // The keys are collected before anything is deleted, so the records written by done() are kept.
+  deleteRanges: function (index, ranges, done = () => {}) {
+    let pending = ranges.length;
+    if (pending === 0) {
+      done();
+      return;
     }
+    ranges.forEach(range => {
+      index.getAllKeys(range).onsuccess = (e) => {
+        e.target.result.forEach(key => index.objectStore.delete(key));
+        if (--pending === 0) done();
+      };
+    });
+  },
 
-    return { data, timestamp, ttl };
+  // Get the sync cursor, cached date ranges and TTL of a calendar, or null if it is not cached or expired
+  get: function (groupId) {
+    groupId = Number(groupId);
+    return this.transaction(['calendars'], 'readonly', ({ calendars }) => {
+      const request = calendars.get(groupId);
+      return () => request.result;
+    }).then(cached => {
+      if (!cached) return null;
+
+      // Check if cache is expired (default 1 hour TTL)
+      const now = new Date().getTime();
+      if (now > cached.timestamp + (cached.ttl || 3600000)) {
+        return this.clear(groupId).then(() => null);
+      }
+      return cached;
+    });
   },
 
-  // Store data in cache
-  set: function (groupId, data, ttl = 3600000) {
-    const cacheKey = `calendar_events_${groupId}`;
-    const cacheValue = {
-      data,
-      timestamp: new Date().getTime(),
-      ttl
-    };
-    localStorage.setItem(cacheKey, JSON.stringify(cacheValue));
+  // Cached events of a calendar overlapping the [start, end) date range, read through the date index
+  getRange: function (groupId, start, end) {
+    groupId = Number(groupId);
+    const rangeStart = Date.parse(start);
+    const rangeEnd = Date.parse(end);
+    return this.transaction(['events'], 'readonly', ({ events }) => {
+      const request = events.index('date').getAll(IDBKeyRange.bound([groupId, -Infinity], [groupId, rangeEnd], false, true));
+      return () => request.result.filter(record => record.end > rangeStart).map(record => record.event);
+    }).then(data => data || []);
   },
 
-  // Clear entire cache 
-  clearAll: function () {
-    Object.keys(localStorage).forEach(key => {
-      localStorage.removeItem(key);
+  // Replace the cached events of a calendar
+  set: function (groupId, data, ttl = 3600000, sync = {}) {
+    groupId = Number(groupId);
+    return this.transaction(['events', 'calendars'], 'readwrite', ({ events, calendars }) => {
+      events.delete(IDBKeyRange.bound([groupId], [groupId, []]));
+      data.forEach(event => events.put(this.record(groupId, event)));
+      calendars.put(this.calendar(groupId, new Date().getTime(), ttl, sync));
     });
   },
 
-  // Clear specific cache entries
-  clear: function (groupId) {
-    Object.keys(localStorage).forEach(key => {
-      if (key.startsWith(`calendar_events_${groupId}`)) {
-        localStorage.removeItem(key);
-      }
+  // Apply synced changes to the cached events of a calendar: delete every occurrence of the deleted events,
+  // then insert or replace the updated ones, and store the new sync cursor and date ranges
+  merge: function (groupId, cached, updatedEvents, deletedEventIds, sync) {
+    groupId = Number(groupId);
+    return this.transaction(['events', 'calendars'], 'readwrite', ({ events, calendars }) => {
+      const deleted = [...new Set(deletedEventIds)].map(eventId => IDBKeyRange.only([groupId, eventId]));
+      this.deleteRanges(events.index('event'), deleted, () => {
+        updatedEvents.forEach(event => events.put(this.record(groupId, event)));
+        // Keep original timestamp and TTL
+        calendars.put(this.calendar(groupId, cached.timestamp, cached.ttl, sync));
+      });
     });
   },
 
-  // Clear specific event from the cache entries
-  clearEvent: function (groupId, eventId) {
-    const cacheKey = `calendar_events_${groupId}`;
-    const cached = localStorage.getItem(cacheKey);
+  record: function (groupId, event) {
+    return {
+      group_id: groupId,
+      key: eventKey(event),
+      event_id: event.event_id,
+      start: Date.parse(event.start),
+      end: Date.parse(event.end),
+      event
+    };
+  },
 
-    if (!cached) return; // No cache exists for this group
+  calendar: function (groupId, timestamp, ttl, sync) {
+    return { group_id: groupId, timestamp, ttl, cursor: sync.cursor, ranges: sync.ranges };
+  },
 
-    try {
-      const { data, timestamp, ttl } = JSON.parse(cached);
+  // Clear entire cache
+  clearAll: function () {
+    return this.transaction(['events', 'calendars'], 'readwrite', ({ events, calendars }) => {
+      events.clear();
+      calendars.clear();
+    });
+  },
 
-      // Filter out the event to be removed
-      const updatedEvents = data.filter(event => event.event_id !== eventId);
+  // Clear the cache of a calendar
+  clear: function (groupId) {
+    groupId = Number(groupId);
+    return this.transaction(['events', 'calendars'], 'readwrite', ({ events, calendars }) => {
+      events.delete(IDBKeyRange.bound([groupId], [groupId, []]));
+      calendars.delete(groupId);
+    });
+  },
 
-      // Only update cache if something was actually removed
-      if (updatedEvents.length !== data.length) {
-        const newCacheValue = {
-          data: updatedEvents,
-          timestamp, // Keep original timestamp
-          ttl       // Keep original TTL
-        };
-        localStorage.setItem(cacheKey, JSON.stringify(newCacheValue));
-        return true; // Indicate success
-      }
-      return false; // No changes made
-    } catch (e) {
+  // Clear specific event, and all its occurrences, from the cache of a calendar
+  clearEvent: function (groupId, eventId) {
+    groupId = Number(groupId);
+    return this.transaction(['events'], 'readwrite', ({ events }) => {
+      this.deleteRanges(events.index('event'), [IDBKeyRange.only([groupId, eventId])]);
+    }).catch(e => {
       console.error('Error processing cache:', e);
-      return false;
-    }
+    });
   }
 };
 
 // For Clearing the cache when the user signout
 document.getElementById('signout-navbar')?.addEventListener('click', function (e) {
   e.preventDefault();
-  calendarCache.clearAll(); // clear only our app's cache
-  window.location.href = this.href;  // proceed with signout after clearing the cache
+  // proceed with signout after clearing the cache
+  calendarCache.clearAll().finally(() => { window.location.href = this.href; });
 });
 document.getElementById('signout-sidebar')?.addEventListener('click', function (e) {
   e.preventDefault();
-  calendarCache.clearAll(); // clear only our app's cache
-  window.location.href = this.href;  // proceed with signout after clearing the cache
+  // proceed with signout after clearing the cache
+  calendarCache.clearAll().finally(() => { window.location.href = this.href; });
 });
 
 // For Check Invite
 let checkInvt = document.querySelector('#check-invites-link');
 
 // Helper functions
+
+// Key of a cached event, the occurrences of a recurring event share its event_id
+function eventKey(event) {
+  return event.recurrence_id ? `${event.event_id}@${event.recurrence_id}` : `${event.event_id}`;
+}
+
+// Expand the events of a compact payload (?format=compact), whose group events list their
+// participants as [user index, status index] pairs into the users table of the payload
+function expandCompactEvents(payload, events) {
+  if (payload.format !== 'compact') {
+    return events;
+  }
+  return events.map(event => {
+    if (!event.participants) {
+      return event;
+    }
+    const byStatus = { Accepted: [], Pending: [], Declined: [] };
+    const participants = event.participants.map(([userIndex, statusIndex]) => {
+      const [name, email] = payload.users[userIndex];
+      const participant = { name, email };
+      byStatus[payload.statuses[statusIndex]].push(participant);
+      return participant;
+    });
+    return {
+      ...event,
+      participants,
+      accepted_participants: byStatus.Accepted,
+      pending_participants: byStatus.Pending,
+      declined_participants: byStatus.Declined
+    };
+  });
+}
+
+// Listen to the changes pushed by the server for the current user
+function subscribe_to_updates(calendar) {
+  if (!pushEnabled || !window.EventSource) return;
+
+  let refetchTimer = null;
+  const source = new EventSource('/stream');
+  source.onmessage = function (e) {
+    const message = JSON.parse(e.data);
+    if (message.type === 'counts') {
+      show_pending_invites_count(message.pending_invites);
+      show_unread_notifications_count(message.unread_notifications);
+    } else if (message.type === 'event') {
+      const group_id = Number(document.getElementById('group-select').value);
+      if (message.group_id !== group_id) return;
+
+      // Coalesce a burst of changes into a single refetch
+      clearTimeout(refetchTimer);
+      refetchTimer = setTimeout(() => calendar.refetchEvents(), 200);
+    }
+  };
+}
+
+// Check whether a date range lies inside one of the cached date ranges
+function isRangeCached(ranges, [start, end]) {
+  return ranges.some(([cachedStart, cachedEnd]) =>
+    Date.parse(cachedStart) <= Date.parse(start) && Date.parse(end) <= Date.parse(cachedEnd)
+  );
+}
+
 function getInitials(name) {
   if (!name) return '';
   const parts = name.split(' ').filter(part => part.length > 0);
@@ -225,98 +376,98 @@ function load_calendar() {
     events: function (fetchInfo, successCallback, failureCallback) {
       const group_id = document.getElementById('group-select').value;
 
-      // Try to get from cache first
-      const cachedObj = calendarCache.get(group_id);
-      if (cachedObj) {
-        const cachedData = cachedObj.data;
-
-        // 1. Prepare version map from cache
-        const versionMap = cachedData.map(event => ({
-          event_id: event.event_id,
-          cache_number: event.cache_number
-        }));
+      // Only request the events overlapping the visible date range
+      const windowRange = [fetchInfo.startStr, fetchInfo.endStr];
+      const windowParams = new URLSearchParams({
+        start: fetchInfo.startStr,
+        end: fetchInfo.endStr
+      }).toString();
 
-        // 2. Request only updated events
-        fetch(`/data/${group_id}/updates`, {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify({
-            events: versionMap
-          })
+      // Fetch the events of the visible date range along with the sync cursor of the calendar
+      const fetchWindow = () => fetch(`/data/${group_id}?${windowParams}&format=compact`)
+        .then(async (response) => {
+          const payload = await response.json();
+          if (!response.ok) {
+            throw new Error(payload.error);
+          }
+          const data = expandCompactEvents(payload, payload.events);
+          return { data, cursor: Number(response.headers.get('X-Sync-Cursor')) };
+        });
+
+      // Show the events of the visible date range
+      const finish = (data) => {
+        fetch_counts(); // Refresh the notification and invite counts
+
+        successCallback(data);
+      };
+
+      const loadCalendar = () => fetchWindow()
+        .then(({ data, cursor }) => {
+          // Replace the cached events of the calendar, the events are shown without waiting for the cache
+          calendarCache.set(group_id, data, undefined, { cursor, ranges: [windowRange] }).catch(error => {
+            console.error('Error processing cache:', error);
+          });
+          finish(data);
         })
+        .catch(error => {
+          showFlashMessage('error', error.message);
+          failureCallback(error);
+        });
+
+      // Try to get from cache first
+      calendarCache.get(group_id).catch(() => null).then(cachedObj => {
+        if (!cachedObj || cachedObj.cursor === undefined) {
+          loadCalendar();
+          return;
+        }
+
+        // 1. Request only the events changed since the cached sync cursor,
+        // with the changed recurring events expanded over the cached date ranges
+        const cachedRanges = cachedObj.ranges || [];
+        const updateParams = new URLSearchParams({ since: cachedObj.cursor, format: 'compact' });
+        if (cachedRanges.length > 0) {
+          updateParams.set('start', cachedRanges.reduce((min, range) => new Date(range[0]) < new Date(min) ? range[0] : min, cachedRanges[0][0]));
+          updateParams.set('end', cachedRanges.reduce((max, range) => new Date(range[1]) > new Date(max) ? range[1] : max, cachedRanges[0][1]));
+        }
+        fetch(`/data/${group_id}/updates?${updateParams.toString()}`)
           .then(async (response) => {
             const updates = await response.json();
             if (!response.ok) {
               throw new Error(updates.error);
             }
 
-            const newAndUpdatedEvents = updates.updated_events;
-            const deletedEventIds = updates.deleted_events;
-
-            // 3. Merge updates with cache
-
-            // Delete the cached events that are not in the database anymore
-            deletedEventIds.forEach(deleted_event_id => {
-              calendarCache.clearEvent(group_id, deleted_event_id);
-            });
-
-            // Create a copy of cached data to modify
-            let mergedData = [...cachedData];
+            if (updates.resync) {
+              // The cached cursor is unknown to the server, reload the calendar
+              loadCalendar();
+              return;
+            }
 
-            // Remove deleted events from the merged data
-            mergedData = mergedData.filter(event =>
-              !deletedEventIds.includes(event.event_id)
+            // 2. The occurrences of a changed recurring event replace all its cached ones
+            let updatedEvents = expandCompactEvents(updates, updates.updated_events);
+            const deletedEvents = updates.deleted_events.concat(
+              updatedEvents.filter(event => event.recurrence_id).map(event => event.event_id)
             );
 
-            // Process updates
-            newAndUpdatedEvents.forEach(update => {
-              const existingIndex = mergedData.findIndex(e => e.event_id === update.event_id);
-
-              if (existingIndex >= 0) {
-                // Update existing event (preserve unchanged fields)
-                mergedData[existingIndex] = {
-                  ...mergedData[existingIndex],
-                  ...update
-                };
-              } else {
-                // Add new event
-                mergedData.push(update);
-              }
-            });
-
-            // 4. Update cache and callback
-            calendarCache.set(group_id, mergedData, cachedObj.ttl);
+            // 3. Load the visible date range if it has not been cached yet
+            let ranges = cachedRanges;
+            if (!isRangeCached(ranges, windowRange)) {
+              const snapshot = await fetchWindow();
+              updatedEvents = updatedEvents.concat(snapshot.data);
+              ranges = [...ranges, windowRange];
+            }
 
-            fetch_unread_notifications_count();   // Refresh the notification count
-            fetch_pending_invites_count(); // Refresh the invite count
+            // 4. Merge updates with cache, keeping the cursor of the updates:
+            // cached events outside the window are only synced up to it
+            await calendarCache.merge(group_id, cachedObj, updatedEvents, deletedEvents, { cursor: updates.cursor, ranges });
 
-            successCallback(mergedData);
+            // 5. Read the events of the visible date range back from the cache
+            finish(await calendarCache.getRange(group_id, windowRange[0], windowRange[1]));
           })
           .catch(error => {
             showFlashMessage('error', error.message);
+            failureCallback(error);
           });
-        return;
-      }
-
-      fetch(`/data/${group_id}`)
-        .then(async (response) => {
-          const data = await response.json();
-          if (!response.ok) {
-            throw new Error(data.error);
-          }
-          calendarCache.set(group_id, data);
-
-          fetch_unread_notifications_count();   // Refresh the notification count
-          fetch_pending_invites_count(); // Refresh the invite count
-
-          successCallback(data);
-        })
-        .catch(error => {
-          showFlashMessage('error', error.message);
-          failureCallback(error);
-        });
+      });
     },
     eventClick: function (info) {
 
@@ -836,6 +987,8 @@ function load_calendar() {
             contentType: 'application/json',
             data: JSON.stringify({
               version: event.extendedProps.version,
+              // Only this occurrence of a recurring event is changed
+              recurrence_id: event.extendedProps.recurrence_id,
               title: eventTitle,
               start: eventStart,
               end: eventEnd,
@@ -877,13 +1030,21 @@ function load_calendar() {
       function removeEvent(event) {
         $('#modal-view-event').modal('hide');
         var event_id = event.extendedProps.event_id;
+        var recurrence_id = event.extendedProps.recurrence_id;
         $.ajax({
-          url: `/remove_event/${event_id}`,
+          // Only this occurrence of a recurring event is cancelled
+          url: recurrence_id ? `/remove_event/${event_id}?recurrence_id=${encodeURIComponent(recurrence_id)}` : `/remove_event/${event_id}`,
           type: 'DELETE',
           contentType: 'application/json',
           success: function (response) {
             // Clear cache when group changes
             const group_id = document.getElementById('group-select').value;
+            if (recurrence_id) {
+              // The series changed, sync it through the updates
+              calendar.refetchEvents();
+              showFlashMessage('success', response.message);
+              return;
+            }
             if (group_id !== 1) {
               // Clear cache of the dashboard as it might have changed due to group event
               calendarCache.clearEvent(1, event_id);
@@ -1119,6 +1280,8 @@ function load_calendar() {
         const description = $('#eventDescription').val().trim();
         const userGroup = $('#group-select').val();
         const participants = getSelectedParticipants();
+        const repeat = $('#eventRepeat').val();
+        const repeatUntil = $('#eventRepeatUntil').val();
 
         $('.is-invalid').removeClass('is-invalid');
         $('.invalid-feedback').hide();
@@ -1143,6 +1306,11 @@ function load_calendar() {
           isValid = false;
         }
 
+        if (repeat && repeatUntil && eventStart && new Date(repeatUntil) < new Date(eventStart.slice(0, 10))) {
+          showError('eventRepeatUntil', 'The repetition must end after the start time');
+          isValid = false;
+        }
+
         if (userGroup != 1 && participants.length === 0) {
           showError('eventParticipantsList', 'Please select at least one participant');
           isValid = false;
@@ -1152,17 +1320,22 @@ function load_calendar() {
           document.getElementById('add-event').reset();
           $('#modal-view-event-add').modal('hide');
 
-          $.ajax({
+          // The server refuses an event whose participants are already booked, unless confirmed
+          const postEvent = (checkConflicts) => $.ajax({
             url: '/add_event',
             type: 'POST',
             contentType: 'application/json',
             data: JSON.stringify({
+              check_conflicts: checkConflicts,
               title: eventTitle,
               start: eventStart,
               end: eventEnd,
               description: description,
               group_id: userGroup,
-              participants: participants
+              participants: participants,
+              // e.g. FREQ=WEEKLY;UNTIL=20261231, the times of the modal are sent and shown as UTC
+              recurrence: repeat ? `FREQ=${repeat}` + (repeatUntil ? `;UNTIL=${repeatUntil.replaceAll('-', '')}` : '') : null,
+              recurrence_tz: repeat ? 'UTC' : null
             }),
             success: function (response) {
               // Clear cache when group changes
@@ -1174,6 +1347,13 @@ function load_calendar() {
             },
             error: function (response) {
               const errorResponse = JSON.parse(response.responseText);
+              if (response.status === 409 && errorResponse.conflicts) {
+                const booked = Object.keys(errorResponse.conflicts).join(', ');
+                if (confirm(`${booked} already have events at that time. Add the event anyway?`)) {
+                  postEvent(false);
+                }
+                return;
+              }
               // Clear cache when group changes
               const group_id = document.getElementById('group-select').value;
               calendarCache.clear(group_id);
@@ -1187,6 +1367,7 @@ function load_calendar() {
               showFlashMessage('error', errorResponse.error);
             }
           });
+          postEvent(true);
         }
       }
 
@@ -1197,6 +1378,9 @@ function load_calendar() {
   // To render the calendar
   calendar.render();
 
+  // Refresh the calendar when the server pushes a change
+  subscribe_to_updates(calendar);
+
   // Group selection change handler
   document.getElementById('group-select').addEventListener('change', function () {
     calendar.removeAllEvents();
@@ -1259,22 +1443,27 @@ function load_calendar() {
     // Show modal
     modal.show();
 
-    // Fetch invites from server
-    $.ajax({
-      url: '/check_invites',
+    // Fetch invites from server, a page at a time from the cursor of the previous page
+    const loadInvites = (before) => $.ajax({
+      url: before ? `/check_invites?before=${encodeURIComponent(before)}` : '/check_invites',
       type: 'GET',
       success: function (response) {
         const container = $('#invitesContainer');
-        container.empty();
+        if (!before) {
+          container.empty();
+        }
+        $('#invitesLoadMore').remove();
 
-        if (response.length === 0) {
+        if (!before && response.invites.length === 0) {
           container.html('<div class="text-center py-3"><p>No pending invitations</p></div>');
           return;
         }
 
-        // Separate group and event invites
-        const groupInvites = response.filter(invite => invite.type === 'group');
-        const eventInvites = response.filter(invite => invite.type === 'event');
+        // Event times are sent as timestamps and shown in the time of the browser
+        const formatTime = (timestamp) => new Date(timestamp).toLocaleString([], {
+          dateStyle: 'medium',
+          timeStyle: 'short'
+        });
 
         // Group invite template
         const groupInviteHTML = (invite) => `
@@ -1328,7 +1517,7 @@ function load_calendar() {
                   <div class="d-flex flex-wrap mt-1 gap-2">
                       <small class="text-muted">
                           <i class="bi bi-clock me-1"></i>
-                          ${invite.start_time} - ${invite.end_time}
+                          ${formatTime(invite.start_time)} - ${formatTime(invite.end_time)}
                       </small>
                       <small class="text-muted">
                           <i class="bi bi-person me-1"></i>
@@ -1346,24 +1535,21 @@ function load_calendar() {
               </div>
           </div>`;
 
-        if (groupInvites.length > 0) {
-          groupInvites.forEach(invite => {
-            if (invite.description.length == 0)
-              invite.description = "No description";
-            container.append(groupInviteHTML(invite));
-          });
-        }
+        // Newest invites first
+        response.invites.forEach(invite => {
+          if (!invite.description)
+            invite.description = "No description";
+          container.append(invite.type === 'group' ? groupInviteHTML(invite) : eventInviteHTML(invite));
+        });
 
-        if (eventInvites.length > 0) {
-          eventInvites.forEach(invite => {
-            if (invite.description.length == 0)
-              invite.description = "No description";
-            container.append(eventInviteHTML(invite));
-          });
+        if (response.next) {
+          const loadMore = $('<div class="list-group-item text-center py-2" id="invitesLoadMore"><button type="button" class="btn btn-link btn-sm">Load more</button></div>');
+          loadMore.find('button').on('click', () => loadInvites(response.next));
+          container.append(loadMore);
         }
 
-        // Setup description click handlers
-        $('.description-short').click(function () {
+        // Setup description click handlers, once per invite
+        $('.description-short').off('click').click(function () {
           const fullDesc = $(this).data('full-desc');
           const title = $(this).data('title');
 
@@ -1375,13 +1561,13 @@ function load_calendar() {
         });
 
         // Setup accept/decline button handlers
-        $('.accept-btn').click(function () {
+        $('.accept-btn').off('click').click(function () {
           const id = $(this).data('id');
           const type = $(this).data('type');
           respondToInvite(id, type, 'Accepted');
         });
 
-        $('.decline-btn').click(function () {
+        $('.decline-btn').off('click').click(function () {
           const id = $(this).data('id');
           const type = $(this).data('type');
           respondToInvite(id, type, 'Declined');
@@ -1393,6 +1579,7 @@ function load_calendar() {
         );
       }
     });
+    loadInvites();
 
     function respondToInvite(id, type, status) {
       $.ajax({
@@ -1424,8 +1611,7 @@ function load_calendar() {
                   );
                 });
 
-                fetch_unread_notifications_count();   // Refresh the notification count
-                fetch_pending_invites_count(); // Refresh the invite count
+                fetch_counts(); // Refresh the notification and invite counts
               },
               error: function () {
                 $('#group-select').html('<option value="" disabled>Error loading groups</option>');
@@ -1481,8 +1667,7 @@ function load_calendar() {
           const errorResponse = JSON.parse(response.responseText);
           showFlashMessage('error', errorResponse.error);
           modal.hide();
-          fetch_unread_notifications_count();   // Refresh the notification count
-          fetch_pending_invites_count(); // Refresh the invite count
+          fetch_counts(); // Refresh the notification and invite counts
         }
       });
     }
@@ -1989,8 +2174,7 @@ const notificationBadge = document.getElementById('notificationBadge');
 
 // Fetch number of unread notifications on page load
 document.addEventListener('DOMContentLoaded', function () {
-  fetch_unread_notifications_count();
-  fetch_pending_invites_count(); // Fetch pending invites count
+  fetch_counts(); // Refresh the notification and invite counts
 });
 
 // Toggle notification popover
@@ -2035,58 +2219,53 @@ document.addEventListener('click', (e) => {
 });
 
 
-// Fetch pending invites count
-function fetch_pending_invites_count() {
-  $.ajax({
-    url: '/get_pending_invites_count',
-    type: 'GET',
-    success: function (response) {
-      const pendingCount = response;
-      const pendingInvitesBadge = document.getElementById('inviteBadge');
-      const invites_icon = document.getElementById('invites-icon');
-      if (pendingCount > 0) {
-        pendingInvitesBadge.textContent = pendingCount;
-        if (pendingInvitesBadge.classList.contains('d-none')) {
-          pendingInvitesBadge.classList.remove('d-none');
-          invites_icon.classList.add('active');
-        }
-      }
-      else {
-        pendingInvitesBadge.textContent = 0;
-        if (!pendingInvitesBadge.classList.contains('d-none')) {
-          pendingInvitesBadge.classList.add('d-none');
-          invites_icon.classList.remove('active');
-        }
-      }
-    },
-    error: function () {
-      showFlashMessage('error', 'Error fetching pending invites count');
+// Show pending invites count
+function show_pending_invites_count(pendingCount) {
+  const pendingInvitesBadge = document.getElementById('inviteBadge');
+  const invites_icon = document.getElementById('invites-icon');
+  if (pendingCount > 0) {
+    pendingInvitesBadge.textContent = pendingCount;
+    if (pendingInvitesBadge.classList.contains('d-none')) {
+      pendingInvitesBadge.classList.remove('d-none');
+      invites_icon.classList.add('active');
     }
-  });
+  }
+  else {
+    pendingInvitesBadge.textContent = 0;
+    if (!pendingInvitesBadge.classList.contains('d-none')) {
+      pendingInvitesBadge.classList.add('d-none');
+      invites_icon.classList.remove('active');
+    }
+  }
 }
 
-// Fetch unread notifications count
-function fetch_unread_notifications_count() {
+// Show unread notifications count
+function show_unread_notifications_count(unreadCount) {
   // Check if the notification badge exists before trying to access it
   if (notificationBadge === null) return;
 
+  notificationBadge.textContent = unreadCount;
+  if (unreadCount > 0) {
+    // Show the badge if there are unread notifications
+    if (notificationBadge.classList.contains('d-none')) {
+      notificationBadge.classList.remove('d-none');
+    }
+  } else {
+    // Hide the badge if there are no unread notifications
+    if (!notificationBadge.classList.contains('d-none')) {
+      notificationBadge.classList.add('d-none');
+    }
+  }
+}
+
+// Fetch pending invites and unread notifications counts in one request
+function fetch_counts() {
   $.ajax({
-    url: '/get_unread_notifications_count',
+    url: '/counts',
     type: 'GET',
     success: function (response) {
-      const unreadCount = response;
-      notificationBadge.textContent = unreadCount;
-      if (unreadCount > 0) {
-        // Show the badge if there are unread notifications
-        if (notificationBadge.classList.contains('d-none')) {
-          notificationBadge.classList.remove('d-none');
-        }
-      } else {
-        // Hide the badge if there are no unread notifications
-        if (!notificationBadge.classList.contains('d-none')) {
-          notificationBadge.classList.add('d-none');
-        }
-      }
+      show_pending_invites_count(response.pending_invites);
+      show_unread_notifications_count(response.unread_notifications);
     },
     error: function () {
       showFlashMessage('error', 'Error fetching notifications count');
@@ -2094,59 +2273,78 @@ function fetch_unread_notifications_count() {
   });
 }
 
-// Function to get notifications
-function get_notifications() {
+// How long ago a timestamp of the server was, e.g. "3 hours ago"
+function timeAgo(timestamp) {
+  const seconds = (Date.now() - new Date(timestamp).getTime()) / 1000;
+  if (seconds < 0) {
+    return 'in the future';
+  }
+
+  const intervals = [
+    ['year', 31536000],   // 365 * 24 * 3600
+    ['month', 2592000],   // 30 * 24 * 3600
+    ['week', 604800],     // 7 * 24 * 3600
+    ['day', 86400],       // 24 * 3600
+    ['hour', 3600],
+    ['minute', 60],
+    ['second', 1]
+  ];
+  for (const [name, count] of intervals) {
+    const value = Math.floor(seconds / count);
+    if (value >= 1) {
+      return value === 1 ? `${value} ${name} ago` : `${value} ${name}s ago`;
+    }
+  }
+  return 'Just Now';
+}
+
+// Function to get notifications, a page at a time from the cursor of the previous page
+function get_notifications(before) {
   $.ajax({
-    url: '/get_notifications',
+    url: before ? `/get_notifications?before=${encodeURIComponent(before)}` : '/get_notifications',
     type: 'GET',
     success: function (response) {
       // Process and display notifications
       const notificationsContainer = $('#notificationList');
-      notificationsContainer.empty();
-
-      // Update the number of unread notifications
-      const unreadCount = response.length;
-      if (unreadCount > 0) {
-        notificationBadge.textContent = unreadCount;
-        notificationBadge.classList.remove('d-none');
-      } else {
-        notificationBadge.classList.add('d-none');
+      if (!before) {
+        notificationsContainer.empty();
+        fetch_counts(); // Update the number of unread notifications
       }
+      $('#notificationLoadMore').remove();
 
       // No notifications available
-      if (response.length === 0) {
+      if (!before && response.notifications.length === 0) {
         notificationsContainer.html('<div class="text-center py-3"><p>No unread notifications</p></div>');
         return;
       }
 
-      response.forEach((notification, index, array) => {
-        // Check if this notification is the last one in the list
-        if (index === array.length - 1) {
-          const notificationHTML = `
-              <div class="notification-item ${(notification.read_status === "Read") ? '' : 'unread'} last-notification" data-id="${notification.id}" data-type="${notification.type}">
+      notificationsContainer.find('.last-notification').removeClass('last-notification');
+      const notificationItems = response.notifications.map((notification, index, array) => {
+        // The last notification of the last page
+        const last = index === array.length - 1 && !response.next;
+        return $(`
+              <div class="notification-item ${(notification.read_status === "Read") ? '' : 'unread'} ${last ? 'last-notification' : ''}" data-id="${notification.id}" data-type="${notification.type}">
                   <div class="p-3 notification-content">
                       <p class="mb-0">You have been invited to ${(notification.type === 'group') ? 'group ' : 'event '} ${notification.name}</p>
                   </div>
-                  <div class="notification-footer p-2">${notification.passed_time}</div>
-              </div>`;
-          notificationsContainer.append(notificationHTML);
-        }
-        else {
-          const notificationHTML = `
-              <div class="notification-item ${(notification.read_status === "Read") ? '' : 'unread'}" data-id="${notification.id}" data-type="${notification.type}">
-                  <div class="p-3 notification-content">
-                      <p class="mb-0">You have been invited to ${(notification.type === 'group') ? 'group ' : 'event '} ${notification.name}</p>
-                  </div>
-                  <div class="notification-footer p-2">${notification.passed_time}</div>
-              </div>`;
-          notificationsContainer.append(notificationHTML);
-        }
+                  <div class="notification-footer p-2">${timeAgo(notification.invite_time)}</div>
+              </div>`);
       });
+      notificationsContainer.append(notificationItems);
+
+      if (response.next) {
+        const loadMore = $('<div class="text-center p-2" id="notificationLoadMore"><button type="button" class="btn btn-link btn-sm">Load more</button></div>');
+        loadMore.find('button').on('click', (e) => {
+          e.stopPropagation();
+          get_notifications(response.next);
+        });
+        notificationsContainer.append(loadMore);
+      }
 
       /* Setup click handlers for notifications */
       // Mark notifications as read when clicked
-      const unread_notifications = document.querySelectorAll('.notification-item.unread');
-      unread_notifications.forEach(notification => {
+      notificationItems.forEach(item => {
+        const notification = item[0];
         notification.addEventListener('click', () => {
           // Check if notification is already read
           if (!notification.classList.contains('unread')) return;
@@ -2165,17 +2363,15 @@ function get_notifications() {
             }),
             success: function () {
               notification.classList.remove('unread');
-              updateNotificationCount(); // Update the notification count
+              fetch_counts(); // Update the notification count
             },
             error: function () {
               showFlashMessage('error', 'Error marking notification as read');
             }
           });
         });
-      });
 
-      // Disable text selection on double click with mousedown
-      unread_notifications.forEach(notification => {
+        // Disable text selection on double click with mousedown
         notification.addEventListener('mousedown', function (e) {
           e.preventDefault();
         }, false);
@@ -2185,22 +2381,6 @@ function get_notifications() {
       showFlashMessage('error', 'Error loading notifications. Please try again later.');
     },
   });
-
-  // Update notification badge count
-  function updateNotificationCount() {
-    const unreadCount = document.querySelectorAll('.notification-item.unread').length;
-    const notificationBadge = document.getElementById('notificationBadge');
-
-    // Check if the badge is hidden, then unhide it
-    if (notificationBadge.classList.contains('d-none')) {
-      notificationBadge.classList.remove('d-none');
-    }
-    // Update the badge count
-    notificationBadge.textContent = unreadCount;
-    if (unreadCount === 0) {
-      notificationBadge.classList.add('d-none');
-    }
-  }
 }
 
 // ------------------------------------ NOTIFICATION HANDLER --------------------------------------------
@@ -0,0 +1,88 @@
+from Project import db
+from Project.models import User, Event, Group, Participate, EventChange
+from Project.push import notify, notify_group
+from sqlalchemy import select, update, insert
+
+# Advance the sync cursor of every given feed in one statement.
+# The row lock taken here is held until commit, so the cursors of a feed
+# are handed out in the same order in which the transactions commit.
+def advance_cursors(model, key, ids):
+    if not ids:
+        return {}
+    rows = db.session.execute(
+        update(model)
+        .where(key.in_(ids))
+        .values(sync_cursor=model.sync_cursor + 1)
+        .returning(key, model.sync_cursor)
+        .execution_options(synchronize_session=False)
+    )
+    return {feed_id: cursor for feed_id, cursor in rows}
+
+# Log changes to the given events in the feeds of their group and of every user who sees them.
+# Call it before the events or participations are deleted from the database.
+# Users in removed_user_ids lose access to the events, their feeds get 'Deleted' entries,
+# as do the users of removed_events for the events they are mapped to.
+def record_event_changes(event_ids, operation='Updated', removed_user_ids=(), removed_events=None):
+    event_ids = set(event_ids)
+    if not event_ids:
+        return
+    db.session.flush()
+
+    events = db.session.execute(
+        select(Event.event_id, Event.group_id, Event.creator)
+        .where(Event.event_id.in_(event_ids))
+    ).all()
+    participants = db.session.execute(
+        select(Participate.event_id, Participate.user_id)
+        .where(Participate.event_id.in_(event_ids))
+    ).all()
+
+    group_changes = {}
+    user_changes = {}
+    for event in events:
+        if event.group_id == 1:
+            # Individual event, only seen by its creator
+            user_changes.setdefault(event.creator, {})[event.event_id] = operation
+        else:
+            group_changes.setdefault(event.group_id, set()).add(event.event_id)
+    for participant in participants:
+        user_changes.setdefault(participant.user_id, {})[participant.event_id] = operation
+    for user_id in removed_user_ids:
+        user_changes[user_id] = {event_id: 'Deleted' for event_id in event_ids}
+    for user_id, removed in (removed_events or {}).items():
+        user_changes.setdefault(user_id, {}).update((event_id, 'Deleted') for event_id in removed)
+
+    group_cursors = advance_cursors(Group, Group.group_id, sorted(group_changes))
+    user_cursors = advance_cursors(User, User.user_id, sorted(user_changes))
+
+    changes = []
+    for group_id, changed_events in group_changes.items():
+        for event_id in changed_events:
+            changes.append({
+                'group_id': group_id,
+                'cursor': group_cursors[group_id],
+                'event_id': event_id,
+                'operation': operation
+            })
+    for user_id, changed_events in user_changes.items():
+        if user_id not in user_cursors:
+            continue
+        for event_id, event_operation in changed_events.items():
+            changes.append({
+                'user_id': user_id,
+                'cursor': user_cursors[user_id],
+                'event_id': event_id,
+                'operation': event_operation
+            })
+    if changes:
+        db.session.execute(insert(EventChange), changes)
+
+    # Let the connected clients know, once the transaction commits
+    for group_id, changed_events in group_changes.items():
+        notify_group(group_id, [
+            {'type': 'event', 'group_id': group_id, 'event_id': event_id, 'operation': operation}
+            for event_id in changed_events
+        ])
+    for user_id, changed_events in user_changes.items():
+        for event_id, event_operation in changed_events.items():
+            notify(user_id, {'type': 'event', 'group_id': 1, 'event_id': event_id, 'operation': event_operation})
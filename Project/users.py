@@ -0,0 +1,42 @@
+from Project import app, db
+from Project.models import User
+from Project.cache import LRUCache, MISSING
+from sqlalchemy import select
+
+# User ids of the emails resolved by earlier requests. Emails without a user are not cached, as
+# a signup on another process would leave them unknown here until the TTL. The entries of a
+# changed email are only dropped by the TTL in the other processes.
+email_cache = LRUCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+
+def normalize_email(email):
+    return email.strip().lower()
+
+# Resolve emails to user ids with at most one query.
+# Returns a dict of normalized email to user_id and the set of emails without a user.
+def resolve_emails(emails):
+    user_ids = {}
+    unknown = set()
+    missing = []
+    for email in {normalize_email(email) for email in emails}:
+        user_id = email_cache.get(email)
+        if user_id is MISSING:
+            missing.append(email)
+        else:
+            user_ids[email] = user_id
+
+    if missing:
+        found = dict(db.session.execute(
+            select(User.email, User.user_id).where(User.email.in_(missing))
+        ).all())
+        for email in missing:
+            user_id = found.get(email)
+            if user_id is None:
+                unknown.add(email)
+            else:
+                email_cache.set(email, user_id)
+                user_ids[email] = user_id
+    return user_ids, unknown
+
+# Forget the cached resolution of emails whose user was created or changed
+def invalidate_emails(*emails):
+    email_cache.delete(*(normalize_email(email) for email in emails if email))
@@ -0,0 +1,183 @@
+from Project import queries
+from Project import recurrence
+from Project import payloads
+from Project import instrumentation
+from Project.cache import MISSING
+from Project.conditional import version_digest
+from Project.models import Event, Group
+from Project.serializers import participants_statement, encode_events, share_events, overlay_events, encode_payload, encode_list, wants_compact
+from sqlalchemy import select, func
+
+# Calendar data views, written once for the Flask app (Project/routes.py) and the async app (Project/asgi.py).
+# A view is a generator yielding the operations it needs to the app running it, which sends back their result:
+#   ('execute', statement)               buffered result of the statement
+#   ('get', model, key)                  the row of the model with this primary key, or None
+#   ('save', instance)                   adds the instance and commits, returns whether it succeeded
+#   ('membership', group_id)             Membership of the user in the group, or None (Project/permissions.py)
+#   ('conditional', validator, headers)  tags the response with the validator and headers (Project/conditional.py).
+#                                        When the client is up to date the app answers 304 and closes the view.
+# A view returns the (body, status) of the response, the body being a dict or encoded JSON.
+
+def fetch_participant_rows(events):
+    if not events:
+        return []
+    return (yield ('execute', participants_statement([event.event_id for event in events]))).all()
+
+def expand_recurring(rows, start, end, tz):
+    cached, missing = recurrence.cached_occurrences(rows, start, end, tz)
+    exceptions = (yield ('execute', recurrence.exceptions_statement(missing))).scalars().all() if missing else []
+    return recurrence.expand(rows, start, end, tz, cached, exceptions)
+
+# Events of the group, or of the user's dashboard for group 1
+def calendar_data(args, accept, user, group_id):
+    try:
+        start, end = queries.parse_window(args)
+    except ValueError:
+        return {'error': 'Invalid date range'}, 400
+    try:
+        tz = queries.parse_timezone(args)
+    except ValueError:
+        return {'error': 'Invalid timezone'}, 400
+
+    if group_id == 1:
+        # Group 1 holds the individual events, it is created on first use (to validate the foreign key)
+        if (yield ('get', Group, 1)) is None:
+            if not (yield ('save', Group(group_name='No Group', description='No Description'))):
+                return {'error': "Unable to add group 1 to the database"}, 500
+
+        # Read the sync cursor before the events, changes made meanwhile are sent again by /updates
+        cursor = user.sync_cursor
+        permission = 'Viewer'
+
+        # All the events created by the user, and those in which they participate
+        individual_events = queries.individual_events(user.user_id, start, end)
+        group_events = queries.participating_events(user.user_id, start, end)
+        versions = queries.event_versions(individual_events, group_events)
+        event_type = 'group'
+    else:
+        group = yield ('get', Group, group_id)
+        if group is None:
+            return {'error': 'Group not found'}, 404
+        mem = yield ('membership', group_id)
+        if mem is None:
+            return {'error': 'Access denied'}, 403
+        permission = mem.permission
+        cursor = group.sync_cursor
+
+        individual_events = None
+        group_events = queries.group_events(group_id, start, end)
+        versions = queries.event_versions(group_events)
+        event_type = None
+
+    compact = wants_compact(args, accept)
+
+    # The events only change along with their cache_number, and their participants along with their user
+    participants = queries.participant_versions(versions)
+    digest = (yield ('execute', select(func.concat_ws(':',
+        select(version_digest(versions.c.event_id, versions.c.cache_number, order_by=versions.c.event_id))
+        .scalar_subquery(),
+        select(version_digest(
+            participants.c.participate_id, participants.c.user_id, participants.c.status,
+            participants.c.name, participants.c.email, order_by=participants.c.participate_id
+        )).scalar_subquery()
+    )))).scalar()
+    # The format can be chosen with the Accept header
+    yield ('conditional', (user.user_id, permission, start, end, tz, compact, digest),
+           {'X-Sync-Cursor': str(cursor), 'Vary': 'Cookie, Accept'})
+
+    # The events of a group calendar are encoded without the fields of the user and shared by its members,
+    # the dashboard is the user's own
+    shared_key = payloads.group_payload_key(group_id, cursor, digest, start, end, tz, compact) if group_id != 1 else None
+    shared = payloads.payload_cache.get(shared_key) if shared_key is not None else MISSING
+    if shared is MISSING:
+        if tz is not None:
+            yield ('execute', queries.use_timezone(tz))
+        events = (yield ('execute', individual_events)).all() if individual_events is not None else []
+        participations = (yield ('execute', group_events)).all()
+        participant_rows = yield from fetch_participant_rows(participations)
+        events = yield from expand_recurring(events, start, end, tz)
+        participations = yield from expand_recurring(participations, start, end, tz)
+        with instrumentation.timed('serialize'):
+            shared = share_events(events, participations, participant_rows, event_type, compact)
+        if shared_key is not None:
+            payloads.payload_cache.set(shared_key, shared)
+
+    with instrumentation.timed('serialize'):
+        events_data, participants = overlay_events(shared, user.user_id, permission)
+        if compact:
+            events_data = encode_payload([('events', events_data)], participants)
+    return events_data, 200
+
+# Events of the group, or of the user's dashboard for group 1, changed since the given sync cursor
+def calendar_updates(args, accept, user, group_id):
+    since = args.get('since', type=int)
+    if since is None:
+        return {'error': 'Missing sync cursor'}, 400
+    try:
+        tz = queries.parse_timezone(args)
+    except ValueError:
+        return {'error': 'Invalid timezone'}, 400
+    # Window of the client cache, in which changed series are expanded
+    try:
+        start, end = queries.parse_window(args)
+    except ValueError:
+        return {'error': 'Invalid date range'}, 400
+    if tz is not None:
+        yield ('execute', queries.use_timezone(tz))
+
+    individual_events = []
+    group_events = []
+    if group_id == 1:
+        cursor = user.sync_cursor
+        if since > cursor:
+            # The client cursor is not from this feed, it has to reload the calendar
+            return {'resync': True, 'cursor': cursor}, 200
+
+        changed_events = (yield ('execute', queries.changed_events(since, user_id=user.user_id))).scalars().all()
+        if changed_events:
+            # Changed events created by the user, and those that currently have them as participant
+            individual_events = (yield ('execute',
+                queries.individual_events(user.user_id).where(Event.event_id.in_(changed_events))
+            )).all()
+            group_events = (yield ('execute',
+                queries.participating_events(user.user_id).where(Event.event_id.in_(changed_events))
+            )).all()
+        permission = 'Viewer'
+        event_type = 'group'
+    else:
+        group = yield ('get', Group, group_id)
+        if group is None:
+            return {'error': 'Group not found'}, 404
+        mem = yield ('membership', group_id)
+        if mem is None:
+            return {'error': 'Access denied'}, 403
+        permission = mem.permission
+
+        cursor = group.sync_cursor
+        if since > cursor:
+            return {'resync': True, 'cursor': cursor}, 200
+
+        changed_events = (yield ('execute', queries.changed_events(since, group_id=group_id))).scalars().all()
+        if changed_events:
+            group_events = (yield ('execute',
+                queries.group_events(group_id).where(Event.event_id.in_(changed_events))
+            )).all()
+        event_type = None
+
+    participant_rows = yield from fetch_participant_rows(group_events)
+    individual_events = yield from expand_recurring(individual_events, start, end, tz)
+    group_events = yield from expand_recurring(group_events, start, end, tz)
+
+    # Changed events that can no longer be seen, or without occurrences in the window, are deleted from the cache
+    current_events = {event.event_id for event in individual_events} | {event.event_id for event in group_events}
+    deleted_events = [event_id for event_id in changed_events if event_id not in current_events]
+    with instrumentation.timed('serialize'):
+        events_data, participants = encode_events(
+            individual_events, group_events, participant_rows, user.user_id, permission, event_type,
+            wants_compact(args, accept)
+        )
+        return encode_payload([
+            ('updated_events', events_data),
+            ('deleted_events', encode_list([b'%d' % event_id for event_id in deleted_events])),
+            ('cursor', b'%d' % cursor)
+        ], participants), 200
@@ -0,0 +1,128 @@
+# Synthetic calendar data for the benchmarks: users, groups with their members,
+# group events with a fan-out of participants, individual events, and change log entries.
+import random
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert, update
+
+from Project import db
+from Project.models import User, Event, Group, Participate, Member, EventChange
+from Project.migrations import run_migrations
+
+STATUSES = ['Accepted'] * 6 + ['Pending'] * 3 + ['Declined']
+READ_STATUSES = ['Read'] * 3 + ['Unread']
+
+# Drop and recreate every table of the models, then generate the data.
+# Returns a description of what was generated, used by the benchmarks to pick
+# the user, group and window of each request.
+def generate(users=500, groups=20, members_per_group=40, events_per_group=200,
+             fanout=8, individual_events=20, changes_per_group=50, seed=0):
+    rng = random.Random(seed)
+    members_per_group = min(members_per_group, users)
+    fanout = min(fanout, members_per_group)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    db.drop_all()
+    db.create_all()
+    run_migrations()
+
+    db.session.execute(insert(Group), [{'group_name': 'No Group', 'description': 'No Description'}])
+    user_ids = db.session.execute(
+        insert(User).returning(User.user_id, sort_by_parameter_order=True),
+        [{'name': f'user{i}', 'email': f'user{i}@bench.example', 'password': 'x'} for i in range(users)]
+    ).scalars().all()
+    group_ids = db.session.execute(
+        insert(Group).returning(Group.group_id, sort_by_parameter_order=True),
+        [{'group_name': f'group{i}', 'description': ''} for i in range(groups)]
+    ).scalars().all()
+
+    group_members = {}
+    members = []
+    for group_id in group_ids:
+        chosen = rng.sample(user_ids, members_per_group)
+        group_members[group_id] = chosen
+        for position, user_id in enumerate(chosen):
+            # The first member created the group
+            members.append({
+                'user_id': user_id,
+                'group_id': group_id,
+                'permission': 'Admin' if position == 0 else rng.choice(['Editor', 'Viewer']),
+                'status': 'Accepted' if position == 0 else rng.choice(STATUSES),
+                'read_status': 'Read' if position == 0 else rng.choice(READ_STATUSES)
+            })
+    db.session.execute(insert(Member), members)
+
+    def random_window():
+        begin = start + timedelta(days=rng.randrange(365), hours=rng.randrange(8, 18))
+        return begin, begin + timedelta(minutes=rng.choice([30, 60, 90, 120]))
+
+    events = []
+    for group_id in group_ids:
+        for i in range(events_per_group):
+            begin, end = random_window()
+            events.append({
+                'event_name': f'event{i}',
+                'description': 'Synthetic event',
+                'start_time': begin,
+                'end_time': end,
+                'cache_number': 0,
+                'creator': group_members[group_id][0],
+                'group_id': group_id
+            })
+    for user_id in user_ids:
+        for i in range(individual_events):
+            begin, end = random_window()
+            events.append({
+                'event_name': f'personal{i}',
+                'description': '',
+                'start_time': begin,
+                'end_time': end,
+                'cache_number': 0,
+                'creator': user_id,
+                'group_id': 1
+            })
+    event_ids = db.session.execute(
+        insert(Event).returning(Event.event_id, Event.group_id, sort_by_parameter_order=True),
+        events
+    ).all()
+
+    participations = []
+    group_events = {}
+    for event_id, group_id in event_ids:
+        if group_id == 1:
+            continue
+        group_events.setdefault(group_id, []).append(event_id)
+        for user_id in rng.sample(group_members[group_id], fanout):
+            participations.append({
+                'user_id': user_id,
+                'event_id': event_id,
+                'status': rng.choice(STATUSES),
+                'read_status': rng.choice(READ_STATUSES)
+            })
+    db.session.execute(insert(Participate), participations)
+
+    # The last events of every group were changed once each, so that /updates has a delta to return
+    changes = []
+    for group_id, ids in group_events.items():
+        for cursor, event_id in enumerate(ids[-changes_per_group:], start=1):
+            changes.append({'group_id': group_id, 'cursor': cursor, 'event_id': event_id, 'operation': 'Updated'})
+    if changes:
+        db.session.execute(insert(EventChange), changes)
+        db.session.execute(
+            update(Group)
+            .where(Group.group_id.in_(group_ids))
+            .values(sync_cursor=min(changes_per_group, events_per_group))
+        )
+    db.session.commit()
+
+    for table in ('user', 'group', 'member', 'event', 'participate', 'event_change'):
+        db.session.execute(db.text(f'ANALYZE "{table}"'))
+    db.session.commit()
+
+    return {
+        'user_ids': user_ids,
+        'group_ids': group_ids,
+        'group_members': group_members,
+        'changes_per_group': min(changes_per_group, events_per_group),
+        'start': start
+    }
@@ -0,0 +1,104 @@
+# Concurrent load on one endpoint of a running server, to compare the throughput per process
+# of the Flask app and of the async read API (Project/asgi.py) on the same data.
+#
+#   DATABASE_URL=... python -m benchmarks.routes --output /dev/null     # generate the data
+#   DATABASE_URL=... python -m uvicorn Project.asgi:application --port 8000
+#   python -m benchmarks.load --url http://127.0.0.1:8000/data/2 --user-id 1 --concurrency 50
+#
+# The Flask app under the same server, one process and its thread pool:
+#   DATABASE_URL=... python -m uvicorn Project:app --interface wsgi --port 8001
+import argparse
+import asyncio
+import json
+import sys
+import time
+from urllib.parse import urlsplit
+
+from Project import app
+
+def session_cookie(user_id):
+    serializer = app.session_interface.get_signing_serializer(app)
+    return f"{app.config['SESSION_COOKIE_NAME']}={serializer.dumps({'_user_id': str(user_id), '_fresh': True})}"
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+# One keep-alive connection sending requests one after the other
+async def worker(url, cookie, remaining, latencies, statuses):
+    parts = urlsplit(url)
+    target = parts.path + (f'?{parts.query}' if parts.query else '')
+    request = (
+        f'GET {target} HTTP/1.1\r\nHost: {parts.netloc}\r\nCookie: {cookie}\r\n'
+        f'Connection: keep-alive\r\n\r\n'
+    ).encode()
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    try:
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            started = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status_line = await reader.readline()
+            length = 0
+            chunked = False
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode().partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value)
+                elif name.lower() == 'transfer-encoding' and 'chunked' in value.lower():
+                    chunked = True
+            if chunked:
+                while True:
+                    size = int((await reader.readline()).strip(), 16)
+                    await reader.readexactly(size + 2)
+                    if size == 0:
+                        break
+            else:
+                await reader.readexactly(length)
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[int(status_line.split()[1])] = statuses.get(int(status_line.split()[1]), 0) + 1
+    finally:
+        writer.close()
+
+async def run(url, cookie, concurrency, requests):
+    latencies = []
+    statuses = {}
+    remaining = [requests]
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(url, cookie, remaining, latencies, statuses) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        'url': url,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'statuses': statuses,
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent GET load on one endpoint of a running server')
+    parser.add_argument('--url', required=True)
+    parser.add_argument('--user-id', type=int, required=True, help='User the requests are authenticated as')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.url, session_cookie(args.user_id), args.concurrency, args.requests))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,8 @@
 from Project import app,db
 from Project.models import *
+from Project.migrations import run_migrations
 
 with app.app_context():
-    db.create_all()
\ No newline at end of file
+    db.create_all()
+    for name in run_migrations():
+        print(f"Applied migration {name}")
@@ -0,0 +1,68 @@
+from datetime import timedelta
+import pytest
+
+from conftest import WINDOW_START
+
+# The updated series of a batch are written by one UPDATE ... FROM (VALUES ...), each operation
+# still getting its own result and the version it leaves the event at
+
+def group_events(app, group_id):
+    from Project.models import Event
+    with app.app_context():
+        events = Event.query.filter_by(group_id=group_id).order_by(Event.event_id).all()
+        return [(event.event_id, event.version_number) for event in events]
+
+def update(event_id, version, title):
+    start = WINDOW_START + timedelta(days=10, hours=event_id)
+    return {
+        'op': 'update', 'event_id': event_id, 'version': version, 'title': title, 'description': '',
+        'start': start.isoformat(), 'end': (start + timedelta(hours=1)).isoformat(),
+    }
+
+def test_batch_update_results(app, seed, client_for):
+    from Project.models import Event
+    user_ids, group_id = seed(n_events=4)
+    (first, first_version), (stale, stale_version), (invalid, invalid_version), (second, second_version) = group_events(app, group_id)
+
+    operations = [
+        update(first, first_version, 'first'),
+        update(stale, stale_version + 1, 'stale'),
+        dict(update(invalid, invalid_version, 'invalid'), start='garbage'),
+        update(99999, 1, 'missing'),
+        update(second, second_version, 'second'),
+    ]
+    response = client_for(user_ids[0]).post('/events/batch', json={'operations': operations})
+    assert response.status_code == 200
+    results = response.get_json()['results']
+
+    assert [result['status'] for result in results] == [200, 409, 400, 404, 200]
+    assert results[0] == {'status': 200, 'event_id': first, 'version': first_version + 1}
+    assert results[4] == {'status': 200, 'event_id': second, 'version': second_version + 1}
+
+    with app.app_context():
+        events = {event.event_id: event for event in Event.query.filter_by(group_id=group_id)}
+        assert (events[first].event_name, events[first].version_number) == ('first', first_version + 1)
+        assert (events[second].event_name, events[second].version_number) == ('second', second_version + 1)
+        assert events[first].start_time == WINDOW_START + timedelta(days=10, hours=first)
+        # The refused operations leave their events as they were
+        assert (events[stale].event_name, events[stale].version_number) == ('event1', stale_version)
+        assert (events[invalid].event_name, events[invalid].version_number) == ('event2', invalid_version)
+
+def update_statements(app, seed, client_for, statements, n_events):
+    user_ids, group_id = seed(n_events=n_events)
+    operations = [update(event_id, version, 'moved') for event_id, version in group_events(app, group_id)]
+    statements.clear()
+    response = client_for(user_ids[0]).post('/events/batch', json={'operations': operations})
+    assert response.status_code == 200
+    assert {result['status'] for result in response.get_json()['results']} == {200}
+    return list(statements)
+
+@pytest.fixture
+def batch_statements(app, seed, client_for, statements):
+    return lambda n_events: update_statements(app, seed, client_for, statements, n_events)
+
+def test_batch_update_statement_count_is_constant(batch_statements):
+    small = batch_statements(5)
+    large = batch_statements(50)
+    assert len(small) == len(large)
+    assert sum(statement.startswith('UPDATE event ') for statement in large) == 1
@@ -0,0 +1,82 @@
+from datetime import timedelta
+import pytest
+
+from conftest import WINDOW_START
+
+# The counters of pending invites and unread notifications are kept by the database triggers,
+# every route changing the invites must leave them equal to a count of the invites themselves
+
+def live_counts(app, user_ids):
+    from Project import db
+    from Project.counters import counts_statement
+    with app.app_context():
+        counts = {row.user_id: (row.pending_invites, row.unread_notifications) for row in db.session.execute(counts_statement(user_ids))}
+    return {user_id: counts.get(user_id, (0, 0)) for user_id in user_ids}
+
+def served_counts(client_for, user_ids):
+    counts = {}
+    for user_id in user_ids:
+        counters = client_for(user_id).get('/counts').get_json()
+        counts[user_id] = (counters['pending_invites'], counters['unread_notifications'])
+    return counts
+
+@pytest.fixture
+def check_counters(app, client_for):
+    def check_counters(user_ids):
+        assert served_counts(client_for, user_ids) == live_counts(app, user_ids)
+    return check_counters
+
+def new_event(group_id, emails):
+    start = WINDOW_START + timedelta(days=40)
+    return {
+        'title': 'new', 'description': '', 'group_id': group_id,
+        'start': start.isoformat(), 'end': (start + timedelta(hours=1)).isoformat(),
+        'participants': [{'name': email} for email in emails],
+    }
+
+def test_counters_follow_the_invites(app, seed, client_for, check_counters):
+    from Project.models import Participate
+    user_ids, group_id = seed(n_events=3)
+    admin = client_for(user_ids[0])
+    emails = [f'user{i}@example.com' for i in range(len(user_ids))]
+    check_counters(user_ids)
+
+    group = {'name': 'Other', 'description': '', 'members': emails[1:3], 'permissions': ['Viewer', 'Editor']}
+    assert admin.post('/create_group', json=group).status_code == 200
+    check_counters(user_ids)
+
+    assert admin.post('/add_event', json=new_event(group_id, emails[:3])).status_code == 200
+    check_counters(user_ids)
+
+    with app.app_context():
+        invite = Participate.query.filter_by(user_id=user_ids[1], status='Pending').first()
+        invite_id, event_id = invite.participate_id, invite.event_id
+    response = client_for(user_ids[1]).post('/check_invites', json={'invite_type': 'event', 'invite_id': invite_id, 'status': 'Accepted'})
+    assert response.status_code == 200
+    check_counters(user_ids)
+
+    assert client_for(user_ids[2]).post('/get_notifications', json={'type': 'event', 'id': event_id}).status_code == 200
+    check_counters(user_ids)
+
+    batch = {'operations': [{'op': 'create', **new_event(group_id, emails)}, {'op': 'delete', 'event_id': event_id}]}
+    assert admin.post('/events/batch', json=batch).status_code == 200
+    check_counters(user_ids)
+
+    assert client_for(user_ids[1]).delete(f'/exit_group/{group_id}').status_code == 200
+    check_counters(user_ids)
+
+    # The memberships, events and participations of the group go with it
+    assert admin.delete(f'/group_info/{group_id}').status_code == 200
+    check_counters(user_ids)
+
+def test_migration_recounts_the_counters(app, seed, client_for):
+    from Project import db
+    from Project.migrations import run_migrations
+    from sqlalchemy import text
+    user_ids, group_id = seed(n_events=3)
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(text('UPDATE user_counter SET pending_invites = 100, unread_notifications = 100'))
+            connection.execute(text("DELETE FROM schema_migration WHERE name = '0008_counter_triggers'"))
+        assert run_migrations() == ['0008_counter_triggers']
+    assert served_counts(client_for, user_ids) == live_counts(app, user_ids)
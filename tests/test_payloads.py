@@ -0,0 +1,68 @@
+import pytest
+
+from Project.cache import LRUCache, MISSING
+
+# The shared payload cache is swapped for an LRUCache recording its hits, which stands in for Redis in the tests
+
+class RecordingCache(LRUCache):
+    def __init__(self):
+        super().__init__(100, 300)
+        self.hits = 0
+
+    def get(self, key, default=MISSING):
+        value = super().get(key, default)
+        if value is not default:
+            self.hits += 1
+        return value
+
+@pytest.fixture
+def payload_cache(app, monkeypatch):
+    from Project import payloads
+    cache = RecordingCache()
+    monkeypatch.setattr(payloads, 'payload_cache', cache)
+    return cache
+
+def event_names(response):
+    return {event['title'] for event in response.get_json()}
+
+def participant_names(response):
+    return {participant['name'] for event in response.get_json() for participant in event['participants']}
+
+def test_group_calendar_is_shared(seed, client_for, payload_cache):
+    user_ids, group_id = seed(n_events=3)
+    first = client_for(user_ids[0]).get(f'/data/{group_id}')
+    assert payload_cache.hits == 0
+
+    # Another member gets the same events from the shared payload
+    second = client_for(user_ids[1]).get(f'/data/{group_id}')
+    assert payload_cache.hits == 1
+    assert event_names(second) == event_names(first)
+
+def test_edited_event_is_not_served_from_the_cache(app, seed, client_for, payload_cache):
+    from Project.models import Event
+    user_ids, group_id = seed(n_events=3)
+    client = client_for(user_ids[0])
+    client.get(f'/data/{group_id}')
+    with app.app_context():
+        event = Event.query.filter_by(group_id=group_id).first()
+        edit = {
+            'version': event.version_number, 'title': 'renamed event', 'description': '',
+            'start': event.start_time.isoformat(), 'end': event.end_time.isoformat(),
+            'added_participants': [], 'changed_participants': [], 'deleted_participants': [],
+        }
+    assert client.put(f'/update_event/{event.event_id}', json=edit).status_code == 200
+
+    response = client.get(f'/data/{group_id}')
+    assert payload_cache.hits == 0
+    assert 'renamed event' in event_names(response)
+
+def test_renamed_participant_is_not_served_from_the_cache(seed, client_for, payload_cache):
+    user_ids, group_id = seed(n_events=3)
+    client_for(user_ids[0]).get(f'/data/{group_id}')
+    profile = {'name': 'renamed user', 'email': 'user1@example.com', 'password': 'x'}
+    assert client_for(user_ids[1]).post('/user_profile', json=profile).status_code == 200
+
+    response = client_for(user_ids[0]).get(f'/data/{group_id}')
+    assert payload_cache.hits == 0
+    assert 'renamed user' in participant_names(response)
+    assert 'user1' not in participant_names(response)
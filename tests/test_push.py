@@ -0,0 +1,51 @@
+import queue
+import pytest
+
+from conftest import WINDOW_START
+
+# The broker is swapped for a LocalBroker, which stands in for Redis in the tests
+
+@pytest.fixture
+def broker(app, monkeypatch):
+    from Project import push
+    broker = push.LocalBroker()
+    monkeypatch.setattr(push, 'broker', broker)
+    return broker
+
+def received(subscription):
+    messages = []
+    while True:
+        try:
+            messages.append(subscription.get_nowait())
+        except queue.Empty:
+            return messages
+
+def new_event(group_id, emails):
+    return {
+        'title': 'new', 'description': '', 'group_id': group_id,
+        'start': WINDOW_START.replace(month=2).isoformat(),
+        'end': WINDOW_START.replace(month=2, hour=1).isoformat(),
+        'participants': [{'name': email} for email in emails],
+    }
+
+def test_committed_change_is_published(seed, client_for, broker):
+    user_ids, group_id = seed(n_users=3, n_events=2)
+    subscriptions = {user_id: broker.subscribe(user_id) for user_id in user_ids}
+
+    response = client_for(user_ids[0]).post('/add_event', json=new_event(group_id, ['user1@example.com']))
+    assert response.status_code == 200
+
+    # Every member sees the event in the group calendar, the participant also on their dashboard
+    for user_id in user_ids:
+        messages = received(subscriptions[user_id])
+        events = {message['group_id'] for message in messages if message['type'] == 'event'}
+        assert group_id in events
+        assert (1 in events) == (user_id == user_ids[1])
+
+def test_rolled_back_change_is_not_published(seed, client_for, broker):
+    user_ids, group_id = seed(n_users=3, n_events=2)
+    subscription = broker.subscribe(user_ids[0])
+
+    response = client_for(user_ids[0]).put('/update_event/1', json={'version': 99})
+    assert response.status_code == 409
+    assert received(subscription) == []
@@ -0,0 +1,74 @@
+from datetime import timedelta
+from sqlalchemy import text
+import pytest
+
+from conftest import WINDOW_START
+
+# The main query of each hot route is answered from an index. Sequential scans are disabled
+# so that the planner falls back to one only where no index can serve the query, the test
+# tables being too small for it to prefer an index otherwise.
+
+def hot_statements(user_id, group_id):
+    from Project import queries
+    from Project.permissions import memberships_statement
+    from Project.serializers import participants_statement
+    start, end = WINDOW_START, WINDOW_START + timedelta(days=30)
+    return {
+        'group calendar': queries.group_events(group_id, start, end),
+        'individual calendar': queries.individual_events(user_id, start, end),
+        'participating events': queries.participating_events(user_id, start, end),
+        'event participants': participants_statement([1, 2, 3]),
+        'group changes': queries.changed_events(0, group_id=group_id),
+        'user changes': queries.changed_events(0, user_id=user_id),
+        'notifications': queries.notifications(user_id),
+        'invites': queries.invites(user_id),
+        'memberships': memberships_statement(user_id),
+    }
+
+# Indexes each query is expected to be answered from. Where several indexes lead with the
+# filtered column, the planner may pick any of them.
+MEMBER_BY_USER = ('ix_member_user_status', 'uq_user_group')
+PARTICIPATE_BY_USER = ('ix_participate_user_status', 'ix_participate_user_read_status')
+
+EXPECTED_INDEXES = {
+    'group calendar': [('ix_event_group_window',)],
+    'individual calendar': [('ix_event_creator', 'ix_event_group_window')],
+    'participating events': [PARTICIPATE_BY_USER],
+    'event participants': [('ix_participate_event_status',)],
+    'group changes': [('ix_event_change_group_cursor',)],
+    'user changes': [('ix_event_change_user_cursor',)],
+    'notifications': [('ix_member_unread',), ('ix_participate_unread',)],
+    'invites': [('ix_member_pending',), ('ix_participate_pending',)],
+    'memberships': [MEMBER_BY_USER],
+}
+
+HOT_TABLES = ('event', 'participate', 'member', 'event_change')
+
+def query_plan(connection, statement):
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    return '\n'.join(row[0] for row in connection.exec_driver_sql(f'EXPLAIN {compiled}', compiled.params))
+
+@pytest.fixture
+def plans(app, seed):
+    from Project import db
+    user_ids, group_id = seed(n_events=50)
+    with app.app_context():
+        connection = db.session.connection()
+        # Changes in both feeds, so that each feed has its own index to choose
+        connection.execute(text(
+            'INSERT INTO event_change (group_id, user_id, cursor, event_id, operation, change_time) '
+            "SELECT CASE WHEN i % 2 = 0 THEN :group_id END, CASE WHEN i % 2 = 1 THEN :user_id END, i, i, 'Updated', now() "
+            'FROM generate_series(1, 100) i'
+        ), {'group_id': group_id, 'user_id': user_ids[0]})
+        connection.execute(text('ANALYZE'))
+        connection.execute(text('SET LOCAL enable_seqscan = off'))
+        yield {name: query_plan(connection, statement) for name, statement in hot_statements(user_ids[0], group_id).items()}
+        db.session.rollback()
+
+@pytest.mark.parametrize('name', list(EXPECTED_INDEXES))
+def test_hot_query_uses_an_index(plans, name):
+    plan = plans[name]
+    for indexes in EXPECTED_INDEXES[name]:
+        assert any(f' {index} ' in plan for index in indexes), plan
+    for table in HOT_TABLES:
+        assert f'Seq Scan on {table} ' not in plan, plan
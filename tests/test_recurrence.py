@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+import pytest
+
+from conftest import WINDOW_START
+
+# Series are expanded into their occurrences for the window of a request, on the wall clock of their timezone
+
+def utc(*fields):
+    return datetime(*fields, tzinfo=timezone.utc)
+
+@pytest.fixture
+def occurrences(app):
+    from Project.recurrence import Series, occurrences
+
+    def expand(rule, start, tz=None, exceptions=(), window=(None, None)):
+        series = Series('series', '', start, start + timedelta(hours=1), rule, tz)
+        return occurrences(series, exceptions, *window)
+
+    return expand
+
+def starts(occurrences):
+    return [occurrence[1] for occurrence in occurrences]
+
+def exception(original_start, cancelled=False, start_time=None, event_name=None):
+    from Project.models import EventException
+    return EventException(original_start=original_start, cancelled=cancelled, start_time=start_time,
+                          end_time=start_time and start_time + timedelta(hours=1), event_name=event_name)
+
+def test_occurrences_keep_their_wall_clock_time_across_dst(occurrences):
+    # 09:00 in Paris, which moves from UTC+1 to UTC+2 on 2026-03-29
+    found = occurrences('FREQ=DAILY;COUNT=3', utc(2026, 3, 28, 8), 'Europe/Paris')
+    assert starts(found) == [utc(2026, 3, 28, 8), utc(2026, 3, 29, 7), utc(2026, 3, 30, 7)]
+
+def test_count_is_counted_from_the_start_of_the_series(occurrences):
+    found = occurrences('FREQ=WEEKLY;COUNT=3', utc(2026, 1, 5, 9))
+    assert starts(found) == [utc(2026, 1, 5, 9), utc(2026, 1, 12, 9), utc(2026, 1, 19, 9)]
+    # A window after the first occurrences still ends the series at its third
+    found = occurrences('FREQ=WEEKLY;COUNT=3', utc(2026, 1, 5, 9), window=(utc(2026, 1, 15), utc(2026, 3, 1)))
+    assert starts(found) == [utc(2026, 1, 19, 9)]
+
+def test_until_date_includes_the_whole_day(occurrences):
+    found = occurrences('FREQ=DAILY;UNTIL=20260103', utc(2026, 1, 1, 22))
+    assert starts(found) == [utc(2026, 1, 1, 22), utc(2026, 1, 2, 22), utc(2026, 1, 3, 22)]
+
+def test_exceptions_cancel_and_move_occurrences(occurrences):
+    exceptions = [
+        exception(utc(2026, 1, 2, 9), cancelled=True),
+        exception(utc(2026, 1, 3, 9), start_time=utc(2026, 1, 3, 15), event_name='moved'),
+        # Moved into the window from outside of it
+        exception(utc(2026, 1, 10, 9), start_time=utc(2026, 1, 4, 18)),
+    ]
+    found = occurrences('FREQ=DAILY', utc(2026, 1, 1, 9), exceptions=exceptions, window=(utc(2026, 1, 1), utc(2026, 1, 5)))
+    assert [(original, start, name) for original, start, _, name, _ in found] == [
+        (utc(2026, 1, 1, 9), utc(2026, 1, 1, 9), 'series'),
+        (utc(2026, 1, 3, 9), utc(2026, 1, 3, 15), 'moved'),
+        (utc(2026, 1, 4, 9), utc(2026, 1, 4, 9), 'series'),
+        (utc(2026, 1, 10, 9), utc(2026, 1, 4, 18), 'series'),
+    ]
+
+def test_cancelled_occurrence_is_removed_from_the_calendar(seed, client_for):
+    user_ids, group_id = seed(n_events=1)
+    client = client_for(user_ids[0])
+    start = WINDOW_START + timedelta(days=40)
+    response = client.post('/add_event', json={
+        'title': 'daily', 'description': '', 'group_id': group_id, 'participants': [],
+        'start': start.isoformat(), 'end': (start + timedelta(hours=1)).isoformat(),
+        'recurrence': 'FREQ=DAILY;COUNT=5', 'recurrence_tz': 'UTC',
+    })
+    assert response.status_code == 200
+    window = f'?start={quote(start.isoformat())}&end={quote((start + timedelta(days=10)).isoformat())}'
+
+    def occurrences():
+        return [event for event in client.get(f'/data/{group_id}{window}').get_json() if event['title'] == 'daily']
+
+    before = [event['recurrence_id'] for event in occurrences()]
+    assert len(before) == 5
+    event_id = occurrences()[0]['event_id']
+
+    response = client.delete(f'/remove_event/{event_id}?recurrence_id={quote(before[1])}')
+    assert response.status_code == 200
+    assert [event['recurrence_id'] for event in occurrences()] == before[:1] + before[2:]
+
+    assert client.delete(f'/remove_event/{event_id}?recurrence_id=garbage').status_code == 400
+    assert client.delete(f'/remove_event/1?recurrence_id={quote(before[0])}').status_code == 400
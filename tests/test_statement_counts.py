@@ -0,0 +1,25 @@
+import pytest
+
+# Loading a calendar takes the same number of statements whatever the number of events it shows,
+# the events and their participants are each fetched in bulk
+
+WINDOW = '?start=2026-01-01T00:00:00Z&end=2026-03-01T00:00:00Z'
+
+def count_statements(seed, client_for, statements, path, n_events):
+    user_ids, group_id = seed(n_events=n_events)
+    client = client_for(user_ids[1])
+    statements.clear()
+    response = client.get(path.format(group_id=group_id) + WINDOW)
+    assert response.status_code == 200
+    assert len(response.get_json()) >= n_events
+    return len(statements)
+
+@pytest.fixture
+def statement_count(seed, client_for, statements):
+    return lambda path, n_events: count_statements(seed, client_for, statements, path, n_events)
+
+@pytest.mark.parametrize('path', ['/data/{group_id}', '/data/1'])
+def test_calendar_statement_count_is_constant(statement_count, path):
+    small = statement_count(path, 5)
+    large = statement_count(path, 200)
+    assert small == large
@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+from conftest import WINDOW_START
+
+# The clients keep the calendars they loaded up to date through /updates, from the X-Sync-Cursor
+# of the calendar. Group calendars share one feed, the dashboard (group 1) has a feed per user.
+
+def new_event(group_id, emails):
+    start = WINDOW_START + timedelta(days=40)
+    return {
+        'title': 'new', 'description': '', 'group_id': group_id,
+        'start': start.isoformat(), 'end': (start + timedelta(hours=1)).isoformat(),
+        'participants': [{'name': email} for email in emails],
+    }
+
+def cursor(client, group_id):
+    response = client.get(f'/data/{group_id}')
+    assert response.status_code == 200
+    return int(response.headers['X-Sync-Cursor'])
+
+def updates(client, group_id, since):
+    response = client.get(f'/data/{group_id}/updates?since={since}')
+    assert response.status_code == 200
+    return response.get_json()
+
+def updated_ids(feed):
+    return {event['event_id'] for event in feed['updated_events']}
+
+def test_group_feed_advances_with_the_changes(seed, client_for):
+    user_ids, group_id = seed(n_events=3)
+    client = client_for(user_ids[0])
+    since = cursor(client, group_id)
+
+    response = client.post('/add_event', json=new_event(group_id, []))
+    assert response.status_code == 200
+    feed = updates(client, group_id, since)
+    assert [event['title'] for event in feed['updated_events']] == ['new']
+    assert feed['deleted_events'] == []
+    assert feed['cursor'] > since
+    assert feed['cursor'] == cursor(client, group_id)
+
+    # Nothing changed after the new cursor
+    assert updates(client, group_id, feed['cursor']) == {'updated_events': [], 'deleted_events': [], 'cursor': feed['cursor']}
+
+def test_deleted_events_are_listed(seed, client_for):
+    user_ids, group_id = seed(n_events=3)
+    creator, participant = client_for(user_ids[0]), client_for(user_ids[1])
+    assert creator.post('/add_event', json=new_event(group_id, ['user1@example.com'])).status_code == 200
+    event_id, = updated_ids(updates(participant, 1, 0))
+    group_since, dashboard_since = cursor(creator, group_id), cursor(participant, 1)
+
+    assert creator.delete(f'/remove_event/{event_id}').status_code == 200
+    assert updates(creator, group_id, group_since)['deleted_events'] == [event_id]
+    assert updates(participant, 1, dashboard_since)['deleted_events'] == [event_id]
+
+def test_dashboard_feeds_are_per_user(seed, client_for):
+    user_ids, group_id = seed(n_events=3)
+    creator, participant, other = (client_for(user_id) for user_id in user_ids[:3])
+    participant_since, other_since = cursor(participant, 1), cursor(other, 1)
+
+    assert creator.post('/add_event', json=new_event(group_id, ['user1@example.com'])).status_code == 200
+    feed = updates(participant, 1, participant_since)
+    assert [event['title'] for event in feed['updated_events']] == ['new']
+    assert feed['cursor'] > participant_since
+
+    # The event is not on the dashboard of the other members, their feed did not move
+    assert cursor(other, 1) == other_since
+    assert updates(other, 1, other_since)['updated_events'] == []
+
+def test_cursor_of_another_feed_asks_for_a_reload(seed, client_for):
+    user_ids, group_id = seed(n_events=3)
+    client = client_for(user_ids[0])
+    since = cursor(client, 1) + 1
+    assert updates(client, 1, since) == {'resync': True, 'cursor': since - 1}